@@ -0,0 +1,556 @@
+import os
+import csv
+import json
+import time
+import shutil
+import argparse
+import resource
+import itertools
+import subprocess
+import multiprocessing
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+import faiss
+from llama_index.core import Settings, MockEmbedding
+from llama_index.core.llms import CustomLLM, CompletionResponse, CompletionResponseGen, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.utils import get_tokenizer
+from llama_index.core.vector_stores.types import VectorStoreQuery
+from utils import (ChunkerStrategy, Faiss, data_loader, Retriever, fusion_retriever, QueryEngine, Reranker,
+                   ContextCompressor)
+from utils.registry import get_registry
+from utils.vector_store import ExactVectorFile, FaissIDMapVectorStore, build_faiss_index
+
+STORAGE_TYPES = ['flat', 'fp16', 'sq8', 'binary']
+
+DEFAULT_GRID = {
+    "data": "./documents",
+    "queries": "./queries.jsonl",
+    "embed_model": "BAAI/bge-small-en-v1.5",
+    "dimension": 384,
+    "top_k": 5,
+    "chunkers": [{"strategy": "sentence", "chunk_size": 512, "chunk_overlap": 50}],
+    "retrievers": [["vector"], ["BM25"], ["vector", "BM25"]],
+    "weights": [[0.5, 0.5], [0.7, 0.3]],
+    "rerankers": [None, {"strategy": "custom", "model_name": "cross-encoder/ms-marco-MiniLM-L-2-v2", "top_n": 3}],
+    "compressors": [None, {"token_budget": 512}],
+    "modes": ["none"],
+    "concurrency": [1, 8],
+    "workers": 4,
+    "llm": {"num_output": 64, "first_token_latency": 0.2, "token_latency": 0.01, "prompt_token_latency": 0.0002}
+}
+
+
+class StandInLLM(CustomLLM):
+    """
+    A local LLM that answers with placeholder tokens at a fixed pace.
+
+    It makes LLM cost part of the latency and throughput figures without a model server;
+    prompt processing costs `prompt_token_latency` per prompt token before the first token.
+    """
+
+    num_output: int = 64
+    first_token_latency: float = 0.2
+    token_latency: float = 0.01
+    prompt_token_latency: float = 0.0
+
+    def _prefill(self, prompt: str) -> float:
+        if not self.prompt_token_latency:
+            return 0.0
+        return self.prompt_token_latency * len(get_tokenizer()(prompt))
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(num_output=self.num_output, model_name="stand-in")
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        time.sleep(self._prefill(prompt) + self.first_token_latency + self.token_latency * (self.num_output - 1))
+        return CompletionResponse(text=" ".join(["token"] * self.num_output))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        text = ""
+        time.sleep(self._prefill(prompt) + self.first_token_latency)
+        for i in range(self.num_output):
+            if i:
+                time.sleep(self.token_latency)
+            text += "token "
+            yield CompletionResponse(text=text, delta="token ")
+
+
+def percentiles(samples: Sequence[float], prefix: str) -> Dict[str, float]:
+    """
+    Summarize latency samples as p50/p95/p99 in milliseconds.
+
+    Args:
+        samples (Sequence[float]): The latencies in seconds.
+        prefix (str): The stage name used as column prefix.
+
+    Returns:
+        Dict[str, float]: The percentile columns.
+    """
+    values = np.percentile(np.asarray(samples, dtype="float64") * 1000, [50, 95, 99]) if samples else [np.nan] * 3
+    return {f"{prefix}_p{p}_ms": round(float(v), 3) for p, v in zip((50, 95, 99), values)}
+
+
+def recall(nodes: List[NodeWithScore], relevant: List[str]) -> Optional[float]:
+    """
+    The fraction of relevant items found in the nodes.
+
+    A relevant item is found if it is the file name of a node or a substring of its text.
+
+    Args:
+        nodes (List[NodeWithScore]): The retrieved nodes.
+        relevant (List[str]): The labeled relevant file names or passages.
+
+    Returns:
+        Optional[float]: The recall, or None if the query has no labels.
+    """
+    if not relevant:
+        return None
+    found = sum(any(item == node.node.metadata.get("file_name") or item in node.node.get_content()
+                    for node in nodes) for item in relevant)
+    return found / len(relevant)
+
+
+def peak_rss_mb() -> float:
+    """
+    The peak resident set size of this process so far, in MiB.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_queries(path: str) -> List[Dict[str, Any]]:
+    """
+    Load the labeled query set: one JSON object per line with "query" and optional "relevant".
+
+    Args:
+        path (str): The JSONL file.
+
+    Returns:
+        List[Dict[str, Any]]: The queries.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def context_tokens(nodes: List[NodeWithScore]) -> int:
+    """
+    The number of tokens the nodes put into the synthesis prompt.
+    """
+    tokenizer = get_tokenizer()
+    return sum(len(tokenizer(node.node.get_content(metadata_mode=MetadataMode.LLM))) for node in nodes)
+
+
+def build_retriever(methods: List[str], weights: Optional[List[float]], index: Any, docstore: Any,
+                    persist_dir: str, top_k: int) -> Any:
+    """
+    Build a single retriever or a fusion of several.
+    """
+    retrievers = []
+    for method in methods:
+        if method == 'vector':
+            retrievers.append(Retriever(vector=index, method='vector').parser(similarity_top_k=top_k))
+        elif method == 'BM25':
+            retrievers.append(Retriever(vector=index, method='BM25').parser(
+                docstore=docstore, persist_dir=persist_dir, similarity_top_k=top_k))
+        else:
+            retrievers.append(Retriever(vector=index, method=method).parser(
+                top_k=top_k, storage_context=index.storage_context))
+    if len(retrievers) == 1:
+        return retrievers[0]
+    return fusion_retriever(top_k=top_k, retrievers=retrievers, weights=weights)
+
+
+def run_config(query_engine: QueryEngine, queries: List[Dict[str, Any]],
+               concurrency: List[int]) -> Dict[str, Any]:
+    """
+    Measure one pipeline: per-stage latency, recall, context size and throughput under concurrency.
+
+    Args:
+        query_engine (QueryEngine): The pipeline.
+        queries (List[Dict[str, Any]]): The labeled queries.
+        concurrency (List[int]): The numbers of concurrent clients to measure QPS at.
+
+    Returns:
+        Dict[str, Any]: The result columns.
+    """
+    stages: Dict[str, List[float]] = {"retrieve": [], "rerank": [], "compress": [], "synthesize": [],
+                                      "end_to_end": []}
+    recalls, reranked_recalls = [], []
+    tokens, tokens_saved = [], []
+    for item in queries:
+        bundle = QueryBundle(item["query"])
+        start = time.perf_counter()
+        nodes = query_engine.retriever.retrieve(bundle)
+        stages["retrieve"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        reranked = (query_engine.node_processor.postprocess_nodes(list(nodes), query_bundle=bundle)
+                    if query_engine.node_processor is not None else nodes)
+        stages["rerank"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        compressed = (query_engine.compressor.postprocess_nodes(list(reranked), query_bundle=bundle)
+                      if query_engine.compressor is not None else reranked)
+        stages["compress"].append(time.perf_counter() - start)
+        tokens.append(context_tokens(compressed))
+        tokens_saved.append(context_tokens(reranked) - tokens[-1])
+
+        start = time.perf_counter()
+        query_engine.query_engine.synthesize(bundle, compressed)
+        stages["synthesize"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        query_engine.query(item["query"])
+        stages["end_to_end"].append(time.perf_counter() - start)
+
+        recalls.append(recall(nodes, item.get("relevant")))
+        reranked_recalls.append(recall(reranked, item.get("relevant")))
+
+    row: Dict[str, Any] = {}
+    for stage, samples in stages.items():
+        row.update(percentiles(samples, stage))
+    labeled = [r for r in recalls if r is not None]
+    row["recall_at_k"] = round(float(np.mean(labeled)), 4) if labeled else None
+    labeled = [r for r in reranked_recalls if r is not None]
+    row["recall_at_k_reranked"] = round(float(np.mean(labeled)), 4) if labeled else None
+    row["context_tokens"] = round(float(np.mean(tokens)), 1) if tokens else None
+    row["context_tokens_saved"] = round(float(np.mean(tokens_saved)), 1) if tokens_saved else None
+
+    for clients in concurrency:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            list(executor.map(query_engine.query, [item["query"] for item in queries]))
+        row[f"qps_c{clients}"] = round(len(queries) / (time.perf_counter() - start), 3)
+    return row
+
+
+def benchmark(grid: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Run every configuration of the grid.
+
+    Args:
+        grid (Dict[str, Any]): The grid; see DEFAULT_GRID for the keys.
+
+    Returns:
+        List[Dict[str, Any]]: One result row per configuration.
+    """
+    grid = {**DEFAULT_GRID, **grid}
+    if grid.get("mock_embedding"):
+        Settings.embed_model = MockEmbedding(embed_dim=grid["dimension"])
+    else:
+        Settings.embed_model = get_registry().get('embedding', grid["embed_model"])
+    llm = StandInLLM(**grid["llm"])
+    Settings.llm = llm
+    queries = load_queries(grid["queries"])
+    top_k = grid["top_k"]
+
+    rows = []
+    for chunker_config in grid["chunkers"]:
+        chunker_kwargs = dict(chunker_config)
+        chunker = ChunkerStrategy(strategy=chunker_kwargs.pop("strategy")).parser(**chunker_kwargs)
+        work_dir = tempfile.mkdtemp(prefix="benchmark-")
+        persist_dir = os.path.join(work_dir, "storage")
+        try:
+            start = time.perf_counter()
+            index, docstore = Faiss(documents=data_loader(grid["data"]), dimension=grid["dimension"],
+                                    transformation=[chunker], persist_dir=persist_dir, bm25=True)
+            build_seconds = time.perf_counter() - start
+
+            for methods, weights, reranker_config, compressor_config, mode in itertools.product(
+                    grid["retrievers"], grid["weights"], grid["rerankers"], grid["compressors"], grid["modes"]):
+                if len(methods) > 1 and len(weights) != len(methods):
+                    continue
+                if len(methods) == 1 and weights != grid["weights"][0]:
+                    continue
+                reranker = None
+                if reranker_config is not None:
+                    reranker_kwargs = dict(reranker_config)
+                    reranker = Reranker(strategy=reranker_kwargs.pop("strategy")).parser(**reranker_kwargs)
+                compressor = ContextCompressor(**compressor_config) if compressor_config is not None else None
+                retriever = build_retriever(methods, weights, index, docstore, persist_dir, top_k)
+                query_engine = QueryEngine(retriever=retriever, transform_mode=mode, llm=llm, node_processor=reranker,
+                                           compressor=compressor)
+
+                row = {
+                    "chunker": json.dumps(chunker_config, sort_keys=True),
+                    "retrievers": "+".join(methods),
+                    "weights": json.dumps(weights) if len(methods) > 1 else "",
+                    "reranker": json.dumps(reranker_config, sort_keys=True) if reranker_config else "",
+                    "compressor": json.dumps(compressor_config, sort_keys=True) if compressor_config else "",
+                    "mode": mode,
+                    "num_nodes": len(docstore.docs),
+                    "build_seconds": round(build_seconds, 3)
+                }
+                row.update(run_config(query_engine, queries, grid["concurrency"]))
+                row["peak_rss_mb"] = round(peak_rss_mb(), 1)
+                if compressor_config is not None:
+                    baseline = next((r for r in rows if r["compressor"] == "" and all(
+                        r[key] == row[key] for key in ("chunker", "retrievers", "weights", "reranker", "mode"))), None)
+                    if baseline is not None:
+                        row["end_to_end_p50_delta_ms"] = round(
+                            row["end_to_end_p50_ms"] - baseline["end_to_end_p50_ms"], 3)
+                rows.append(row)
+                print(json.dumps(row))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return rows
+
+
+def storage_report(grid: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Compare the memory and recall of the compact index types against 'flat'.
+
+    The corpus of the first chunker configuration is embedded once. Every index type
+    is then built over the same vectors and queried with the labeled queries. Recall
+    at k is measured against the exact 'flat' top k, both on the compact codes alone
+    and after exact rescoring from the memory-mapped float32 file.
+
+    Args:
+        grid (Dict[str, Any]): The grid; see DEFAULT_GRID for the keys.
+
+    Returns:
+        List[Dict[str, Any]]: One result row per index type.
+    """
+    grid = {**DEFAULT_GRID, **grid}
+    if grid.get("mock_embedding"):
+        Settings.embed_model = MockEmbedding(embed_dim=grid["dimension"])
+    else:
+        Settings.embed_model = get_registry().get('embedding', grid["embed_model"])
+    top_k = grid["top_k"]
+    chunker_kwargs = dict(grid["chunkers"][0])
+    chunker = ChunkerStrategy(strategy=chunker_kwargs.pop("strategy")).parser(**chunker_kwargs)
+    work_dir = tempfile.mkdtemp(prefix="benchmark-")
+    try:
+        index, _ = Faiss(documents=data_loader(grid["data"]), dimension=grid["dimension"],
+                         transformation=[chunker], persist_dir=os.path.join(work_dir, "storage"))
+        flat = index.vector_store.client
+        ids = faiss.vector_to_array(flat.id_map)
+        vectors = flat.index.reconstruct_n(0, flat.ntotal)
+        queries = [VectorStoreQuery(query_embedding=Settings.embed_model.get_query_embedding(item["query"]),
+                                    similarity_top_k=top_k) for item in load_queries(grid["queries"])]
+        truth = [set(result.ids) for result in index.vector_store.query_batch(queries, rescore_factor=0)]
+
+        rows = []
+        for index_type in STORAGE_TYPES:
+            faiss_index = build_faiss_index(grid["dimension"], index_type, embeddings=vectors)
+            exact = ExactVectorFile(os.path.join(work_dir, index_type, "vectors.f32"), grid["dimension"])
+            store = FaissIDMapVectorStore(faiss_index=faiss_index, exact=exact,
+                                          rescore_factor=grid.get("rescore_factor", 4))
+            faiss_index.add_with_ids(vectors, ids)
+            exact.add(ids, vectors)
+            index_bytes = len(faiss.serialize_index(faiss_index)) / len(ids)
+            row: Dict[str, Any] = {
+                "index_type": index_type,
+                "num_vectors": len(ids),
+                "index_mb_per_million": round(index_bytes * 1e6 / 2 ** 20, 1),
+                "rescore_file_mb_per_million": round(grid["dimension"] * 4 * 1e6 / 2 ** 20, 1)
+            }
+            for label, factor in (("", 0), ("_rescored", store.rescore_factor)):
+                latencies, recalls = [], []
+                for query, relevant in zip(queries, truth):
+                    start = time.perf_counter()
+                    result = store.query_batch([query], rescore_factor=factor)[0]
+                    latencies.append(time.perf_counter() - start)
+                    recalls.append(len(relevant & set(result.ids)) / max(len(relevant), 1))
+                row[f"recall_at_k{label}"] = round(float(np.mean(recalls)), 4) if recalls else None
+                row.update(percentiles(latencies, f"search{label}"))
+            rows.append(row)
+            print(json.dumps(row))
+        return rows
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+STARTUP_SCENARIOS = ("separate", "registry", "workers-spawn", "workers-fork")
+
+_STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import utils
+imported = time.perf_counter() - start
+import benchmark, json, sys
+print(json.dumps(benchmark.startup_child(imported, *json.loads(sys.argv[1]))))
+"""
+
+
+def pss_mb(pid: int) -> Optional[float]:
+    """
+    The proportional set size of a process in MiB; each shared page is split between its users.
+
+    Args:
+        pid (int): The process id.
+
+    Returns:
+        Optional[float]: The PSS, or None where /proc/<pid>/smaps_rollup is unavailable.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def load_pipeline_models(shared: bool, embed_model: str, reranker_model: str) -> List[Any]:
+    """
+    Build the model-backed components of a pipeline: the embedder, a semantic chunker and a reranker.
+
+    Args:
+        shared (bool): Take the models from the ModelRegistry, or let each component load its own.
+        embed_model (str): The embedding model.
+        reranker_model (str): The cross-encoder model.
+
+    Returns:
+        List[Any]: The components; keep them to keep their models loaded.
+    """
+    if shared:
+        Settings.embed_model = get_registry().get('embedding', embed_model)
+        return [Settings.embed_model,
+                ChunkerStrategy(strategy='semantic').parser(buffer_size=1, threshold=95, model_name=embed_model),
+                Reranker(strategy='custom').parser(model_name=reranker_model, top_n=3)]
+    from llama_index.core.postprocessor import SentenceTransformerRerank
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    Settings.embed_model = HuggingFaceEmbedding(model_name=embed_model)
+    return [Settings.embed_model,
+            ChunkerStrategy(strategy='semantic').parser(buffer_size=1, threshold=95,
+                                                        embed_model=HuggingFaceEmbedding(model_name=embed_model)),
+            SentenceTransformerRerank(model=reranker_model, top_n=3)]
+
+
+def _startup_worker(rank: int, ready: Any, done: Any, embed_model: str, reranker_model: str) -> None:
+    components = load_pipeline_models(True, embed_model, reranker_model)
+    ready.put(os.getpid())
+    done.wait()
+
+
+def startup_child(import_seconds: float, scenario: str, embed_model: str, reranker_model: str,
+                  num_workers: int) -> Dict[str, Any]:
+    """
+    Run one startup scenario in this (fresh) process; see `startup_report`.
+
+    Args:
+        import_seconds (float): The seconds `import utils` took in this process.
+        scenario (str): One of STARTUP_SCENARIOS.
+        embed_model (str): The embedding model.
+        reranker_model (str): The cross-encoder model.
+        num_workers (int): The number of workers of the 'workers-*' scenarios.
+
+    Returns:
+        Dict[str, Any]: The result row.
+    """
+    start = time.perf_counter()
+    row: Dict[str, Any] = {"scenario": scenario, "import_seconds": round(import_seconds, 3)}
+    if not scenario.startswith("workers"):
+        components = load_pipeline_models(scenario == "registry", embed_model, reranker_model)
+        row["load_seconds"] = round(time.perf_counter() - start, 3)
+        row["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        size = pss_mb(os.getpid())
+        row["total_pss_mb"] = round(size, 1) if size is not None else None
+        return row
+
+    context = multiprocessing.get_context("fork" if scenario == "workers-fork" else "spawn")
+    ready, done = context.Queue(), context.Event()
+    args = (ready, done, embed_model, reranker_model)
+    if scenario == "workers-fork":
+        components = load_pipeline_models(True, embed_model, reranker_model)
+        processes = get_registry().fork_workers(_startup_worker, num_workers, args)
+    else:
+        processes = [context.Process(target=_startup_worker, args=(rank, *args)) for rank in range(num_workers)]
+        for process in processes:
+            process.start()
+    try:
+        pids = [ready.get() for _ in range(num_workers)]
+        row["workers"] = num_workers
+        row["load_seconds"] = round(time.perf_counter() - start, 3)
+        sizes = [pss_mb(pid) for pid in [os.getpid(), *pids]]
+        row["total_pss_mb"] = round(sum(sizes), 1) if None not in sizes else None
+    finally:
+        done.set()
+        for process in processes:
+            process.join()
+    return row
+
+
+def startup_report(grid: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Measure the cold start of a pipeline's models with and without the ModelRegistry.
+
+    Every scenario runs in a fresh interpreter. 'separate' lets the embedder, the semantic
+    chunker and the reranker each load their own model; 'registry' shares them. The
+    'workers-*' scenarios start `workers` processes that each need the models: spawned
+    workers load their own, forked workers inherit the models preloaded by the parent.
+    Memory is the peak RSS of the process and the PSS summed over the parent and its
+    workers, so pages shared copy-on-write are counted once.
+
+    Args:
+        grid (Dict[str, Any]): The grid; see DEFAULT_GRID for the keys. The reranker model is
+            that of the first 'custom' reranker.
+
+    Returns:
+        List[Dict[str, Any]]: One result row per scenario.
+    """
+    grid = {**DEFAULT_GRID, **grid}
+    reranker_model = next((reranker["model_name"] for reranker in grid["rerankers"]
+                           if reranker and reranker.get("strategy") == "custom"),
+                          "cross-encoder/ms-marco-MiniLM-L-2-v2")
+    rows = []
+    for scenario in STARTUP_SCENARIOS:
+        if scenario == "workers-fork" and "fork" not in multiprocessing.get_all_start_methods():
+            continue
+        start = time.perf_counter()
+        arguments = [scenario, grid["embed_model"], reranker_model, grid["workers"]]
+        result = subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT, json.dumps(arguments)],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stdout=subprocess.PIPE, text=True, check=True)
+        row = json.loads(result.stdout.strip().splitlines()[-1])
+        row["process_seconds"] = round(time.perf_counter() - start, 3)
+        rows.append(row)
+        print(json.dumps(row))
+    return rows
+
+
+def write_results(rows: List[Dict[str, Any]], output: str) -> None:
+    """
+    Write the result rows to `<output>.json` and `<output>.csv`.
+
+    Args:
+        rows (List[Dict[str, Any]]): The result rows.
+        output (str): The output path without extension.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(f"{output}.json", "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2)
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    with open(f"{output}.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark RAG strategy configurations.")
+    parser.add_argument("--grid", help="A JSON file overriding keys of the default grid.")
+    parser.add_argument("--output", default="./benchmark_results/results", help="Output path without extension.")
+    parser.add_argument("--storage", action="store_true",
+                        help="Compare memory and recall of the compact index types instead.")
+    parser.add_argument("--startup", action="store_true",
+                        help="Measure model cold start and worker memory with and without the registry instead.")
+    args = parser.parse_args()
+
+    grid = {}
+    if args.grid:
+        with open(args.grid, "r", encoding="utf-8") as f:
+            grid = json.load(f)
+    if args.startup:
+        write_results(startup_report(grid), args.output)
+    else:
+        write_results(storage_report(grid) if args.storage else benchmark(grid), args.output)
@@ -1,21 +1,75 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 from ragas.testset.generator import TestsetGenerator
 from ragas.testset.evolutions import simple, reasoning, multi_context
 
-def testset_generator(documents, generator: str, critic: str, embed_model: str, **kwargs):
+def testset_generator(documents, generator: str, critic: str, embed_model: str, test_size: int = 5, **kwargs):
     generator = TestsetGenerator.from_llama_index(
         generator_llm=generator,
         critic_llm=critic,
         embeddings=embed_model
     )
     
-    simple, reasoning, multi_context = kwargs.get('test_set_parameters')
+    simple_ratio, reasoning_ratio, multi_context_ratio = kwargs.get('test_set_parameters', (0.5, 0.25, 0.25))
     
     testset = generator.generate_with_llamaindex_docs(
         documents,
-        test_size=5,
-        distributions={simple: simple, reasoning: reasoning, multi_context: multi_context},
+        test_size=test_size,
+        distributions={simple: simple_ratio, reasoning: reasoning_ratio, multi_context: multi_context_ratio},
         )
     
     ds = testset.to_dataset()
     ds_dict = ds.to_dict()
-    return ds_dict
\ No newline at end of file
+    return ds_dict
+
+
+def parallel_testset_generator(documents, generator: str, critic: str, embed_model: str, test_size: int,
+                               num_shards: int = 8, checkpoint_dir: Optional[str] = None,
+                               **kwargs: Any) -> Dict[str, List[Any]]:
+    """
+    Generate a large test set as independent shards running concurrently.
+
+    The documents are dealt round-robin into `num_shards` shards, each shard generates
+    its share of `test_size` with its own generator, and finished shards are written to
+    `checkpoint_dir/shard-<i>.json` so a rerun only generates the missing ones.
+
+    Args:
+        documents: The LlamaIndex documents.
+        generator: The generator LLM.
+        critic: The critic LLM.
+        embed_model: The embedding model.
+        test_size (int): The total number of questions.
+        num_shards (int): The number of shards generated concurrently.
+        checkpoint_dir (Optional[str]): The directory of the shard checkpoints.
+        **kwargs: Arbitrary keyword arguments for testset_generator, e.g. test_set_parameters.
+
+    Returns:
+        Dict[str, List[Any]]: The merged test set, column name to values.
+    """
+    num_shards = max(1, min(num_shards, len(documents), test_size))
+    shards = [documents[i::num_shards] for i in range(num_shards)]
+    sizes = [test_size // num_shards + (i < test_size % num_shards) for i in range(num_shards)]
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def generate(i: int) -> Dict[str, List[Any]]:
+        path = os.path.join(checkpoint_dir, f"shard-{i}.json") if checkpoint_dir is not None else None
+        if path is not None and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        ds_dict = testset_generator(shards[i], generator, critic, embed_model, test_size=sizes[i], **kwargs)
+        if path is not None:
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(ds_dict, f, default=str)
+            os.replace(f"{path}.tmp", path)
+        return ds_dict
+
+    with ThreadPoolExecutor(max_workers=num_shards) as executor:
+        results = list(executor.map(generate, range(num_shards)))
+    merged: Dict[str, List[Any]] = {}
+    for ds_dict in results:
+        for column, values in ds_dict.items():
+            merged.setdefault(column, []).extend(values)
+    return merged
@@ -1,12 +1,6 @@
 from typing import Any
-from utils import ChunkerStrategy, Faiss, data_loader, Retriever, fusion_retriever, QueryEngine, Reranker
+from utils import ChunkerStrategy, Faiss, data_loader, Retriever, fusion_retriever, QueryEngine, Reranker, CachedEmbedding, get_registry
 from llama_index.core import Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-
-from llama_index.llms.huggingface import HuggingFaceLLM
-from llama_index.llms.openai import OpenAI
-from llama_index.llms.gemini import Gemini
-from llama_index.llms.ollama import Ollama
 from dotenv import load_dotenv
 import os
 
@@ -17,28 +11,31 @@ def get_llm(model:str, **kwargs) -> Any:
     if model == "gemini":
         try:
             GOOGLE_API_KEY = os.environ["GOOGLE_API_KEY"]
-            llm = Gemini(model=model_name)
+            llm = get_registry().get('llm', model_name, provider='gemini')
         except KeyError:
             print("GOOGLE_API_KEY does not exist.")
     elif model == "openai":
         try:
             OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
-            llm = OpenAI(model=model_name)
+            llm = get_registry().get('llm', model_name, provider='openai')
         except KeyError:
             print("OPENAI_API_KEY doesn't exist")
     elif model == "open-source":
         try: 
             HF_TOKEN = os.environ["HUGGING_FACE_TOKEN"]
-            llm = HuggingFaceLLM(model_name=model_name)
+            llm = get_registry().get('llm', model_name, provider='huggingface')
         except KeyError:
             print("HUGGINGFACE TOKEN DOESN'T EXIST")
     elif model == "local":
         timeout = kwargs.get('timeout')
-        llm = Ollama(model=model_name, request_timeout=timeout)
+        llm = get_registry().get('llm', model_name, provider='ollama', request_timeout=timeout)
     return llm
 
-def get_embedding(sentence_transformer: str) -> Any:
-    embed_model = HuggingFaceEmbedding(model_name=sentence_transformer)
+def get_embedding(sentence_transformer: str, **kwargs) -> Any:
+    embed_model = get_registry().get('embedding', sentence_transformer)
+    cache_dir = kwargs.get('cache_dir')
+    if cache_dir is not None:
+        embed_model = CachedEmbedding(embed_model, cache_dir=cache_dir, processes=kwargs.get('processes', 0))
     return embed_model
 
 
@@ -0,0 +1,96 @@
+import re
+import hashlib
+from typing import Any, List
+import numpy as np
+import pytest
+from llama_index.core import Document, Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+DIMENSION = 64
+
+WORDS = ("faiss index vector shard query retrieval chunk embedding cache rerank score token model "
+         "document sentence memory latency batch worker process thread filter metadata merge parent "
+         "leaf budget context answer question summary river mountain forest ocean desert city").split()
+
+
+class HashEmbedding(BaseEmbedding):
+    """
+    A deterministic bag-of-words embedding: every word is hashed to a signed dimension.
+
+    Texts sharing words get similar vectors, so retrieval behaves sensibly without a
+    model download. Every (async) `get_text_embedding_batch` call records its batch size.
+    """
+
+    dimension: int = DIMENSION
+    _batches: List[int] = PrivateAttr(default_factory=list)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    @property
+    def batches(self) -> List[int]:
+        return self._batches
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype="float32")
+        for word in re.findall(r"\w+", text.lower()):
+            value = int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:4], "little")
+            vector[value % self.dimension] += 1.0 if value & (1 << 31) else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def get_text_embedding_batch(self, texts: List[str], show_progress: bool = False,
+                                 **kwargs: Any) -> List[List[float]]:
+        self._batches.append(len(texts))
+        return super().get_text_embedding_batch(texts, show_progress=show_progress, **kwargs)
+
+    async def aget_text_embedding_batch(self, texts: List[str], show_progress: bool = False,
+                                        **kwargs: Any) -> List[List[float]]:
+        self._batches.append(len(texts))
+        return await super().aget_text_embedding_batch(texts, show_progress=show_progress, **kwargs)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._get_text_embeddings(texts)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+
+def make_documents(num_files: int = 12, sentences: int = 30, seed: int = 0) -> List[Document]:
+    """
+    Generate documents with one document per (fake) source file.
+    """
+    rng = np.random.default_rng(seed)
+    documents = []
+    for i in range(num_files):
+        text = " ".join(" ".join(rng.choice(WORDS, size=8)).capitalize() + "." for _ in range(sentences))
+        path = f"/data/file-{i:03d}.txt"
+        documents.append(Document(text=text, id_=f"{path}_part_0",
+                                  metadata={"file_path": path, "file_name": f"file-{i:03d}.txt",
+                                            "topic": WORDS[i % 4]}))
+    return documents
+
+
+@pytest.fixture
+def embed_model():
+    previous = Settings._embed_model
+    model = HashEmbedding(embed_batch_size=1024)
+    Settings.embed_model = model
+    yield model
+    Settings._embed_model = previous
+
+
+@pytest.fixture
+def documents() -> List[Document]:
+    return make_documents()
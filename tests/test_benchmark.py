@@ -0,0 +1,63 @@
+import csv
+import json
+import time
+import pytest
+from llama_index.core import Settings
+from llama_index.core.schema import NodeWithScore, TextNode
+from benchmark import StandInLLM, benchmark, percentiles, recall, write_results
+from utils.registry import LOADERS, get_registry
+from conftest import make_documents
+
+
+@pytest.fixture
+def grid(tmp_path, embed_model):
+    data = tmp_path / "documents"
+    data.mkdir()
+    for document in make_documents(num_files=4, sentences=10):
+        (data / document.metadata["file_name"]).write_text(document.text)
+    queries = tmp_path / "queries.jsonl"
+    queries.write_text("\n".join(json.dumps(item) for item in [
+        {"query": "faiss shard worker", "relevant": ["file-000.txt", "file-001.txt"]},
+        {"query": "river mountain forest"}]))
+    registry = get_registry()
+    registry.register_loader('embedding', lambda name, **kwargs: embed_model)
+    previous = Settings._llm
+    yield {"data": str(data), "queries": str(queries), "dimension": embed_model.dimension, "top_k": 3,
+           "retrievers": [["vector"], ["vector", "BM25"]], "weights": [[0.5, 0.5]], "rerankers": [None],
+           "compressors": [None, {"token_budget": 32}], "concurrency": [1, 2],
+           "llm": {"num_output": 4, "first_token_latency": 0.0, "token_latency": 0.0}}
+    Settings._llm = previous
+    registry.register_loader('embedding', LOADERS['embedding'])
+    registry.clear()
+
+
+def test_percentiles_and_recall():
+    assert percentiles([0.001, 0.002, 0.003], "retrieve") == {
+        "retrieve_p50_ms": 2.0, "retrieve_p95_ms": 2.9, "retrieve_p99_ms": 2.98}
+    nodes = [NodeWithScore(node=TextNode(text="faiss shard", metadata={"file_name": "a.txt"}), score=1.0)]
+    assert recall(nodes, ["a.txt", "shard", "river"]) == pytest.approx(2 / 3)
+    assert recall(nodes, []) is None
+
+
+def test_stand_in_llm_is_paced():
+    llm = StandInLLM(num_output=5, first_token_latency=0.05, token_latency=0.01)
+    start = time.perf_counter()
+    deltas = [response.delta for response in llm.stream_complete("prompt")]
+    assert deltas == ["token "] * 5
+    assert time.perf_counter() - start >= 0.09
+
+
+def test_grid_runs_every_configuration(grid, tmp_path):
+    rows = benchmark(grid)
+    assert [(row["retrievers"], row["compressor"] != "") for row in rows] == [
+        ("vector", False), ("vector", True), ("vector+BM25", False), ("vector+BM25", True)]
+    for row in rows:
+        assert 0 <= row["recall_at_k"] <= 1 and row["qps_c1"] > 0 and row["qps_c2"] > 0
+        assert row["retrieve_p50_ms"] <= row["retrieve_p99_ms"]
+    assert rows[1]["context_tokens"] < rows[0]["context_tokens"] and rows[1]["context_tokens_saved"] > 0
+    assert "end_to_end_p50_delta_ms" in rows[1]
+
+    write_results(rows, str(tmp_path / "results" / "run"))
+    with open(tmp_path / "results" / "run.csv", encoding="utf-8") as f:
+        assert len(list(csv.DictReader(f))) == 4
+    assert json.loads((tmp_path / "results" / "run.json").read_text()) == json.loads(json.dumps(rows))
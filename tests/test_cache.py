@@ -0,0 +1,76 @@
+import pytest
+from llama_index.core import Settings
+from llama_index.core.llms import MockLLM
+from utils import Faiss, QueryEngine, Retriever
+from utils.cache import ResponseCache
+from utils.index import MANIFEST_FILE
+
+
+@pytest.fixture
+def index(tmp_path, embed_model, documents):
+    previous = Settings._llm
+    Settings.llm = MockLLM()
+    index, _ = Faiss(documents, dimension=embed_model.dimension, persist_dir=str(tmp_path / "storage"),
+                     metadata_index=True)
+    yield index
+    Settings._llm = previous
+
+
+def _engine(index, cache, **kwargs):
+    retriever = Retriever(index, 'vector').parser(**kwargs)
+    return QueryEngine(retriever, 'none', llm=MockLLM(), node_processor=None, cache=cache)
+
+
+def test_engines_differing_only_in_top_k_do_not_share_answers(index):
+    cache = ResponseCache(persist_dir=None)
+    top_2, top_4 = _engine(index, cache, similarity_top_k=2), _engine(index, cache, similarity_top_k=4)
+    assert len(top_2.query("faiss shard worker").source_nodes) == 2
+    assert len(top_4.query("faiss shard worker").source_nodes) == 4
+    assert cache.stats == {"exact_hits": 0, "semantic_hits": 0, "misses": 2}
+    assert len(_engine(index, cache, similarity_top_k=4).query("Faiss  shard worker").source_nodes) == 4
+    assert cache.stats["exact_hits"] == 1
+
+
+def test_filters_are_part_of_the_config(index):
+    cache = ResponseCache(persist_dir=None)
+    _engine(index, cache, similarity_top_k=2, filters={"topic": "faiss"}).query("faiss shard worker")
+    _engine(index, cache, similarity_top_k=2, filters={"topic": "shard"}).query("faiss shard worker")
+    assert cache.stats["misses"] == 2 and len(cache) == 2
+
+
+def test_exact_and_semantic_hits_and_misses(embed_model):
+    cache = ResponseCache(embed_model=embed_model, persist_dir=None)
+    assert cache.get("faiss shard worker", "a")[0] is None
+    cache.put("faiss shard worker", "answer", "a")
+    assert cache.get("  Faiss SHARD worker ", "a")[0] == "answer"
+    assert cache.get("worker shard faiss", "a")[0] == "answer"
+    assert cache.get("worker shard faiss", "b")[0] is None
+    assert cache.get("river mountain forest", "a")[0] is None
+    assert cache.stats == {"exact_hits": 1, "semantic_hits": 1, "misses": 3}
+
+
+def test_entries_expire_after_ttl(embed_model, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("utils.cache.time.monotonic", lambda: now[0])
+    cache = ResponseCache(embed_model=embed_model, ttl=60, persist_dir=None)
+    cache.put("faiss shard worker", "answer")
+    now[0] += 59
+    assert cache.get("faiss shard worker")[0] == "answer"
+    now[0] += 2
+    assert cache.get("faiss shard worker")[0] is None
+    assert cache.get("worker shard faiss")[0] is None
+    assert len(cache) == 0
+
+
+def test_manifest_change_clears_the_cache(tmp_path, embed_model):
+    manifest = tmp_path / MANIFEST_FILE
+    manifest.write_text("{}")
+    cache = ResponseCache(embed_model=embed_model, persist_dir=str(tmp_path))
+    cache.put("faiss shard worker", "answer")
+    assert cache.get("faiss shard worker")[0] == "answer"
+    manifest.write_text('{"files": {}}')
+    assert cache.get("faiss shard worker")[0] is None
+    assert cache.get("worker shard faiss")[0] is None
+    assert len(cache) == 0
+    cache.put("faiss shard worker", "rebuilt")
+    assert cache.get("faiss shard worker")[0] == "rebuilt"
@@ -0,0 +1,49 @@
+import asyncio
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.node_parser import SemanticSplitterNodeParser
+from utils import ChunkerStrategy
+from utils.chunker import deterministic_id_func
+from conftest import make_documents
+
+
+def _semantic(embed_model, **kwargs):
+    return ChunkerStrategy(strategy='semantic').parser(buffer_size=1, threshold=95, embed_model=embed_model,
+                                                       **kwargs)
+
+
+def _texts(nodes):
+    return [(node.node_id, node.get_content()) for node in nodes]
+
+
+def test_semantic_chunker_embeds_all_documents_in_one_call(embed_model):
+    documents = make_documents(num_files=5)
+    parser = _semantic(embed_model)
+    expected = SemanticSplitterNodeParser(buffer_size=1, breakpoint_percentile_threshold=95,
+                                          embed_model=embed_model, id_func=deterministic_id_func)(documents)
+    assert len(embed_model.batches) == 5
+
+    embed_model.batches.clear()
+    nodes = parser(documents)
+    assert len(embed_model.batches) == 1
+    assert _texts(nodes) == _texts(expected)
+
+    embed_model.batches.clear()
+    assert _texts(run_transformations(documents, [parser])) == _texts(expected)
+    assert len(embed_model.batches) == 1
+
+
+def test_semantic_chunker_batches_async(embed_model):
+    documents = make_documents(num_files=5)
+    nodes = asyncio.run(_semantic(embed_model).acall(documents))
+    assert len(embed_model.batches) == 1
+    assert _texts(nodes) == _texts(_semantic(embed_model)(documents))
+
+
+def test_parallel_chunking_matches_single_process(embed_model):
+    documents = make_documents(num_files=8)
+    parallel = _semantic(embed_model, processes=2, shard_size=2)
+    try:
+        assert _texts(parallel(documents)) == _texts(_semantic(embed_model)(documents))
+        assert parallel.stats["documents"] == 8
+    finally:
+        parallel.close()
@@ -0,0 +1,49 @@
+import pytest
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from llama_index.core.utils import get_tokenizer
+from utils.compression import ContextCompressor
+from conftest import make_documents
+
+
+def _nodes(num_files=4):
+    return [NodeWithScore(node=TextNode(id_=f"node-{i}", text=document.text), score=1.0 - i / 10)
+            for i, document in enumerate(make_documents(num_files=num_files, sentences=10))]
+
+
+def _tokens(nodes):
+    tokenizer = get_tokenizer()
+    return sum(len(tokenizer(node.node.get_content())) for node in nodes)
+
+
+@pytest.mark.parametrize("token_budget", [10, 40, 120])
+def test_compressed_context_stays_within_the_token_budget(embed_model, token_budget):
+    compressor = ContextCompressor(token_budget=token_budget, embed_model=embed_model)
+    nodes = _nodes()
+    queries = [QueryBundle("faiss shard worker"), QueryBundle("river mountain forest")]
+    results = compressor.postprocess_nodes_batch([nodes, nodes[:2]], queries)
+    for compressed, stats in zip(results, compressor.last_stats):
+        assert 0 < _tokens(compressed) <= token_budget
+        assert stats["tokens_out"] == _tokens(compressed) and stats["tokens_in"] > token_budget
+    assert compressor.stats["tokens_saved"] == sum(stats["tokens_saved"] for stats in compressor.last_stats)
+
+
+def test_compression_keeps_node_order_and_sentence_order(embed_model):
+    nodes = _nodes()
+    compressed = ContextCompressor(token_budget=60, embed_model=embed_model).postprocess_nodes(
+        nodes, QueryBundle("faiss shard worker"))
+    original = {node.node.node_id: node for node in nodes}
+    assert [node.score for node in compressed] == sorted((node.score for node in compressed), reverse=True)
+    for node in compressed:
+        text = original[node.node.node_id].node.get_content()
+        sentences = [sentence.strip() + "." for sentence in node.node.get_content().split(".") if sentence.strip()]
+        positions = [text.index(sentence) for sentence in sentences]
+        assert positions == sorted(positions)
+
+
+def test_sentences_repeated_across_chunks_are_kept_once(embed_model):
+    text = "Faiss shard worker merge. River mountain forest ocean."
+    nodes = [NodeWithScore(node=TextNode(id_=f"overlap-{i}", text=text), score=1.0) for i in range(3)]
+    compressed = ContextCompressor(token_budget=1000, embed_model=embed_model).postprocess_nodes(
+        nodes, QueryBundle("faiss shard worker"))
+    assert [node.node.get_content() for node in compressed] == [text]
+    assert nodes[1].node.get_content() == text
@@ -0,0 +1,80 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+import numpy as np
+import pytest
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from utils.cross_encoder import CrossEncoderRerank
+from utils.registry import LOADERS, get_registry
+
+
+class OverlapCrossEncoder:
+    """
+    Scores a pair by the number of query words in the text and records every predict call.
+    """
+
+    def __init__(self):
+        self.calls: List[List[Tuple[str, str]]] = []
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        self.entered.set()
+        self.gate.wait(5)
+        self.calls.append(list(pairs))
+        return np.array([len(set(query.split()) & set(text.split())) for query, text in pairs], dtype="float32")
+
+
+@pytest.fixture
+def model():
+    model = OverlapCrossEncoder()
+    registry = get_registry()
+    registry.register_loader('cross-encoder', lambda name, **kwargs: model)
+    yield model
+    registry.register_loader('cross-encoder', LOADERS['cross-encoder'])
+    registry.clear()
+
+
+def _nodes(*texts):
+    return [NodeWithScore(node=TextNode(id_=text, text=text), score=0.5) for text in texts]
+
+
+def test_pairs_are_scored_length_sorted_and_returned_in_input_order(model):
+    reranker = CrossEncoderRerank(top_n=3)
+    nodes = _nodes("faiss shard worker merge cache", "faiss", "river faiss shard")
+    reranked = reranker.postprocess_nodes(nodes, QueryBundle("faiss shard worker"))
+    assert [len(text) for _, text in model.calls[0]] == sorted(len(text) for _, text in model.calls[0])
+    assert [(node.node.node_id, node.score) for node in reranked] == [
+        ("faiss shard worker merge cache", 3.0), ("river faiss shard", 2.0), ("faiss", 1.0)]
+
+
+def test_scores_are_cached_by_query_node_and_content(model):
+    reranker = CrossEncoderRerank(top_n=2)
+    query = QueryBundle("faiss shard worker")
+    reranker.postprocess_nodes(_nodes("faiss shard", "river"), query)
+    reranker.postprocess_nodes(_nodes("faiss shard", "river"), query)
+    assert len(model.calls) == 1 and reranker.stats["cached"] == 2
+    changed = _nodes("faiss shard", "river")
+    changed[1].node.set_content("river worker")
+    reranker.postprocess_nodes(changed, query)
+    reranker.postprocess_nodes(_nodes("faiss shard"), QueryBundle("river"))
+    assert [len(call) for call in model.calls] == [2, 1, 1]
+
+
+def test_concurrent_queries_share_model_calls(model):
+    reranker = CrossEncoderRerank(top_n=1, cache_size=0)
+    model.gate.clear()
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        busy = executor.submit(reranker.postprocess_nodes, _nodes("busy"), QueryBundle("busy"))
+        model.entered.wait(5)
+        futures = [executor.submit(reranker.postprocess_nodes, _nodes(f"faiss {i}", "river"),
+                                   QueryBundle(f"faiss {i}")) for i in range(4)]
+        while reranker._get_batcher()._queue.qsize() < 4:
+            time.sleep(0.01)
+        model.gate.set()
+        busy.result()
+        results = [future.result() for future in futures]
+    assert [result[0].node.node_id for result in results] == [f"faiss {i}" for i in range(4)]
+    assert [len(call) for call in model.calls] == [1, 8]
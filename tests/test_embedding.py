@@ -0,0 +1,38 @@
+from typing import List
+from llama_index.core.bridge.pydantic import PrivateAttr
+from conftest import HashEmbedding
+from utils import CachedEmbedding
+
+
+class CountingEmbedding(HashEmbedding):
+    """
+    Records the size of every model call.
+    """
+
+    _calls: List[int] = PrivateAttr(default_factory=list)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self._calls.append(len(texts))
+        return super()._get_text_embeddings(texts)
+
+
+def test_misses_are_embedded_in_large_batches(tmp_path):
+    inner = CountingEmbedding()
+    assert inner.embed_batch_size == 10
+    cached = CachedEmbedding(inner, cache_dir=str(tmp_path), miss_batch_size=64)
+    texts = [f"text number {i}" for i in range(150)]
+    embeddings = cached.get_text_embedding_batch(texts + texts[:20])
+    assert inner._calls == [64, 64, 22]
+    assert embeddings[:150] == [inner._embed(text) for text in texts]
+    assert embeddings[150:] == embeddings[:20]
+
+
+def test_cache_hits_are_not_embedded_again(tmp_path):
+    inner = CountingEmbedding()
+    cached = CachedEmbedding(inner, cache_dir=str(tmp_path))
+    first = cached.get_text_embedding_batch(["alpha beta", "gamma"])
+    inner._calls.clear()
+    reopened = CachedEmbedding(inner, cache_dir=str(tmp_path))
+    assert reopened.get_text_embedding_batch(["gamma", "alpha beta", "delta"]) == [first[1], first[0],
+                                                                                  inner._embed("delta")]
+    assert inner._calls == [1]
@@ -0,0 +1,94 @@
+import json
+from types import SimpleNamespace
+from utils.evaluation import TRIAD, EvaluationRunner, summarize
+
+
+class FakeResponse(SimpleNamespace):
+    def __init__(self, response, source_nodes):
+        super().__init__(response=response, source_nodes=source_nodes)
+
+    def __str__(self):
+        return self.response
+
+
+class FakeQueryEngine:
+    """
+    Answers every question with its retrieved contexts; questions in `failing` raise.
+    """
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+
+    async def aquery(self, question):
+        self.calls.append(question)
+        if question in self.failing:
+            raise RuntimeError(f"cannot answer {question}")
+        nodes = [SimpleNamespace(node=SimpleNamespace(get_content=lambda i=i: f"{question} context {i}"))
+                 for i in range(2)]
+        return FakeResponse(f"answer to {question}", nodes)
+
+
+class FakeProvider:
+    """
+    A TruLens-style feedback provider with fixed scores.
+    """
+
+    model_engine = "fake-judge"
+
+    def __init__(self):
+        self.calls = 0
+
+    def context_relevance_with_cot_reasons(self, question, context):
+        self.calls += 1
+        return 0.5 if context.endswith("0") else 1.0, {"reason": "relevant"}
+
+    def groundedness_measure_with_cot_reasons(self, source, statement):
+        self.calls += 1
+        return 0.8, {"reason": "grounded"}
+
+    def relevance_with_cot_reasons(self, prompt, response):
+        self.calls += 1
+        return 0.9, {"reason": "answers it"}
+
+
+def make_runner(tmp_path, engine, provider, **kwargs):
+    return EvaluationRunner(engine, provider, checkpoint_path=str(tmp_path / "records.jsonl"),
+                            cache_dir=str(tmp_path / "cache"), **kwargs)
+
+
+def test_trulens_triad_scores(tmp_path):
+    runner = make_runner(tmp_path, FakeQueryEngine(), FakeProvider(), max_retries=0)
+    records = runner.run(["q1", "q2"])
+    assert [record["question"] for record in records] == ["q1", "q2"]
+    assert records[0]["scores"] == {'context_relevance': 0.75, 'groundedness': 0.8, 'answer_relevance': 0.9}
+    assert records[0]["feedback"]["groundedness"] == "grounded"
+    assert summarize(records) == {'context_relevance': 0.75, 'groundedness': 0.8, 'answer_relevance': 0.9}
+
+
+def test_failed_question_does_not_stop_the_run(tmp_path):
+    checkpoint = tmp_path / "records.jsonl"
+    engine = FakeQueryEngine(failing=["q2"])
+    runner = make_runner(tmp_path, engine, FakeProvider(), max_retries=1)
+    records = runner.run(["q1", "q2", "q3"])
+    assert [record["question"] for record in records] == ["q1", "q2", "q3"]
+    assert "errors" not in records[0] and "errors" not in records[2]
+    assert records[1]["errors"]["query"] == "RuntimeError: cannot answer q2"
+    assert engine.calls.count("q2") == 2
+    assert set(summarize(records)) == set(TRIAD)
+    # Only finished records are checkpointed, so the next run retries the failure.
+    assert [json.loads(line)["question"] for line in checkpoint.read_text().splitlines()] == ["q1", "q3"]
+    engine.failing.clear()
+    engine.calls.clear()
+    records = runner.run(["q1", "q2", "q3"])
+    assert engine.calls == ["q2"]
+    assert all("errors" not in record for record in records)
+
+
+def test_failed_judgment_is_recorded_per_metric(tmp_path):
+    provider = FakeProvider()
+    provider.relevance_with_cot_reasons = lambda prompt, response: 1 / 0
+    records = make_runner(tmp_path, FakeQueryEngine(), provider, max_retries=0).run(["q1"])
+    assert records[0]["scores"]["answer_relevance"] is None
+    assert records[0]["scores"]["groundedness"] == 0.8
+    assert records[0]["errors"] == {"answer_relevance": "ZeroDivisionError: division by zero"}
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode, TextNode
+from llama_index.core.vector_stores.types import MetadataFilter, MetadataFilters, VectorStoreQuery
+from utils import Faiss
+from utils import vector_store
+from utils.metadata import MetadataIndex, to_filters
+from utils.sharded import shard_of
+from utils.sparse import BM25Index, BM25IndexRetriever
+from utils.vector_store import node_id_to_faiss_id
+from conftest import make_documents
+
+INDEX_TYPES = ['flat', 'ivf', 'hnsw', 'ivfpq', 'opq', 'fp16', 'sq8', 'binary']
+
+
+def _build(tmp_path, embed_model, index_type, **kwargs):
+    return Faiss(make_documents(num_files=40), dimension=embed_model.dimension,
+                 transformation=[SentenceSplitter(chunk_size=32, chunk_overlap=0)],
+                 persist_dir=str(tmp_path / "storage"), index_type=index_type, metadata_index=True, nlist=8,
+                 **kwargs)
+
+
+def _search(index, embed_model, topic):
+    filters = MetadataFilters(filters=[MetadataFilter(key="topic", value=topic)])
+    query = VectorStoreQuery(query_embedding=embed_model.get_query_embedding("faiss index shard query"),
+                             similarity_top_k=5, filters=filters)
+    result = index.vector_store.query(query)
+    return [index.docstore.get_node(index.id_map.get(i)) for i in result.ids]
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_filtered_search_on_every_index_type(tmp_path, embed_model, monkeypatch, index_type):
+    index, _ = _build(tmp_path, embed_model, index_type)
+    for brute_force_limit in (vector_store.BRUTE_FORCE_LIMIT, 0):
+        # A limit of 0 routes every filter through the Faiss ID selector instead of direct scoring.
+        monkeypatch.setattr(vector_store, "BRUTE_FORCE_LIMIT", brute_force_limit)
+        nodes = _search(index, embed_model, "faiss")
+        assert 0 < len(nodes) <= 5
+        assert all(node.metadata["topic"] == "faiss" for node in nodes)
+
+
+def test_filtered_flat_search_is_exact(tmp_path, embed_model):
+    index, _ = _build(tmp_path, embed_model, 'flat')
+    query = np.array(embed_model.get_query_embedding("faiss index shard query"))
+    candidates = [node for node in index.docstore.docs.values() if node.metadata["topic"] == "vector"]
+    vectors = np.array(embed_model.get_text_embedding_batch(
+        [node.get_content(metadata_mode=MetadataMode.EMBED) for node in candidates]))
+    expected = [candidates[i].node_id for i in np.argsort(((vectors - query) ** 2).sum(axis=1), kind="stable")[:5]]
+    assert [node.node_id for node in _search(index, embed_model, "vector")] == expected
+
+
+@pytest.mark.parametrize("index_type", ['ivf', 'ivfpq', 'opq'])
+def test_filtered_search_on_sharded_ivf(tmp_path, embed_model, index_type):
+    index, _ = _build(tmp_path, embed_model, index_type, num_shards=2)
+    try:
+        nodes = _search(index, embed_model, "index")
+        assert nodes and all(node.metadata["topic"] == "index" for node in nodes)
+    finally:
+        index.vector_store.close()
+
+
+def test_metadata_values_are_typed():
+    nodes = [TextNode(text="a", metadata={"flag": True}), TextNode(text="b", metadata={"flag": 1}),
+             TextNode(text="c", metadata={"flag": False}), TextNode(text="d", metadata={"flag": 0})]
+    index = MetadataIndex.from_nodes(nodes)
+    # MetadataFilter takes no booleans, but a filter on 1 or 0 must not match them either.
+    assert np.flatnonzero(index.mask(to_filters({"flag": 1}))).tolist() == [1]
+    assert np.flatnonzero(index.mask(to_filters({"flag": [0, 2]}))).tolist() == [3]
+    assert len(index.keys) == 4
+
+
+def test_selection_splits_ids_by_shard_and_is_cached(documents):
+    nodes = SentenceSplitter(chunk_size=32, chunk_overlap=0).get_nodes_from_documents(documents)
+    index = MetadataIndex.from_nodes(nodes)
+    filters = to_filters({"topic": ["faiss", "index"]})
+    selection = index.selection(filters, num_shards=3)
+    expected = {node_id_to_faiss_id(node.node_id): shard_of(node, 3) for node in nodes
+                if node.metadata["topic"] in ("faiss", "index")}
+    assert sum(len(ids) for ids in selection.ids) == len(expected)
+    for shard, ids in enumerate(selection.ids):
+        assert all(expected[i] == shard for i in ids.tolist())
+    assert index.selection(filters, num_shards=3) is selection
+    index.remove([nodes[0].node_id])
+    assert index.selection(filters, num_shards=3) is not selection
+
+
+def test_bm25_filter_follows_index_changes(documents):
+    nodes = SentenceSplitter(chunk_size=32, chunk_overlap=0).get_nodes_from_documents(documents)
+    topic = nodes[0].metadata["topic"]
+    metadata_index = MetadataIndex.from_nodes(nodes)
+    bm25_index = BM25Index.from_nodes(nodes)
+    retriever = BM25IndexRetriever(bm25_index, None, metadata_index=metadata_index, filters=to_filters({"topic": topic}))
+    expected = [node.metadata["topic"] == topic for node in nodes]
+    assert retriever._mask().tolist() == expected
+    # Re-adding a node and compacting moves every metadata slot without changing the slot count.
+    metadata_index.remove([nodes[0].node_id])
+    metadata_index.add(nodes[:1])
+    metadata_index.compact()
+    assert retriever._mask().tolist() == expected
+    bm25_index.add(nodes[:1])
+    bm25_index.compact()
+    assert retriever._mask().tolist() == expected[1:] + expected[:1]
+
+
+def test_align_is_keyed_by_version_not_identity():
+    index = MetadataIndex.from_nodes([TextNode(id_=node_id, text=node_id) for node_id in "abc"])
+    node_ids = ["c", "x", "a"]
+    assert index.align(node_ids, 1).tolist() == [2, -1, 0]
+    # The same list object with new contents, as when a freed list's id is reused.
+    node_ids[:] = ["b", "c", "y"]
+    assert index.align(node_ids, 2).tolist() == [1, 2, -1]
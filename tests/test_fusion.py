@@ -0,0 +1,91 @@
+import time
+import asyncio
+import pytest
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.llms import MockLLM
+from llama_index.core.retrievers import QueryFusionRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from utils import fusion_retriever
+from utils.others import fuse_results
+
+NODES = {name: TextNode(text=f"text of {name}", id_=name) for name in "abcdefg"}
+
+
+class StaticRetriever(BaseRetriever):
+    """
+    Returns fixed (node, score) pairs per query; optionally sleeps or raises first.
+    """
+
+    def __init__(self, results, delay=0.0, error=None):
+        self.results = results
+        self.delay = delay
+        self.error = error
+        super().__init__()
+
+    def _retrieve(self, query_bundle):
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        scores = self.results[query_bundle.query_str] if isinstance(self.results, dict) else self.results
+        return [NodeWithScore(node=NODES[name], score=score) for name, score in scores]
+
+
+VECTOR = [("a", 0.91), ("b", 0.85), ("c", 0.62), ("d", 0.40)]
+BM25 = [("c", 12.0), ("e", 9.5), ("a", 3.1), ("f", 1.2)]
+
+
+def _ids(nodes):
+    return [node.node.node_id for node in nodes]
+
+
+@pytest.mark.parametrize("mode", ['relative_score', 'dist_based_score', 'reciprocal_rerank'])
+def test_fusion_matches_llama_index(mode):
+    weights = [0.6, 0.4] if mode != 'reciprocal_rerank' else [1.0, 1.0]
+    retrievers = [StaticRetriever(VECTOR), StaticRetriever(BM25)]
+    expected = QueryFusionRetriever(retrievers, llm=MockLLM(), mode=mode, similarity_top_k=5, num_queries=1,
+                                    use_async=False, retriever_weights=weights).retrieve("query")
+    fused = fusion_retriever(5, retrievers, weights, mode=mode).retrieve("query")
+    assert _ids(fused) == _ids(expected)
+    assert [node.score for node in fused] == pytest.approx([node.score for node in expected])
+
+
+def test_relative_score_ordering():
+    fused = fuse_results([[NodeWithScore(node=NODES[n], score=s) for n, s in VECTOR],
+                          [NodeWithScore(node=NODES[n], score=s) for n, s in BM25]], [0.5, 0.5],
+                         'relative_score', top_k=3)
+    # Min-max per retriever: c is top for BM25 and mid for vector, a the reverse; b beats e.
+    assert _ids(fused) == ["c", "a", "b"]
+    assert [node.score for node in fused] == pytest.approx([0.5 * 0.22 / 0.51 + 0.5, 0.5 + 0.5 * 1.9 / 10.8,
+                                                            0.5 * 0.45 / 0.51])
+
+
+def test_weights_change_the_order():
+    lists = [[NodeWithScore(node=NODES[n], score=s) for n, s in VECTOR],
+             [NodeWithScore(node=NODES[n], score=s) for n, s in BM25]]
+    assert _ids(fuse_results(lists, [1.0, 0.0], 'reciprocal_rerank', top_k=4)) == ["a", "b", "c", "d"]
+    assert _ids(fuse_results(lists, [0.0, 1.0], 'reciprocal_rerank', top_k=3)) == ["c", "e", "a"]
+
+
+def test_failed_and_late_retrievers_are_left_out():
+    fused = fusion_retriever(4, [StaticRetriever(VECTOR), StaticRetriever(BM25, delay=1.0),
+                                 StaticRetriever(BM25, error=RuntimeError("down"))],
+                             [0.5, 0.3, 0.2], timeout=[None, 0.1, None])
+    start = time.monotonic()
+    result = fused.retrieve("query")
+    assert time.monotonic() - start < 0.9
+    assert _ids(result) == ["a", "b", "c", "d"]
+    assert _ids(result) == _ids(fusion_retriever(4, [StaticRetriever(VECTOR)], [0.5]).retrieve("query"))
+
+
+def test_batch_and_async_match_single_queries():
+    queries = {"q1": VECTOR, "q2": list(reversed(VECTOR)), "q3": BM25}
+    fused = fusion_retriever(3, [StaticRetriever(queries), StaticRetriever(BM25)], [0.7, 0.3],
+                             mode='dist_based_score')
+    single = [_ids(fused.retrieve(query)) for query in queries]
+    assert [_ids(nodes) for nodes in fused.retrieve_batch([QueryBundle(query) for query in queries])] == single
+    assert fused.retrieve("q1") != fused.retrieve("q3")
+
+    async def run():
+        return [_ids(await fused.aretrieve(query)) for query in queries]
+
+    assert asyncio.run(run()) == single
@@ -0,0 +1,37 @@
+import pytest
+from llama_index.core.schema import NodeRelationship, TextNode
+from utils.hierarchy import HierarchyIndex
+
+
+def _family(num_children):
+    parent = TextNode(id_="parent", text="parent")
+    children = [TextNode(id_=f"child-{i}", text=f"child {i}") for i in range(num_children)]
+    parent.relationships[NodeRelationship.CHILD] = [child.as_related_node_info() for child in children]
+    for i, child in enumerate(children):
+        child.relationships[NodeRelationship.PARENT] = parent.as_related_node_info()
+        if i + 1 < num_children:
+            child.relationships[NodeRelationship.NEXT] = children[i + 1].as_related_node_info()
+    return HierarchyIndex.from_nodes([parent, *children])
+
+
+def test_children_merge_only_above_the_ratio():
+    hierarchy = _family(4)
+    assert hierarchy.merge(["child-0", "child-1"], [0.9, 0.7]) == [("child-0", 0.9), ("child-1", 0.7)]
+    assert hierarchy.merge(["child-0", "child-1", "child-2"], [0.9, 0.6, 0.3]) == [("parent", 0.6)]
+    assert hierarchy.merge(["child-0", "child-1", "child-2"], [0.9, 0.6, 0.3], ratio=0.75) == [
+        ("child-0", 0.9), ("child-1", 0.6), ("child-2", 0.3)]
+    assert hierarchy.merge(["child-0", "child-1"], [0.9, 0.7], ratio=0.25) == [("parent", 0.8)]
+
+
+def test_gaps_between_siblings_are_filled_before_merging():
+    hierarchy = _family(6)
+    filled = hierarchy.merge(["child-0", "child-2"], [0.8, 0.4], ratio=0.6)
+    assert [node_id for node_id, _ in filled] == ["child-0", "child-1", "child-2"]
+    assert filled[1][1] == pytest.approx(0.6)
+    merged = hierarchy.merge(["child-0", "child-2", "child-3"], [0.8, 0.4, 0.6])
+    assert [node_id for node_id, _ in merged] == ["parent"]
+
+
+def test_unknown_nodes_pass_through():
+    hierarchy = _family(2)
+    assert hierarchy.merge(["child-0", "other"], [0.5, 0.9]) == [("other", 0.9), ("child-0", 0.5)]
@@ -0,0 +1,170 @@
+import os
+import json
+import pytest
+from llama_index.core import Document, Settings
+from llama_index.core.node_parser import SentenceSplitter
+from conftest import HashEmbedding, make_documents
+from utils import Faiss
+from llama_index.core.storage.index_store.keyval_index_store import KVIndexStore
+from llama_index.core.storage.index_store.utils import index_struct_to_json
+from llama_index.core.storage.kvstore.types import DEFAULT_COLLECTION
+from utils.index import CHUNK_BATCH_SIZE, load_manifest
+from utils.storage import SQLiteKVStore
+
+
+def _splitter():
+    return [SentenceSplitter(chunk_size=64, chunk_overlap=0)]
+
+
+def _nodes_by_doc(docstore):
+    nodes = {}
+    for node in docstore.docs.values():
+        nodes.setdefault(node.ref_doc_id, []).append(node)
+    return nodes
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_incremental_add_change_remove(tmp_path, embed_model, mmap):
+    persist_dir = str(tmp_path / "storage")
+    documents = make_documents()
+    index, docstore = Faiss(documents, dimension=embed_model.dimension, transformation=_splitter(),
+                            persist_dir=persist_dir, incremental=True, mmap=mmap)
+    before = _nodes_by_doc(docstore)
+    assert index.vector_store.client.ntotal == len(docstore.docs)
+
+    changed = documents[3]
+    documents[3] = Document(text="Desert city ocean river. " * 12, id_=changed.doc_id, metadata=changed.metadata)
+    removed = documents.pop(5)
+    added = make_documents(num_files=13, seed=1)[12]
+    documents.append(added)
+    embed_model.batches.clear()
+    index, docstore = Faiss(documents, dimension=embed_model.dimension, transformation=_splitter(),
+                            persist_dir=persist_dir, incremental=True, mmap=mmap)
+    after = _nodes_by_doc(docstore)
+
+    # Only the nodes of the changed and the new file are embedded.
+    assert sum(embed_model.batches) == len(after[changed.doc_id]) + len(after[added.doc_id])
+    assert removed.doc_id not in after
+    assert all("Desert city" in node.get_content() for node in after[changed.doc_id])
+    assert {node.node_id for node in after[changed.doc_id]}.isdisjoint(
+        node.node_id for node in before[changed.doc_id])
+    unchanged = [document.doc_id for document in documents if document.doc_id not in (changed.doc_id, added.doc_id)]
+    assert all({n.node_id for n in after[d]} == {n.node_id for n in before[d]} for d in unchanged)
+    assert index.vector_store.client.ntotal == len(docstore.docs)
+    assert set(load_manifest(persist_dir)["files"]) == {document.metadata["file_path"] for document in documents}
+
+    [result] = index.as_retriever(similarity_top_k=1).retrieve("desert city ocean river")
+    assert result.node.ref_doc_id == changed.doc_id
+
+    embed_model.batches.clear()
+    index, docstore = Faiss(documents, dimension=embed_model.dimension, transformation=_splitter(),
+                            persist_dir=persist_dir, incremental=True, mmap=mmap)
+    assert embed_model.batches == []
+    assert index.vector_store.client.ntotal == len(docstore.docs)
+
+
+class FailingEmbedding(HashEmbedding):
+    """
+    Fails once `fail_after` batches have been embedded.
+    """
+
+    fail_after: int = 1
+
+    def get_text_embedding_batch(self, texts, show_progress=False, **kwargs):
+        if len(self.batches) >= self.fail_after:
+            raise RuntimeError("embedding service unavailable")
+        return super().get_text_embedding_batch(texts, show_progress=show_progress, **kwargs)
+
+
+@pytest.mark.parametrize("mmap,index_type", [(False, 'fp16'), (True, 'flat')])
+def test_failed_build_is_rebuilt(tmp_path, embed_model, mmap, index_type):
+    persist_dir = str(tmp_path / "storage")
+    documents = make_documents()
+    kwargs = dict(dimension=embed_model.dimension, transformation=_splitter(), persist_dir=persist_dir,
+                  index_type=index_type, mmap=mmap, batch_size=16)
+    Settings.embed_model = FailingEmbedding()
+    with pytest.raises(RuntimeError, match="embedding service unavailable"):
+        Faiss(documents, **kwargs)
+    assert os.path.exists(persist_dir) and load_manifest(persist_dir) is None
+
+    Settings.embed_model = embed_model
+    index, docstore = Faiss(documents, **kwargs)
+    expected, _ = Faiss(documents, **{**kwargs, "persist_dir": str(tmp_path / "fresh")})
+    assert len(docstore.docs) == len(expected.docstore.docs)
+    assert index.vector_store.client.ntotal == expected.vector_store.client.ntotal == len(docstore.docs)
+    assert load_manifest(persist_dir) is not None
+
+
+def test_streaming_ingest_batch_boundaries(tmp_path, embed_model):
+    documents = make_documents(num_files=2 * CHUNK_BATCH_SIZE + 10, sentences=8)
+    pulled = []
+
+    def stream():
+        for document in documents:
+            pulled.append(len(embed_model.batches))
+            yield document
+
+    index, docstore = Faiss(stream(), dimension=embed_model.dimension, transformation=_splitter(),
+                            persist_dir=str(tmp_path / "storage"), batch_size=50)
+    total = len(docstore.docs)
+    assert total > 3 * 50
+    assert embed_model.batches[:-1] == [50] * (len(embed_model.batches) - 1)
+    assert 0 < embed_model.batches[-1] <= 50 and sum(embed_model.batches) == total
+    # Later files are only read once earlier batches have been inserted.
+    assert pulled[0] == 0 and pulled[-1] > 0
+    assert index.vector_store.client.ntotal == total
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_index_struct_stays_bounded(tmp_path, embed_model, monkeypatch, mmap):
+    sizes = []
+    add_index_struct = KVIndexStore.add_index_struct
+
+    def record(self, index_struct):
+        sizes.append(len(json.dumps(index_struct_to_json(index_struct))))
+        return add_index_struct(self, index_struct)
+
+    monkeypatch.setattr(KVIndexStore, "add_index_struct", record)
+    persist_dir = str(tmp_path / "storage")
+    kwargs = dict(dimension=embed_model.dimension, transformation=_splitter(), persist_dir=persist_dir,
+                  mmap=mmap, batch_size=8, incremental=True)
+    index, docstore = Faiss(make_documents(num_files=20), **kwargs)
+    assert len(docstore.docs) > 10 * 8
+    # One struct write per inserted batch, none of them growing with the corpus.
+    assert len(sizes) > 10 and max(sizes) == min(sizes) < 500
+    assert index.index_struct.nodes_dict == {}
+
+    index, docstore = Faiss(make_documents(num_files=20), **{**kwargs, "incremental": False})
+    assert index.index_struct.nodes_dict == {}
+    [result] = index.as_retriever(similarity_top_k=1).retrieve(docstore.get_node(next(iter(docstore.docs))).text)
+    assert result.score is not None and result.node.node_id in docstore.docs
+
+
+def test_mmap_load_reads_only_what_a_search_returns(tmp_path, embed_model, monkeypatch):
+    persist_dir = str(tmp_path / "storage")
+    Faiss(make_documents(num_files=20), dimension=embed_model.dimension, transformation=_splitter(),
+          persist_dir=persist_dir, mmap=True)
+    reads, struct_sizes = [], []
+    get, get_all_ = SQLiteKVStore.get, SQLiteKVStore.get_all
+
+    def record(self, key, collection=DEFAULT_COLLECTION):
+        reads.append(collection)
+        return get(self, key, collection=collection)
+
+    def get_all(self, collection=DEFAULT_COLLECTION):
+        assert collection.startswith("index_store"), f"loaded all of {collection}"
+        values = get_all_(self, collection=collection)
+        struct_sizes.append(len(json.dumps(values)))
+        return values
+
+    monkeypatch.setattr(SQLiteKVStore, "get", record)
+    monkeypatch.setattr(SQLiteKVStore, "get_all", get_all)
+    index, docstore = Faiss(make_documents(num_files=20), dimension=embed_model.dimension,
+                            transformation=_splitter(), persist_dir=persist_dir, mmap=True)
+    # The index struct is the only collection read in full, and it holds no node ids.
+    assert len(reads) <= 2 and max(struct_sizes) < 500
+    reads.clear()
+    results = index.as_retriever(similarity_top_k=3).retrieve("faiss shard worker")
+    assert len(results) == 3
+    # Two id lookups and one node read per hit.
+    assert len(reads) <= 3 * 3
@@ -0,0 +1,44 @@
+import pytest
+from llama_index.core import Settings
+from llama_index.core.llms import MockLLM
+from llama_index.core.utils import get_tokenizer
+from utils import Faiss, QueryEngine, Retriever
+from test_transforms import ScriptedLLM
+
+
+@pytest.fixture
+def index(tmp_path, embed_model, documents):
+    previous = Settings._llm
+    Settings.llm = MockLLM()
+    index, _ = Faiss(documents, dimension=embed_model.dimension, persist_dir=str(tmp_path / "storage"))
+    yield index
+    Settings._llm = previous
+
+
+def _engine(index, **kwargs):
+    retriever = Retriever(index, 'vector').parser(similarity_top_k=3)
+    return QueryEngine(retriever, 'none', llm=MockLLM(max_tokens=20), node_processor=None, **kwargs)
+
+
+def test_stream_sets_sources_before_the_first_token(index):
+    engine = _engine(index)
+    response = engine.stream("faiss shard worker")
+    expected = engine.query("faiss shard worker")
+    assert [n.node.node_id for n in response.source_nodes] == [n.node.node_id for n in expected.source_nodes]
+    assert response.retrieval_seconds > 0
+    assert response.ttft is None and response.tokens == 0
+
+    text = "".join(response.response_gen)
+    assert text.split() == ["text"] * 20
+    assert response.ttft >= response.retrieval_seconds
+    assert response.tokens >= len(get_tokenizer()(text)) == 20
+    assert response.tokens_per_sec is None or response.tokens_per_sec > 0
+
+
+def test_multi_stream_matches_query_sources(index):
+    retriever = Retriever(index, 'vector').parser(similarity_top_k=3)
+    engine = QueryEngine(retriever, 'multi', llm=ScriptedLLM(), node_processor=None)
+    response = engine.stream("how do shards cache queries?")
+    expected = engine.query("how do shards cache queries?")
+    assert [n.node.get_content() for n in response.source_nodes] == [n.node.get_content() for n in expected.source_nodes]
+    assert "".join(response.response_gen) and response.ttft is not None
@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from utils.registry import ModelRegistry
+
+LOADS = []
+
+
+class Model:
+    def __init__(self, name, **options):
+        self.name = name
+        self.options = options
+
+
+def _load(name, **options):
+    LOADS.append(name)
+    time.sleep(0.05)
+    return Model(name, **options)
+
+
+@pytest.fixture
+def registry():
+    LOADS.clear()
+    registry = ModelRegistry()
+    registry.register_loader('stub', _load)
+    return registry
+
+
+def test_concurrent_requests_share_one_load(registry):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        models = list(executor.map(lambda _: registry.get('stub', 'a', max_length=128), range(8)))
+    assert LOADS == ['a'] and all(model is models[0] for model in models)
+    assert registry.get('stub', 'a', max_length=256) is not models[0]
+    assert registry.get('stub', 'a', max_length=128) is models[0]
+    assert [(m["name"], m["options"]) for m in registry.loaded()] == [('a', {"max_length": 128}),
+                                                                   ('a', {"max_length": 256})]
+    with pytest.raises(ValueError):
+        registry.get('unknown', 'a')
+
+
+def test_preload_loads_models_concurrently(registry):
+    start = time.perf_counter()
+    registry.preload([('stub', name, {}) for name in "abcd"])
+    assert time.perf_counter() - start < 0.15
+    assert sorted(LOADS) == list("abcd") and len(registry) == 4
+    registry.clear()
+    assert len(registry) == 0
+
+
+def _report(rank, registry, write_fd):
+    model = registry.get('stub', 'a')
+    os.write(write_fd, f"{rank}:{id(model)}:{len(LOADS)}\n".encode())
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="forked workers need the 'fork' start method")
+def test_forked_workers_inherit_loaded_models(registry):
+    model = registry.get('stub', 'a')
+    read_fd, write_fd = os.pipe()
+    workers = registry.fork_workers(_report, 2, args=(registry, write_fd))
+    for worker in workers:
+        worker.join(10)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        reports = sorted(f.read().split())
+    assert reports == [f"{rank}:{id(model)}:1" for rank in range(2)]
+    assert all(worker.exitcode == 0 for worker in workers)
+
+
+def test_heavy_integrations_are_imported_lazily():
+    code = "import sys, utils; print(sorted(m for m in ('bm25s', 'Stemmer', 'sentence_transformers') if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert output.stdout.strip() == "[]"
@@ -0,0 +1,79 @@
+from typing import Dict, List
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.postprocessor import SimilarityPostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from utils import Reranker
+from utils.reranker import CascadeStage, rerank_batch
+
+
+class ScoreBy(BaseNodePostprocessor):
+    """
+    Rescores nodes from a fixed table and records the nodes it was given.
+    """
+
+    _scores: Dict[str, float] = PrivateAttr()
+    _seen: List[List[str]] = PrivateAttr(default_factory=list)
+
+    def __init__(self, scores: Dict[str, float]):
+        super().__init__()
+        self._scores = scores
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        self._seen.append([node.node.node_id for node in nodes])
+        return [NodeWithScore(node=node.node, score=self._scores[node.node.node_id]) for node in nodes]
+
+
+def _nodes(scores):
+    return [NodeWithScore(node=TextNode(text=name, id_=name), score=score) for name, score in scores.items()]
+
+
+def _ids(nodes):
+    return [node.node.node_id for node in nodes]
+
+
+RETRIEVED = {"a": 0.9, "b": 0.8, "c": 0.7, "d": 0.6, "e": 0.5, "f": 0.1}
+
+
+def test_cascade_orders_by_the_last_stage():
+    cross_encoder = ScoreBy({"a": 0.2, "b": 0.9, "c": 0.8, "d": 0.7, "e": 0.1})
+    llm = ScoreBy({"b": 3.0, "c": 9.0, "d": 5.0})
+    cascade = Reranker('cascade').parser(stages=[
+        CascadeStage(SimilarityPostprocessor(similarity_cutoff=0.3)),
+        CascadeStage(cross_encoder, top_k=3),
+        CascadeStage(llm, top_k=2)
+    ], top_n=2)
+    result = cascade.postprocess_nodes(_nodes(RETRIEVED), query_bundle=QueryBundle("query"))
+    assert _ids(result) == ["c", "d"]
+    assert [node.score for node in result] == [9.0, 5.0]
+    # Each stage only sees the survivors of the previous one, best first.
+    assert cross_encoder._seen == [["a", "b", "c", "d", "e"]]
+    assert llm._seen == [["b", "c", "d"]]
+    assert [stats["survivors"] for stats in cascade.stats] == [5, 3, 2]
+
+
+def test_cascade_exits_early_on_a_decisive_margin():
+    decisive = {"a": 0.1, "b": 0.95, "c": 0.9, "d": 0.2, "e": 0.15, "f": 0.0}
+    close = {"a": 0.6, "b": 0.7, "c": 0.65, "d": 0.62, "e": 0.1, "f": 0.0}
+    cross_encoder = ScoreBy(decisive)
+    llm = ScoreBy({name: float(i) for i, name in enumerate("abcdef")})
+    cascade = Reranker('cascade').parser(stages=[CascadeStage(cross_encoder, top_k=4, margin=0.5),
+                                                 CascadeStage(llm, top_k=2)], top_n=2)
+    results = cascade.postprocess_nodes_batch([_nodes(RETRIEVED), _nodes(RETRIEVED)],
+                                              [QueryBundle("q1"), QueryBundle("q2")])
+    assert _ids(results[0]) == ["b", "c"]
+    assert llm._seen == []
+    assert cascade.stats[0]["early_exits"] == 2
+
+    cross_encoder._scores = close
+    result = cascade.postprocess_nodes(_nodes(RETRIEVED), query_bundle=QueryBundle("q3"))
+    assert llm._seen == [["b", "c", "d", "a"]]
+    assert _ids(result) == ["d", "c"]
+
+
+def test_rerank_batch_applies_plain_postprocessors_per_query():
+    processor = ScoreBy({name: -score for name, score in RETRIEVED.items()})
+    reranked = rerank_batch(processor, [_nodes({"a": 0.9, "b": 0.8}), _nodes({"c": 0.7})],
+                            [QueryBundle("q1"), QueryBundle("q2")])
+    assert [[node.score for node in nodes] for nodes in reranked] == [[-0.9, -0.8], [-0.7]]
+    assert processor._seen == [["a", "b"], ["c"]]
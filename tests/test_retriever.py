@@ -0,0 +1,50 @@
+import pytest
+from llama_index.core import Settings
+from llama_index.core.llms import MockLLM
+from llama_index.core.schema import QueryBundle
+from conftest import HashEmbedding
+from utils import Faiss, QueryEngine, Retriever
+from utils.retriever import embed_queries
+
+
+def test_embed_queries_matches_single_queries(embed_model):
+    bundles = [QueryBundle("faiss shard"), QueryBundle("query cache"), QueryBundle("faiss shard")]
+    embed_queries(embed_model, bundles)
+    assert embed_model.batches == []
+    for bundle in bundles:
+        assert bundle.embedding == embed_model.get_query_embedding(bundle.query_str)
+
+
+def test_embed_queries_batches_passages(embed_model):
+    bundles = [QueryBundle("faiss shard", custom_embedding_strs=["a shard passage", "faiss shard"]),
+               QueryBundle("query cache", custom_embedding_strs=["a cache passage", "another cache passage"])]
+    embed_queries(embed_model, bundles)
+    assert embed_model.batches == [3]
+    expected = (embed_model.get_text_embedding("a shard passage"), embed_model.get_query_embedding("faiss shard"))
+    assert bundles[0].embedding == pytest.approx([(a + b) / 2 for a, b in zip(*expected)], abs=1e-6)
+
+
+def test_embed_queries_does_not_swallow_errors():
+    class BrokenEmbedding(HashEmbedding):
+        def _get_query_embedding(self, query):
+            raise TypeError("broken")
+
+    with pytest.raises(TypeError, match="broken"):
+        embed_queries(BrokenEmbedding(), [QueryBundle("faiss shard")])
+
+
+def test_query_batch_matches_single_queries(tmp_path, embed_model, documents):
+    previous = Settings._llm
+    Settings.llm = MockLLM()
+    try:
+        index, _ = Faiss(documents, dimension=embed_model.dimension, persist_dir=str(tmp_path / "storage"))
+        engine = QueryEngine(Retriever(index, 'vector').parser(similarity_top_k=3), 'none', llm=None,
+                             node_processor=None)
+        queries = ["faiss shard worker", "query cache latency", "river mountain forest"]
+        batched = engine.query_batch(queries)
+        for query, response in zip(queries, batched):
+            single = engine.query(query)
+            assert [n.node.node_id for n in response.source_nodes] == [n.node.node_id for n in single.source_nodes]
+            assert [n.score for n in response.source_nodes] == pytest.approx([n.score for n in single.source_nodes])
+    finally:
+        Settings._llm = previous
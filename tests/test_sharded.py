@@ -0,0 +1,45 @@
+import os
+from llama_index.core.vector_stores.types import VectorStoreQuery
+from utils import Faiss
+from utils.sharded import ShardedFaissVectorStore, shard_paths, _worker_info
+
+
+def _ids(store, embed_model, queries):
+    return [store.query(VectorStoreQuery(query_embedding=embed_model.get_query_embedding(query),
+                                         similarity_top_k=5)).ids for query in queries]
+
+
+def test_process_workers_open_only_their_shard(tmp_path, embed_model, documents):
+    persist_dir = str(tmp_path / "storage")
+    index, _ = Faiss(documents, dimension=embed_model.dimension, persist_dir=persist_dir,
+                     num_shards=3, shard_executor='process')
+    store = index.vector_store
+    threaded = ShardedFaissVectorStore.from_persist_dir(persist_dir, 3)
+    queries = ["faiss shard worker", "river mountain", "token budget context"]
+    try:
+        assert store._shards is None
+        assert _ids(store, embed_model, queries) == _ids(threaded, embed_model, queries)
+
+        infos = [worker.submit(_worker_info).result() for worker in store._get_workers()]
+        assert [info["paths"] for info in infos] == [[path] for path in shard_paths(persist_dir, 3)]
+        assert len({info["pid"] for info in infos} | {os.getpid()}) == 4
+    finally:
+        store.close()
+        threaded.close()
+
+
+def test_process_store_reopens_as_thread(tmp_path, embed_model, documents):
+    persist_dir = str(tmp_path / "storage")
+    index, _ = Faiss(documents, dimension=embed_model.dimension, persist_dir=persist_dir, num_shards=2)
+    store = ShardedFaissVectorStore.from_persist_dir(persist_dir, 2, executor='process')
+    try:
+        assert store.dimension == embed_model.dimension
+        expected = _ids(index.vector_store, embed_model, ["leaf parent merge"])
+        assert _ids(store, embed_model, ["leaf parent merge"]) == expected
+        store.use_executor('thread')
+        assert store.client.ntotal + store._shards[1].ntotal == index.vector_store.client.ntotal \
+            + index.vector_store._shards[1].ntotal
+        assert _ids(store, embed_model, ["leaf parent merge"]) == expected
+    finally:
+        store.close()
+        index.vector_store.close()
@@ -0,0 +1,69 @@
+import os
+import numpy as np
+import pytest
+from llama_index.core.node_parser import SentenceSplitter
+from utils.sparse import BM25Index
+
+QUERIES = ["faiss shard worker", "query cache latency", "river mountain forest", "merge parent leaf"]
+
+
+@pytest.fixture
+def nodes(documents):
+    return SentenceSplitter(chunk_size=48, chunk_overlap=0).get_nodes_from_documents(documents)
+
+
+def _scores(index, live):
+    # Scores keyed by node id, so indexes with different slot layouts compare equal.
+    return [{index.node_ids[i]: float(s[i]) for i in range(len(index.node_ids)) if index.node_ids[i] in live}
+            for s in (index.scores(query) for query in QUERIES)]
+
+
+def _assert_same_scores(index, expected, live):
+    for got, want in zip(_scores(index, live), _scores(expected, live)):
+        assert got.keys() == want.keys()
+        assert np.allclose([got[k] for k in want], list(want.values()), rtol=1e-5)
+
+
+def test_add_remove_persist_reload_keeps_scores(tmp_path, nodes):
+    index = BM25Index.from_nodes(nodes[:-5])
+    index.persist(str(tmp_path))
+    index = BM25Index.load(str(tmp_path))
+    index.add(nodes[-5:])
+    index.remove([nodes[0].node_id, nodes[-1].node_id])
+    live = {node.node_id for node in nodes[1:-1]}
+    expected = BM25Index.from_nodes(nodes[1:-1])
+    _assert_same_scores(index, expected, live)
+    index.persist(str(tmp_path))
+    reloaded = BM25Index.load(str(tmp_path))
+    assert len(reloaded) == len(live)
+    _assert_same_scores(reloaded, expected, live)
+    assert reloaded.search(QUERIES[0], 3) == expected.search(QUERIES[0], 3)
+
+
+def test_small_changes_persist_without_compaction(tmp_path, nodes):
+    index = BM25Index.from_nodes(nodes[:-2])
+    index.persist(str(tmp_path))
+    assert os.path.exists(tmp_path / "indptr.1.npy")
+    index = BM25Index.load(str(tmp_path))
+    index.add(nodes[-2:])
+    index.remove([nodes[0].node_id])
+    index.persist(str(tmp_path))
+    assert not os.path.exists(tmp_path / "indptr.2.npy")
+    live = {node.node_id for node in nodes[1:]}
+    _assert_same_scores(BM25Index.load(str(tmp_path)), BM25Index.from_nodes(nodes[1:]), live)
+
+
+def test_large_changes_compact(tmp_path, nodes):
+    half = len(nodes) // 2
+    index = BM25Index.from_nodes(nodes[:half])
+    index.persist(str(tmp_path))
+    index.add(nodes[half:])
+    index.persist(str(tmp_path))
+    assert os.path.exists(tmp_path / "indptr.2.npy")
+    index.remove([node.node_id for node in nodes[:half]])
+    index.persist(str(tmp_path))
+    assert os.path.exists(tmp_path / "indptr.3.npy") and not os.path.exists(tmp_path / "indptr.1.npy")
+    reloaded = BM25Index.load(str(tmp_path))
+    assert reloaded.node_ids == [node.node_id for node in nodes[half:]]
+    live = {node.node_id for node in nodes[half:]}
+    _assert_same_scores(reloaded, BM25Index.from_nodes(nodes[half:]), live)
@@ -0,0 +1,75 @@
+import json
+import pytest
+from llama_index.core import Settings
+from llama_index.core.llms import MockLLM
+from utils import Faiss, QueryEngine, Retriever, fusion_retriever
+from utils.tracing import Span, disable_tracing, enable_tracing, get_tracer, span, count
+
+
+@pytest.fixture
+def engine(tmp_path, embed_model, documents):
+    previous = Settings._llm
+    Settings.llm = MockLLM()
+    persist_dir = str(tmp_path / "storage")
+    index, docstore = Faiss(documents, dimension=embed_model.dimension, persist_dir=persist_dir, bm25=True)
+    retrievers = [Retriever(index, 'vector').parser(similarity_top_k=3),
+                  Retriever(index, 'BM25').parser(docstore=docstore, persist_dir=persist_dir, similarity_top_k=3)]
+    yield QueryEngine(fusion_retriever(3, retrievers, [0.5, 0.5]), 'none', llm=MockLLM(), node_processor=None)
+    disable_tracing()
+    Settings._llm = previous
+
+
+def _trace(path):
+    traces = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(traces) == 1
+    return traces[0]["spans"]
+
+
+def test_disabled_tracing_is_a_noop():
+    assert get_tracer() is None
+    with span("query") as s:
+        s.set(nodes_out=3)
+    assert not isinstance(s, Span)
+    count("nodes", 3)
+
+
+def test_query_spans_form_one_trace_across_threads(engine, tmp_path):
+    path = tmp_path / "traces.jsonl"
+    enable_tracing(str(path))
+    engine.query("faiss shard worker")
+    spans = _trace(path)
+    by_id = {s["span_id"]: s for s in spans}
+    roots = [s for s in spans if s["parent_id"] is None]
+    assert [s["name"] for s in roots] == ["query"] and spans[-1] is roots[0]
+    assert {s["trace_id"] for s in spans} == {roots[0]["trace_id"]}
+    assert all(s["parent_id"] in by_id for s in spans if s is not roots[0])
+
+    def ancestors(s):
+        while s["parent_id"] is not None:
+            s = by_id[s["parent_id"]]
+            yield s["name"]
+    names = {s["name"] for s in spans}
+    assert {"fusion", "faiss_search", "bm25_search", "synthesize", "llm"} <= names
+    for name in ("faiss_search", "bm25_search"):
+        assert list(ancestors(next(s for s in spans if s["name"] == name))) == ["retrieve_batch", "query"]
+    assert all(s["duration"] >= 0 for s in spans)
+
+
+def test_metrics_and_prometheus_text(engine, tmp_path):
+    tracer = enable_tracing()
+    engine.query("faiss shard worker")
+    engine.query("river mountain forest")
+    metrics = tracer.metrics()
+    assert metrics["stages"]["query"]["count"] == 2
+    assert metrics["counters"]["tokens[kind=prompt]"] > 0
+
+    tracer.write_prometheus(str(tmp_path / "metrics.prom"))
+    lines = (tmp_path / "metrics.prom").read_text().splitlines()
+    buckets = [float(line.split()[-1]) for line in lines if line.startswith('rag_stage_duration_seconds_bucket{stage="query"')]
+    assert buckets == sorted(buckets) and buckets[-1] == 2
+    assert 'rag_stage_duration_seconds_count{stage="query"} 2' in lines
+    assert any(line.startswith('rag_tokens_total{kind="completion"}') for line in lines)
+    disable_tracing()
+    assert get_tracer() is None
+    engine.query("faiss shard worker")
+    assert tracer.metrics()["stages"]["query"]["count"] == 2
@@ -0,0 +1,111 @@
+from typing import Any, List
+import pytest
+from llama_index.core import Settings
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata, MockLLM
+from llama_index.core.prompts import PromptTemplate
+from llama_index.core.schema import QueryBundle
+from utils import Faiss, QueryEngine, Retriever
+from utils.transforms import ParallelHyDEQueryTransform
+
+STEPS = {
+    "None": "faiss shard worker\n2. query cache latency\nfaiss shard worker",
+    "- query cache latency": "- merge parent leaf",
+}
+
+
+class ScriptedLLM(CustomLLM):
+    """Answers the decomposition prompt of each step from STEPS and records every prompt."""
+
+    _prompts: List[str] = PrivateAttr(default_factory=list)
+
+    @property
+    def prompts(self) -> List[str]:
+        return self._prompts
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="scripted")
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        self._prompts.append(prompt)
+        reasoning = prompt.split("Previous reasoning:\n", 1)[-1]
+        for marker, output in reversed(list(STEPS.items())):
+            if marker in reasoning and "merge parent leaf" not in reasoning:
+                return CompletionResponse(text=output)
+        return CompletionResponse(text="None")
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        response = self.complete(prompt)
+        yield CompletionResponse(text=response.text, delta=response.text)
+
+
+@pytest.fixture
+def index(tmp_path, embed_model, documents):
+    previous = Settings._llm
+    Settings.llm = MockLLM()
+    index, _ = Faiss(documents, dimension=embed_model.dimension, persist_dir=str(tmp_path / "storage"))
+    yield index
+    Settings._llm = previous
+
+
+def _engine(index, llm, **kwargs):
+    retriever = Retriever(index, 'vector').parser(similarity_top_k=3)
+    return QueryEngine(retriever, 'multi', llm=llm, node_processor=None, **kwargs)
+
+
+def test_multi_steps_build_on_earlier_answers(index):
+    llm = ScriptedLLM()
+    response = _engine(index, llm).query("how do shards cache queries?")
+    assert response.metadata["sub_questions"] == ["faiss shard worker", "query cache latency", "merge parent leaf"]
+    assert len(llm.prompts) == 3
+    assert "- faiss shard worker\n- " in llm.prompts[1] and "- query cache latency\n- " in llm.prompts[1]
+    assert "Question: merge parent leaf" in response.source_nodes[0].node.get_content()
+
+
+def test_multi_source_nodes_are_capped_to_top_k(index):
+    response = _engine(index, ScriptedLLM()).query("how do shards cache queries?")
+    sources = response.source_nodes[1:]
+    assert len(sources) == 3
+    assert len({node.node.node_id for node in sources}) == 3
+    assert [node.score for node in sources] == sorted((node.score for node in sources), reverse=True)
+
+
+def test_multi_memo_skips_repeated_decompositions(index, tmp_path):
+    llm = ScriptedLLM()
+    engine = _engine(index, llm, memo_dir=str(tmp_path / "memo"))
+    first = engine.query("how do shards cache queries?")
+    assert len(llm.prompts) == 3
+    second = engine.query("how do shards cache queries?")
+    assert len(llm.prompts) == 3
+    assert second.metadata["sub_questions"] == first.metadata["sub_questions"]
+    _engine(index, llm, memo_dir=str(tmp_path / "memo")).query("a different question")
+    assert len(llm.prompts) == 6
+
+
+def test_multi_async_matches_sync(index):
+    engine = _engine(index, ScriptedLLM())
+    sync = engine.query("how do shards cache queries?")
+    batched = engine.query_batch(["how do shards cache queries?"])[0]
+    assert batched.metadata["sub_questions"] == sync.metadata["sub_questions"]
+    assert [n.node.node_id for n in batched.source_nodes[1:]] == [n.node.node_id for n in sync.source_nodes[1:]]
+
+
+def test_hyde_uses_the_updated_prompt():
+    llm = ScriptedLLM()
+    hyde = ParallelHyDEQueryTransform(llm=llm, num_hypotheses=2, include_original=False)
+    hyde.update_prompts({"hyde_prompt": PromptTemplate("A passage about {context_str}:")})
+    bundle = hyde.run(QueryBundle("faiss shards"))
+    assert llm.prompts == ["A passage about faiss shards:"] * 2
+    assert bundle.embedding_strs == ["None", "None"]
+    assert hyde.get_prompts()["hyde_prompt"].get_template() == "A passage about {context_str}:"
+
+
+def test_multi_batch_retrieves_each_step_of_all_queries_together(index, monkeypatch):
+    engine = _engine(index, ScriptedLLM())
+    batches = []
+    nodes = engine.multi_query._nodes
+    monkeypatch.setattr(engine.multi_query, "_nodes", lambda bundles: batches.append(len(bundles)) or nodes(bundles))
+    responses = engine.query_batch(["how do shards cache queries?", "what do workers merge?"])
+    assert batches == [4, 2]
+    assert all(len(response.metadata["sub_questions"]) == 3 for response in responses)
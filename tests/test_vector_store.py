@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import subprocess
+import numpy as np
+import pytest
+from llama_index.core.vector_stores.types import VectorStoreQuery
+from utils.vector_store import ExactVectorFile, FaissIDMapVectorStore, build_faiss_index
+
+MEASURE = """
+import json, sys
+from utils.vector_store import FaissIDMapVectorStore
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+def anon():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) * 1024 for line in f if line.startswith("RssAnon"))
+
+path, mmap = sys.argv[1], sys.argv[2] == "1"
+before = anon()
+store = FaissIDMapVectorStore.from_persist_path(path, mmap=mmap)
+store.query(VectorStoreQuery(query_embedding=[0.1] * store.client.d, similarity_top_k=5))
+print(json.dumps(anon() - before))
+"""
+
+
+def _private_bytes(path: str, mmap: bool) -> int:
+    result = subprocess.run([sys.executable, "-c", MEASURE, path, "1" if mmap else "0"], check=True,
+                            stdout=subprocess.PIPE, text=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="needs /proc")
+@pytest.mark.parametrize("index_type, code_size", [('flat', 256), ('fp16', 128), ('sq8', 64)])
+def test_mmap_load_keeps_codes_out_of_private_memory(tmp_path, index_type, code_size):
+    vectors = np.random.default_rng(0).standard_normal((400_000, 64)).astype("float32")
+    faiss_index = build_faiss_index(64, index_type, embeddings=vectors)
+    faiss_index.add_with_ids(vectors, np.arange(len(vectors), dtype="int64"))
+    path = str(tmp_path / "index.faiss")
+    FaissIDMapVectorStore(faiss_index=faiss_index).persist(path)
+
+    # Only the id map stays private; the codes are read from the mapped file.
+    saved = _private_bytes(path, mmap=False) - _private_bytes(path, mmap=True)
+    assert saved > 0.9 * len(vectors) * code_size
+
+
+def test_exact_vector_file_open_leaves_unpersisted_rows_alone(tmp_path):
+    vectors = np.random.default_rng(0).standard_normal((6, 8)).astype("float32")
+    path = str(tmp_path / "vectors.f32")
+    writer = ExactVectorFile(path, 8)
+    writer.add(np.arange(4, dtype="int64"), vectors[:4])
+    writer.persist()
+    writer.add(np.array([4], dtype="int64"), vectors[4:5])
+    size = os.path.getsize(path)
+
+    reader = ExactVectorFile(path, 8)
+    assert os.path.getsize(path) == size
+    found_vectors, found = reader.get(np.array([0, 3, 4], dtype="int64"))
+    assert found.tolist() == [True, True, False]
+    assert np.array_equal(found_vectors[:2], vectors[[0, 3]])
+
+    # The next add replaces the rows behind the persisted row table.
+    reader.add(np.array([5], dtype="int64"), vectors[5:6])
+    found_vectors, found = reader.get(np.array([5, 2], dtype="int64"))
+    assert found.all() and np.array_equal(found_vectors, vectors[[5, 2]])
+
+
+@pytest.mark.parametrize("metric", ['ip', 'l2'])
+def test_unrescored_binary_scores_follow_the_metric(metric):
+    vectors = np.random.default_rng(0).standard_normal((500, 64)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    faiss_index = build_faiss_index(64, 'binary', metric, embeddings=vectors)
+    faiss_index.add_with_ids(vectors, np.arange(len(vectors), dtype="int64"))
+    store = FaissIDMapVectorStore(faiss_index=faiss_index)
+    result = store.query(VectorStoreQuery(query_embedding=vectors[7].tolist(), similarity_top_k=5))
+    assert result.ids[0] == "7"
+    best, rest = result.similarities[0], result.similarities[1:]
+    if metric == 'ip':
+        assert best == 1.0 and all(-1.0 <= score < best for score in rest)
+        assert rest == sorted(rest, reverse=True)
+    else:
+        assert best == 0.0 and all(best < score <= 4.0 for score in rest)
+        assert rest == sorted(rest)
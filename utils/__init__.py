@@ -1,6 +1,13 @@
-from .chunker import ChunkerStrategy
-from .index import data_loader, Faiss
+from .chunker import ChunkerStrategy, ParallelChunker
+from .index import data_loader, iter_data, Faiss, FaissIndex
 from .retriever import Retriever
 from .query_engine import QueryEngine
-from .others import fusion_retriever
-from .reranker import Reranker
\ No newline at end of file
+from .others import fusion_retriever, ConcurrentFusionRetriever
+from .reranker import Reranker
+from .cross_encoder import CrossEncoderRerank
+from .compression import ContextCompressor
+from .embedding import CachedEmbedding
+from .cache import ResponseCache
+from .tracing import enable_tracing, disable_tracing, get_tracer
+from .registry import ModelRegistry, get_registry
+from .evaluation import EvaluationRunner, JudgeCache, summarize
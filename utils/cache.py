@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import dataclasses
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+import faiss
+import numpy as np
+from llama_index.core.bridge.pydantic import BaseModel
+from .index import MANIFEST_FILE
+from .vector_store import node_id_to_faiss_id
+from .tracing import count
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query for exact matching: lower-cased with collapsed whitespace.
+
+    Args:
+        query (str): The query string.
+
+    Returns:
+        str: The normalized query.
+    """
+    return " ".join(query.lower().split())
+
+
+# Attributes (with or without leading underscores) that shape what a non-pydantic component
+# returns: retriever and fusion settings, nested retrievers and cascade stages.
+CONFIG_ATTRIBUTES = frozenset((
+    "similarity_top_k", "weights", "mode", "ratio", "filters", "kwargs", "retrievers", "base_retriever",
+    "retriever_weights", "num_queries", "vector_store_query_mode", "alpha", "sparse_top_k", "doc_ids",
+    "node_ids", "embed_model", "stages", "processor", "top_k", "margin", "top_n"
+))
+
+
+def describe_config(component: Any, depth: int = 4) -> Any:
+    """
+    Describe a pipeline component by the configuration values that shape its results.
+
+    Pydantic components (rerankers, compressors, LLMs, embedding models) contribute
+    their fields; other objects (retrievers, cascade stages) the attributes named in
+    CONFIG_ATTRIBUTES, recursively. Runtime state such as stats or loaded models is
+    left out.
+
+    Args:
+        component: The component.
+        depth (int): How many levels of nested components to describe.
+
+    Returns:
+        Any: A JSON-serializable description.
+    """
+    if component is None or isinstance(component, (str, int, float, bool)):
+        return component
+    if isinstance(component, (list, tuple, set, frozenset)):
+        return [describe_config(item, depth) for item in component]
+    if isinstance(component, dict):
+        return {str(key): describe_config(value, depth) for key, value in component.items()}
+    if depth == 0:
+        return type(component).__name__
+    if isinstance(component, BaseModel):
+        fields = {name: getattr(component, name, None) for name, field in type(component).model_fields.items()
+                  if not field.exclude}
+        private = component.__pydantic_private__ or {}
+        fields.update((name, value) for name, value in private.items() if name.lstrip("_") in CONFIG_ATTRIBUTES)
+    elif dataclasses.is_dataclass(component) or hasattr(component, "__dict__"):
+        fields = {name: value for name, value in vars(component).items() if name.lstrip("_") in CONFIG_ATTRIBUTES}
+    else:
+        fields = {}
+    return {"type": type(component).__name__,
+            **{name.lstrip("_"): describe_config(value, depth - 1) for name, value in fields.items()}}
+
+
+def pipeline_config(*components: Any) -> str:
+    """
+    Fingerprint a query pipeline for use as a ResponseCache config.
+
+    Args:
+        *components: The components and settings of the pipeline.
+
+    Returns:
+        str: A hex digest that changes with any configuration value of the components.
+    """
+    payload = json.dumps(describe_config(list(components)), sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    """
+    A cached response.
+
+    Attributes:
+        key (str): The exact-match key (hash of the pipeline config and normalized query).
+        config (str): The pipeline config the response was produced with.
+        response (Any): The cached response.
+        created (float): The monotonic time the entry was stored.
+    """
+    key: str
+    config: str
+    response: Any
+    created: float
+
+
+class ResponseCache:
+    """
+    A two-level cache of query responses.
+
+    The exact level is an LRU keyed on the pipeline config and normalized query. The
+    semantic level keeps the normalized embedding of every cached query in a small
+    Faiss inner-product index and returns the response of the closest cached query
+    with the same config when its cosine similarity reaches `threshold`. Entries expire
+    after `ttl` seconds, the least recently used entries are evicted beyond
+    `max_entries`, and the whole cache is cleared when the index manifest in
+    `persist_dir` changes.
+
+    Attributes:
+        embed_model: The embedding model for the semantic level (None disables it).
+        threshold (float): The minimum cosine similarity for a semantic hit.
+        max_entries (int): The maximum number of cached responses.
+        ttl (Optional[float]): The lifetime of an entry in seconds (None never expires).
+        persist_dir (Optional[str]): The storage directory whose manifest is watched.
+        stats (Dict[str, int]): The number of exact hits, semantic hits and misses.
+    """
+
+    def __init__(self, embed_model: Optional[Any] = None, threshold: float = 0.95, max_entries: int = 10000,
+                 ttl: Optional[float] = 3600.0, persist_dir: Optional[str] = "./storage"):
+        """
+        Initialize the ResponseCache.
+
+        Args:
+            embed_model: The embedding model for the semantic level (None keeps only the exact level).
+            threshold (float): The minimum cosine similarity for a semantic hit.
+            max_entries (int): The maximum number of cached responses.
+            ttl (Optional[float]): The lifetime of an entry in seconds (None never expires).
+            persist_dir (Optional[str]): The storage directory whose manifest is watched (None disables it).
+        """
+        self.embed_model = embed_model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_dir = persist_dir
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._semantic: Optional[faiss.IndexIDMap2] = None
+        self._keys: Dict[int, str] = {}
+        self._manifest_state = self._read_manifest_state()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _read_manifest_state(self) -> Optional[Tuple[int, int]]:
+        if self.persist_dir is None:
+            return None
+        try:
+            stat = os.stat(os.path.join(self.persist_dir, MANIFEST_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _check_manifest(self) -> None:
+        state = self._read_manifest_state()
+        if state != self._manifest_state:
+            self._manifest_state = state
+            self._clear()
+
+    def _embed(self, query: str) -> np.ndarray:
+        vector = np.asarray([self.embed_model.get_query_embedding(query)], dtype="float32")
+        faiss.normalize_L2(vector)
+        return vector
+
+    @staticmethod
+    def _key(query: str, config: str) -> str:
+        return hashlib.sha1(f"{config}\0{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    def _remove(self, key: str) -> None:
+        self._entries.pop(key, None)
+        faiss_id = node_id_to_faiss_id(key)
+        if self._keys.pop(faiss_id, None) is not None:
+            self._semantic.remove_ids(np.array([faiss_id], dtype="int64"))
+
+    def _alive(self, entry: CacheEntry) -> bool:
+        if self.ttl is not None and time.monotonic() - entry.created > self.ttl:
+            self._remove(entry.key)
+            return False
+        return True
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._keys.clear()
+        if self._semantic is not None:
+            self._semantic.reset()
+
+    def clear(self) -> None:
+        """
+        Drop every cached response.
+        """
+        with self._lock:
+            self._clear()
+
+    def get(self, query: str, config: str = "") -> Tuple[Optional[Any], Optional[np.ndarray]]:
+        """
+        Look up the response of a query.
+
+        Args:
+            query (str): The query string.
+            config (str): The pipeline config the response must have been produced with.
+
+        Returns:
+            Tuple[Optional[Any], Optional[np.ndarray]]: The cached response (None on a miss) and
+                the query embedding, if one was computed, to pass on to `put`.
+        """
+        key = self._key(query, config)
+        with self._lock:
+            self._check_manifest()
+            entry = self._entries.get(key)
+            if entry is not None and self._alive(entry):
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                count("response_cache", result="exact")
+                return entry.response, None
+        if self.embed_model is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            count("response_cache", result="miss")
+            return None, None
+
+        vector = self._embed(query)
+        with self._lock:
+            if self._semantic is not None and self._semantic.ntotal > 0:
+                scores, ids = self._semantic.search(vector, min(8, self._semantic.ntotal))
+                for score, faiss_id in zip(scores[0], ids[0]):
+                    if faiss_id < 0 or score < self.threshold:
+                        break
+                    entry = self._entries.get(self._keys.get(int(faiss_id), ""))
+                    if entry is not None and entry.config == config and self._alive(entry):
+                        self._entries.move_to_end(entry.key)
+                        self.stats["semantic_hits"] += 1
+                        count("response_cache", result="semantic")
+                        return entry.response, vector
+            self.stats["misses"] += 1
+        count("response_cache", result="miss")
+        return None, vector
+
+    def put(self, query: str, response: Any, config: str = "", embedding: Optional[np.ndarray] = None) -> None:
+        """
+        Cache the response of a query.
+
+        Args:
+            query (str): The query string.
+            response (Any): The response.
+            config (str): The pipeline config the response was produced with.
+            embedding (Optional[np.ndarray]): The normalized query embedding returned by `get`.
+        """
+        key = self._key(query, config)
+        if self.embed_model is not None and embedding is None:
+            embedding = self._embed(query)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = CacheEntry(key=key, config=config, response=response, created=time.monotonic())
+            if embedding is not None:
+                if self._semantic is None:
+                    self._semantic = faiss.IndexIDMap2(faiss.IndexFlatIP(embedding.shape[1]))
+                faiss_id = node_id_to_faiss_id(key)
+                self._semantic.add_with_ids(embedding, np.array([faiss_id], dtype="int64"))
+                self._keys[faiss_id] = key
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
@@ -2,18 +2,217 @@ from llama_index.core.node_parser import (
     SentenceSplitter,
     SentenceWindowNodeParser,
     SemanticSplitterNodeParser,
-    HierarchicalNodeParser
+    HierarchicalNodeParser,
+    NodeParser
 )
-from typing import Literal, Any, Union
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode, Document, TransformComponent
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Literal, Any, Union, List, Sequence, Callable, Optional, Dict
+import time
+import uuid
+import numpy as np
+from .registry import get_registry
 
-NodeParserStrategy = Literal['sentence', 'window', 'semantic']
+NodeParserStrategy = Literal['sentence', 'window', 'semantic', 'hierarchical']
+
+_worker_parser: Optional[NodeParser] = None
+
+
+def deterministic_id_func(i: int, doc: BaseNode) -> str:
+    """
+    Derive a node id from its source document id and position.
+
+    Re-chunking the same document with the same parser yields the same node ids,
+    whichever process the document was chunked in.
+
+    Args:
+        i (int): The position of the node within the document.
+        doc (BaseNode): The source document.
+
+    Returns:
+        str: The node id.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{doc.node_id}:{i}"))
+
+
+def _identity(parser: NodeParser) -> NodeParser:
+    return parser
+
+
+def _init_worker(factory: Callable[[], NodeParser]) -> None:
+    """
+    Build the node parser (and its embedding model, if any) once per worker process.
+    """
+    global _worker_parser
+    _worker_parser = factory()
+
+
+def _chunk_in_worker(documents: List[BaseNode]) -> List[BaseNode]:
+    """
+    Chunk a shard of documents with the worker's node parser.
+    """
+    return _worker_parser(documents)
+
+
+class BatchedSemanticSplitterNodeParser(SemanticSplitterNodeParser):
+    """
+    A SemanticSplitterNodeParser that embeds the sentence buffers of all documents at once.
+
+    The stock parser issues one embedding call per document; here the sentence groups
+    of every document passed to the parser (or to one of its workers) go through a
+    single `get_text_embedding_batch` call and breakpoint distances are computed with NumPy.
+    """
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "BatchedSemanticSplitterNodeParser"
+
+    def _parse_nodes(self, nodes: Sequence[BaseNode], show_progress: bool = False,
+                     **kwargs: Any) -> List[BaseNode]:
+        # The base class parses one document at a time; hand it the whole batch instead.
+        return self.build_semantic_nodes_from_documents(nodes, show_progress)
+
+    async def _aparse_nodes(self, nodes: Sequence[BaseNode], show_progress: bool = False,
+                            **kwargs: Any) -> List[BaseNode]:
+        return await self.abuild_semantic_nodes_from_documents(nodes, show_progress)
+
+    def _sentence_groups(self, documents: Sequence[Document]) -> List[List[Dict[str, Any]]]:
+        return [self._build_sentence_groups(self.sentence_splitter(doc.text)) for doc in documents]
+
+    def build_semantic_nodes_from_documents(self, documents: Sequence[Document],
+                                            show_progress: bool = False) -> List[BaseNode]:
+        groups = self._sentence_groups(documents)
+        texts = [sentence["combined_sentence"] for sentences in groups for sentence in sentences]
+        embeddings = self.embed_model.get_text_embedding_batch(texts, show_progress=show_progress)
+        return self._split(documents, groups, embeddings)
+
+    async def abuild_semantic_nodes_from_documents(self, documents: Sequence[Document],
+                                                   show_progress: bool = False) -> List[BaseNode]:
+        groups = self._sentence_groups(documents)
+        texts = [sentence["combined_sentence"] for sentences in groups for sentence in sentences]
+        embeddings = await self.embed_model.aget_text_embedding_batch(texts, show_progress=show_progress)
+        return self._split(documents, groups, embeddings)
+
+    def _split(self, documents: Sequence[Document], groups: List[List[Dict[str, Any]]],
+               embeddings: List[List[float]]) -> List[BaseNode]:
+        """
+        Cut every document at its breakpoints, given the embeddings of all sentence groups in order.
+        """
+        all_nodes: List[BaseNode] = []
+        offset = 0
+        for doc, sentences in zip(documents, groups):
+            matrix = np.array(embeddings[offset:offset + len(sentences)], dtype="float32")
+            offset += len(sentences)
+            for sentence, embedding in zip(sentences, embeddings[offset - len(sentences):offset]):
+                sentence["combined_sentence_embedding"] = embedding
+
+            distances: List[float] = []
+            if len(sentences) > 1:
+                norms = np.linalg.norm(matrix, axis=1)
+                norms[norms == 0] = 1.0
+                similarity = np.sum(matrix[:-1] * matrix[1:], axis=1) / (norms[:-1] * norms[1:])
+                distances = (1 - similarity).tolist()
+
+            chunks = self._build_node_chunks(sentences, distances)
+            all_nodes.extend(build_nodes_from_splits(chunks, doc, id_func=self.id_func))
+        return all_nodes
+
+
+class ParallelChunker(TransformComponent):
+    """
+    A transformation that shards documents across a process pool and chunks them in parallel.
+
+    Documents are split into contiguous shards in input order and results are
+    concatenated in the same order, so together with deterministic node ids the
+    output matches a single-process run. Throughput of the last call is kept in `stats`.
+
+    Attributes:
+        parser (NodeParser): The node parser applied in each worker.
+        processes (int): The number of worker processes (0 or 1 chunks in-process).
+        shard_size (int): The number of documents sent to a worker at a time.
+        stats (Dict[str, float]): Documents, chunks, seconds and chunks_per_sec of the last call.
+    """
+
+    parser: NodeParser
+    processes: int = 0
+    shard_size: int = 16
+    _factory: Optional[Callable[[], NodeParser]] = PrivateAttr(default=None)
+    _pool: Optional[ProcessPoolExecutor] = PrivateAttr(default=None)
+    _stats: Dict[str, float] = PrivateAttr(default_factory=dict)
+
+    def __init__(self, parser: NodeParser, processes: int = 0, shard_size: int = 16,
+                 parser_factory: Optional[Callable[[], NodeParser]] = None, **kwargs: Any):
+        """
+        Initialize the ParallelChunker.
+
+        Args:
+            parser (NodeParser): The node parser to apply.
+            processes (int): The number of worker processes.
+            shard_size (int): The number of documents sent to a worker at a time.
+            parser_factory (Optional[Callable[[], NodeParser]]): A picklable callable that builds
+                the parser inside each worker; defaults to pickling `parser`.
+        """
+        super().__init__(parser=parser, processes=processes, shard_size=shard_size, **kwargs)
+        self._factory = parser_factory
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ParallelChunker"
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return dict(self._stats)
+
+    def to_dict(self, **kwargs: Any) -> Dict[str, Any]:
+        # The process count does not change the output, so only the parser identifies the config.
+        return self.parser.to_dict(**kwargs)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            factory = self._factory or partial(_identity, self.parser)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                initializer=_init_worker,
+                initargs=(factory,)
+            )
+        return self._pool
+
+    def __call__(self, nodes: Sequence[BaseNode], **kwargs: Any) -> List[BaseNode]:
+        start = time.perf_counter()
+        documents = list(nodes)
+        if self.processes <= 1 or len(documents) <= self.shard_size:
+            chunks = list(self.parser(documents, **kwargs))
+        else:
+            shards = [documents[i:i + self.shard_size] for i in range(0, len(documents), self.shard_size)]
+            chunks = []
+            for shard in self._get_pool().map(_chunk_in_worker, shards):
+                chunks.extend(shard)
+        seconds = time.perf_counter() - start
+        self._stats = {
+            "documents": len(documents),
+            "chunks": len(chunks),
+            "seconds": seconds,
+            "chunks_per_sec": len(chunks) / seconds if seconds > 0 else 0.0
+        }
+        return chunks
+
+    def close(self) -> None:
+        """
+        Shut down the worker pool, if one was started.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
 
 class ChunkerStrategy:
     """
     A class to select and apply different text chunking strategies.
 
     This class provides methods to parse text using different chunking strategies:
-    'sentence', 'window', or 'semantic'.
+    'sentence', 'window', 'semantic' or 'hierarchical'.
 
     Attributes:
         strategy (NodeParserStrategy): The chosen chunking strategy.
@@ -28,30 +227,47 @@ class ChunkerStrategy:
         """
         self.strategy = strategy
 
-    def parser(self, *args: Any, **kwargs: Any) -> Union[SentenceSplitter, SentenceWindowNodeParser, SemanticSplitterNodeParser]:
+    def parser(self, *args: Any, **kwargs: Any) -> Union[SentenceSplitter, SentenceWindowNodeParser,
+                                                         SemanticSplitterNodeParser, HierarchicalNodeParser,
+                                                         ParallelChunker]:
         """
         Parse the chosen strategy to the relative function.
 
+        Node ids are derived from the source document id, so re-chunking is deterministic.
+
         Args:
             *args: Variable length argument list.
             **kwargs: Arbitrary keyword arguments.
+                processes (int): If given, wrap the parser in a ParallelChunker with this many workers.
+                shard_size (int): The number of documents sent to a worker at a time.
+                parser_factory (Callable): A picklable callable building the parser in each worker.
 
         Returns:
-            Union[SentenceSplitter, SentenceWindowNodeParser, SemanticSplitterNodeParser]: 
-            The appropriate parser based on the chosen strategy.
+            Union[SentenceSplitter, SentenceWindowNodeParser, SemanticSplitterNodeParser,
+            HierarchicalNodeParser, ParallelChunker]: The appropriate parser based on the chosen strategy.
 
         Raises:
             ValueError: If an invalid strategy is provided.
         """
+        processes = kwargs.pop('processes', None)
+        shard_size = kwargs.pop('shard_size', 16)
+        parser_factory = kwargs.pop('parser_factory', None)
+
         if self.strategy == 'sentence':
-            return self._sentence_splitter(*args, **kwargs)
+            parser = self._sentence_splitter(*args, **kwargs)
         elif self.strategy == 'window':
-            return self._window_parser(*args, **kwargs)
+            parser = self._window_parser(*args, **kwargs)
         elif self.strategy == 'semantic':
-            return self._semantic_chunker(*args, **kwargs)
+            parser = self._semantic_chunker(*args, **kwargs)
+        elif self.strategy == 'hierarchical':
+            parser = self._hierarchical_parser(*args, **kwargs)
         else:
             raise ValueError(f"Invalid strategy: {self.strategy}")
 
+        if processes is None:
+            return parser
+        return ParallelChunker(parser, processes=processes, shard_size=shard_size, parser_factory=parser_factory)
+
     def _sentence_splitter(self, *args: Any, **kwargs: Any) -> SentenceSplitter:
         """
         Create a SentenceSplitter with the provided parameters.
@@ -73,7 +289,7 @@ class ChunkerStrategy:
 
         if chunk_size is None or chunk_overlap is None:
             raise ValueError("chunk_size and chunk_overlap must be provided for this strategy")
-        return SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        return SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, id_func=deterministic_id_func)
 
     def _window_parser(self, *args: Any, **kwargs: Any) -> SentenceWindowNodeParser:
         """
@@ -91,19 +307,25 @@ class ChunkerStrategy:
         return SentenceWindowNodeParser(
             window_size=window_size,
             window_metadata_key="window",
-            original_text_metadata_key="original_sentence"
+            original_text_metadata_key="original_sentence",
+            id_func=deterministic_id_func
         )
 
     def _semantic_chunker(self, *args: Any, **kwargs: Any) -> SemanticSplitterNodeParser:
         """
         Create a SemanticSplitterNodeParser with the provided parameters.
 
+        Sentence buffers of all documents in a batch are embedded in one call. Given a
+        `model_name` instead of an `embed_model`, the encoder comes from the ModelRegistry
+        and is shared with the embedder of the same name.
+
         Args:
             *args: Variable length argument list.
             **kwargs: Arbitrary keyword arguments.
                 buffer_size (int): The size of the buffer.
                 threshold (float): The breakpoint percentile threshold.
                 embed_model: The embedding model to use.
+                model_name (str): The HuggingFace embedding model to use if embed_model is not given.
 
         Returns:
             SemanticSplitterNodeParser: A configured SemanticSplitterNodeParser object.
@@ -111,8 +333,39 @@ class ChunkerStrategy:
         buffer_size = kwargs.get('buffer_size')
         threshold = kwargs.get('threshold')
         embed_model = kwargs.get('embed_model')
-        return SemanticSplitterNodeParser(
+        if embed_model is None and kwargs.get('model_name') is not None:
+            embed_model = get_registry().get('embedding', kwargs['model_name'])
+        return BatchedSemanticSplitterNodeParser(
             buffer_size=buffer_size,
             breakpoint_percentile_threshold=threshold,
-            embed_model=embed_model
+            embed_model=embed_model,
+            id_func=deterministic_id_func
+        )
+
+    def _hierarchical_parser(self, *args: Any, **kwargs: Any) -> HierarchicalNodeParser:
+        """
+        Create a HierarchicalNodeParser with the provided parameters.
+
+        Faiss() embeds only the leaf chunks and records the parent/child links for
+        auto-merging retrieval.
+
+        Args:
+            *args: Variable length argument list.
+            **kwargs: Arbitrary keyword arguments.
+                chunk_sizes (List[int]): The chunk size of each level, largest first (defaults to [2048, 512, 128]).
+                chunk_overlap (int): The overlap between chunks (defaults to 20).
+
+        Returns:
+            HierarchicalNodeParser: A configured HierarchicalNodeParser object.
+        """
+        chunk_sizes = kwargs.get('chunk_sizes') or [2048, 512, 128]
+        chunk_overlap = kwargs.get('chunk_overlap', 20)
+        node_parser_ids = [f"chunk_size_{chunk_size}" for chunk_size in chunk_sizes]
+        return HierarchicalNodeParser.from_defaults(
+            node_parser_ids=node_parser_ids,
+            node_parser_map={
+                node_parser_id: SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                                 id_func=deterministic_id_func)
+                for chunk_size, node_parser_id in zip(chunk_sizes, node_parser_ids)
+            }
         )
\ No newline at end of file
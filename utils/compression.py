@@ -0,0 +1,181 @@
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.node_parser.text.utils import split_by_sentence_tokenizer
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.utils import get_tokenizer
+from .retriever import embed_queries
+from .tracing import span, count
+
+
+def _normalize(sentence: str) -> str:
+    return " ".join(sentence.split()).lower()
+
+
+class ContextCompressor(BaseNodePostprocessor):
+    """
+    A postprocessor that shrinks the synthesis context to the query-relevant sentences.
+
+    The nodes are split into sentences. Sentences repeated across overlapping chunks are
+    dropped, and the rest are embedded in one batch (for all queries of a batch at once)
+    and scored against the query embedding. Sentences are then taken best first, skipping
+    near-duplicates of those already taken, until `token_budget` is filled. Each node keeps
+    its selected sentences in their original order; nodes left empty are dropped, and the
+    order and scores of the others are unchanged.
+
+    Token counts of the last call are kept in `last_stats` and running totals in `stats`.
+    """
+
+    token_budget: int = Field(default=1024, description="The maximum number of context tokens.")
+    similarity_cutoff: Optional[float] = Field(default=None,
+                                               description="The minimum query similarity of a kept sentence.")
+    dedup_threshold: float = Field(default=0.95,
+                                   description="The similarity above which a sentence counts as a duplicate.")
+    _embed_model: Any = PrivateAttr()
+    _split: Any = PrivateAttr()
+    _tokenizer: Any = PrivateAttr()
+    _last_stats: List[Dict[str, float]] = PrivateAttr(default_factory=list)
+    _stats: Dict[str, float] = PrivateAttr()
+
+    def __init__(self, token_budget: int = 1024, embed_model: Optional[Any] = None,
+                 similarity_cutoff: Optional[float] = None, dedup_threshold: float = 0.95, **kwargs: Any):
+        """
+        Initialize the ContextCompressor.
+
+        Args:
+            token_budget (int): The maximum number of context tokens per query.
+            embed_model: The embedding model scoring the sentences (defaults to Settings.embed_model).
+            similarity_cutoff (Optional[float]): The minimum query similarity of a kept sentence.
+            dedup_threshold (float): The similarity above which a sentence counts as a duplicate.
+        """
+        super().__init__(token_budget=token_budget, similarity_cutoff=similarity_cutoff,
+                         dedup_threshold=dedup_threshold, **kwargs)
+        self._embed_model = embed_model or Settings.embed_model
+        self._split = split_by_sentence_tokenizer()
+        self._tokenizer = get_tokenizer()
+        self._stats = {"queries": 0, "tokens_in": 0, "tokens_out": 0, "seconds": 0.0}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextCompressor"
+
+    @property
+    def last_stats(self) -> List[Dict[str, float]]:
+        """
+        Per query of the last call: tokens in, tokens out, tokens saved and seconds spent.
+        """
+        return [dict(stats) for stats in self._last_stats]
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """
+        Totals over all calls: queries, tokens in, tokens out, tokens saved and seconds spent.
+        """
+        return dict(self._stats, tokens_saved=self._stats["tokens_in"] - self._stats["tokens_out"])
+
+    def _sentences(self, nodes: List[NodeWithScore]) -> Tuple[List[Tuple[int, int, str]], int]:
+        sentences = []
+        seen = set()
+        tokens_in = 0
+        for i, node in enumerate(nodes):
+            text = node.node.get_content(metadata_mode=MetadataMode.NONE)
+            tokens_in += len(self._tokenizer(text))
+            for position, sentence in enumerate(self._split(text)):
+                key = _normalize(sentence)
+                if key and key not in seen:
+                    seen.add(key)
+                    sentences.append((i, position, sentence))
+        return sentences, tokens_in
+
+    def _select(self, sentences: List[Tuple[int, int, str]], embeddings: np.ndarray,
+                query_embedding: List[float]) -> List[int]:
+        query = np.asarray(query_embedding, dtype="float32")
+        query /= np.linalg.norm(query) or 1.0
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        unit = embeddings / norms
+        scores = unit @ query
+        similarity = unit @ unit.T
+        lengths = np.array([len(self._tokenizer(sentence)) for _, _, sentence in sentences])
+
+        chosen: List[int] = []
+        used = 0
+        for i in np.argsort(-scores, kind="stable"):
+            if self.similarity_cutoff is not None and scores[i] < self.similarity_cutoff:
+                break
+            if used + lengths[i] > self.token_budget:
+                continue
+            if chosen and similarity[i, chosen].max() >= self.dedup_threshold:
+                continue
+            chosen.append(int(i))
+            used += int(lengths[i])
+        return chosen
+
+    def postprocess_nodes_batch(self, nodes_list: List[List[NodeWithScore]],
+                                query_bundles: List[QueryBundle]) -> List[List[NodeWithScore]]:
+        """
+        Compress the nodes of several queries, embedding all their sentences in one call.
+
+        Args:
+            nodes_list (List[List[NodeWithScore]]): The reranked nodes of each query.
+            query_bundles (List[QueryBundle]): The queries.
+
+        Returns:
+            List[List[NodeWithScore]]: The compressed nodes of each query.
+        """
+        start = time.perf_counter()
+        with span("compress", queries=len(query_bundles)) as s:
+            split = [self._sentences(nodes) for nodes in nodes_list]
+            texts = [sentence for sentences, _ in split for _, _, sentence in sentences]
+            embed_queries(self._embed_model, query_bundles)
+            embeddings = np.array(self._embed_model.get_text_embedding_batch(texts), dtype="float32") \
+                if texts else np.zeros((0, 0), dtype="float32")
+
+            results = []
+            self._last_stats = []
+            offset = 0
+            for nodes, bundle, (sentences, tokens_in) in zip(nodes_list, query_bundles, split):
+                chosen = []
+                if sentences and bundle.embedding is not None:
+                    chosen = self._select(sentences, embeddings[offset:offset + len(sentences)], bundle.embedding)
+                elif sentences:
+                    chosen = list(range(len(sentences)))
+                offset += len(sentences)
+
+                kept: Dict[int, List[Tuple[int, str]]] = {}
+                for i in chosen:
+                    node_index, position, sentence = sentences[i]
+                    kept.setdefault(node_index, []).append((position, sentence))
+                compressed = []
+                tokens_out = 0
+                for node_index, node in enumerate(nodes):
+                    if node_index not in kept:
+                        continue
+                    text = "".join(sentence for _, sentence in sorted(kept[node_index])).strip()
+                    tokens_out += len(self._tokenizer(text))
+                    # Copy, so the docstore's node keeps its full text.
+                    compressed.append(NodeWithScore(node=node.node.model_copy(update={"text": text}),
+                                                    score=node.score))
+                results.append(compressed)
+                self._last_stats.append({"tokens_in": tokens_in, "tokens_out": tokens_out,
+                                         "tokens_saved": tokens_in - tokens_out})
+            seconds = time.perf_counter() - start
+            for stats in self._last_stats:
+                stats["seconds"] = seconds / len(self._last_stats)
+                self._stats["tokens_in"] += stats["tokens_in"]
+                self._stats["tokens_out"] += stats["tokens_out"]
+            self._stats["queries"] += len(query_bundles)
+            self._stats["seconds"] += seconds
+            saved = sum(stats["tokens_saved"] for stats in self._last_stats)
+            count("context_tokens_saved", saved)
+            s.set(sentences=len(texts), tokens_saved=saved)
+        return results
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore],
+                           query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        return self.postprocess_nodes_batch([nodes], [query_bundle])[0]
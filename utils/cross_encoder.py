@@ -0,0 +1,207 @@
+import time
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
+import numpy as np
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from .tracing import count
+from .registry import get_registry
+
+Backend = Literal['torch', 'int8', 'onnx']
+
+
+class _PairBatcher:
+    """
+    Coalesce the (query, text) pairs of concurrent callers into shared model calls.
+
+    A single worker thread scores whatever has queued up while the previous call was
+    running, so an idle reranker adds no latency and a busy one runs large batches.
+    """
+
+    def __init__(self, score_fn: Callable[[List[Tuple[str, str]]], np.ndarray], max_pairs: int):
+        self._score_fn = score_fn
+        self._max_pairs = max_pairs
+        self._queue: "queue.Queue[Tuple[List[Tuple[str, str]], Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="cross-encoder", daemon=True)
+        self._thread.start()
+
+    def submit(self, pairs: List[Tuple[str, str]]) -> Future:
+        future: Future = Future()
+        self._queue.put((pairs, future))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            items = [self._queue.get()]
+            total = len(items[0][0])
+            while total < self._max_pairs:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+                total += len(items[-1][0])
+            try:
+                scores = self._score_fn([pair for pairs, _ in items for pair in pairs])
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for pairs, future in items:
+                future.set_result(scores[offset:offset + len(pairs)])
+                offset += len(pairs)
+
+
+class CrossEncoderRerank(BaseNodePostprocessor):
+    """
+    A cross-encoder reranker built for CPU throughput.
+
+    Pairs are scored in length-sorted batches so each batch pads to a similar length,
+    the pairs of concurrent queries are coalesced into shared model calls, the model
+    can run int8-quantized (PyTorch dynamic quantization) or through ONNX Runtime, and
+    scores are cached by (query hash, node id, node content hash). The model comes from
+    the process-wide ModelRegistry, so rerankers with the same settings share it.
+    """
+
+    model: str = Field(description="Cross-encoder model name.")
+    top_n: int = Field(description="Number of nodes to return sorted by score.")
+    backend: Backend = Field(default='torch', description="Inference backend.")
+    batch_size: int = Field(default=64, description="Number of pairs per forward pass.")
+    max_length: int = Field(default=512, description="Maximum tokens per pair; longer pairs are truncated.")
+    cache_size: int = Field(default=100000, description="Maximum number of cached scores.")
+    keep_retrieval_score: bool = Field(default=False, description="Whether to keep the retrieval score in metadata.")
+    _model: Any = PrivateAttr()
+    _batcher: Optional[_PairBatcher] = PrivateAttr(default=None)
+    _cache: "OrderedDict[Tuple[bytes, str, str], float]" = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+    _stats: Dict[str, float] = PrivateAttr()
+
+    def __init__(self, top_n: int = 2, model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", backend: Backend = 'torch',
+                 batch_size: int = 64, max_length: int = 512, cache_size: int = 100000,
+                 keep_retrieval_score: bool = False, onnx_file_name: Optional[str] = None, **kwargs: Any):
+        """
+        Initialize the CrossEncoderRerank.
+
+        Args:
+            top_n (int): The number of nodes to return.
+            model (str): The cross-encoder model name.
+            backend (Backend): 'torch', 'int8' (dynamically quantized Linear layers) or 'onnx'.
+            batch_size (int): The number of pairs per forward pass.
+            max_length (int): The maximum number of tokens per pair.
+            cache_size (int): The maximum number of cached scores (0 disables the cache).
+            keep_retrieval_score (bool): Whether to keep the retrieval score in metadata.
+            onnx_file_name (Optional[str]): The ONNX file inside the model repo, e.g. a pre-quantized
+                'onnx/model_qint8_avx512_vnni.onnx'.
+
+        Raises:
+            ImportError: If sentence-transformers is not installed.
+            ValueError: If an invalid backend is provided.
+        """
+        if backend not in ('torch', 'int8', 'onnx'):
+            raise ValueError(f"Invalid cross-encoder backend: {backend}")
+        super().__init__(top_n=top_n, model=model, backend=backend, batch_size=batch_size, max_length=max_length,
+                         cache_size=cache_size, keep_retrieval_score=keep_retrieval_score, **kwargs)
+        options: Dict[str, Any] = {"max_length": max_length, "device": "cpu"}
+        if backend != 'torch':
+            options["backend"] = backend
+        if backend == 'onnx' and onnx_file_name:
+            options["onnx_file_name"] = onnx_file_name
+        self._model = get_registry().get('cross-encoder', model, **options)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"pairs": 0, "cached": 0, "seconds": 0.0}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CrossEncoderRerank"
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """
+        Throughput of the model so far: pairs scored, cache hits, seconds and pairs per second.
+        """
+        stats = dict(self._stats)
+        stats["pairs_per_sec"] = stats["pairs"] / stats["seconds"] if stats["seconds"] else 0.0
+        return stats
+
+    def _score(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        """
+        Score pairs in length-sorted batches and return the scores in input order.
+        """
+        start = time.perf_counter()
+        order = np.argsort([len(query) + len(text) for query, text in pairs], kind="stable")
+        sorted_scores = self._model.predict([pairs[i] for i in order], batch_size=self.batch_size,
+                                            show_progress_bar=False)
+        scores = np.empty(len(pairs), dtype="float32")
+        scores[order] = np.asarray(sorted_scores, dtype="float32").reshape(len(pairs))
+        with self._lock:
+            self._stats["pairs"] += len(pairs)
+            self._stats["seconds"] += time.perf_counter() - start
+        return scores
+
+    def _get_batcher(self) -> _PairBatcher:
+        with self._lock:
+            if self._batcher is None:
+                self._batcher = _PairBatcher(self._score, max_pairs=16 * self.batch_size)
+            return self._batcher
+
+    def postprocess_nodes_batch(self, nodes_list: List[List[NodeWithScore]],
+                                query_bundles: List[QueryBundle]) -> List[List[NodeWithScore]]:
+        """
+        Rerank the nodes of several queries with shared model calls.
+
+        Args:
+            nodes_list (List[List[NodeWithScore]]): The retrieved nodes of each query.
+            query_bundles (List[QueryBundle]): The queries.
+
+        Returns:
+            List[List[NodeWithScore]]: The top_n nodes of each query, best first.
+        """
+        keys = [[(hashlib.sha1(bundle.query_str.encode("utf-8")).digest(), node.node.node_id, node.node.hash)
+                 for node in nodes] for nodes, bundle in zip(nodes_list, query_bundles)]
+        scores: Dict[Tuple[bytes, str, str], float] = {}
+        with self._lock:
+            for key in (key for query_keys in keys for key in query_keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[key] = self._cache[key]
+            self._stats["cached"] += len(scores)
+        count("rerank_score_cache_hits", len(scores))
+
+        missing: Dict[Tuple[bytes, str, str], Tuple[str, str]] = {}
+        for nodes, bundle, query_keys in zip(nodes_list, query_bundles, keys):
+            for node, key in zip(nodes, query_keys):
+                if key not in scores and key not in missing:
+                    missing[key] = (bundle.query_str, node.node.get_content(metadata_mode=MetadataMode.EMBED))
+        if missing:
+            count("rerank_pairs_scored", len(missing))
+            computed = self._get_batcher().submit(list(missing.values())).result()
+            scores.update(zip(missing, (float(score) for score in computed)))
+            if self.cache_size > 0:
+                with self._lock:
+                    for key in missing:
+                        self._cache[key] = scores[key]
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+
+        reranked = []
+        for nodes, query_keys in zip(nodes_list, keys):
+            for node, key in zip(nodes, query_keys):
+                if self.keep_retrieval_score:
+                    node.node.metadata["retrieval_score"] = node.score
+                node.score = scores[key]
+            reranked.append(sorted(nodes, key=lambda x: -x.score if x.score else 0)[:self.top_n])
+        return reranked
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore],
+                           query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        if len(nodes) == 0:
+            return []
+        return self.postprocess_nodes_batch([nodes], [query_bundle])[0]
@@ -0,0 +1,214 @@
+import os
+import hashlib
+import sqlite3
+import threading
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+CACHE_FILE = "embeddings.sqlite"
+
+_worker_model: Optional[BaseEmbedding] = None
+
+
+def _init_worker(factory: Callable[[], BaseEmbedding]) -> None:
+    """
+    Build the embedding model once per worker process.
+    """
+    global _worker_model
+    _worker_model = factory()
+
+
+def _identity(model: BaseEmbedding) -> BaseEmbedding:
+    return model
+
+
+def _embed_in_worker(texts: List[str]) -> List[Embedding]:
+    """
+    Embed a batch of texts with the worker's embedding model in one model call.
+    """
+    return _worker_model._get_text_embeddings(texts)
+
+
+def text_hash(text: str) -> bytes:
+    """
+    Hash a text for use as an embedding cache key.
+
+    Args:
+        text (str): The text to hash.
+
+    Returns:
+        bytes: The SHA-256 digest of the text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    An on-disk cache of embeddings keyed by (model name, text hash).
+
+    Vectors are stored as float32 blobs in a SQLite file, so the cache survives
+    restarts and is shared by every chunking configuration that produces the same text.
+
+    Attributes:
+        path (str): The path of the SQLite file.
+    """
+
+    def __init__(self, cache_dir: str):
+        """
+        Open (or create) the cache.
+
+        Args:
+            cache_dir (str): The directory holding the cache file.
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, CACHE_FILE)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, hash BLOB NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, hash)) WITHOUT ROWID"
+        )
+
+    def get_many(self, model_name: str, hashes: List[bytes]) -> Dict[bytes, Embedding]:
+        """
+        Look up the cached embeddings of the given text hashes.
+
+        Args:
+            model_name (str): The embedding model name.
+            hashes (List[bytes]): The text hashes.
+
+        Returns:
+            Dict[bytes, Embedding]: The cached embeddings by hash; misses are absent.
+        """
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(chunk))})",
+                    (model_name, *chunk)
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype="float32").tolist()
+        return found
+
+    def put_many(self, model_name: str, items: Dict[bytes, Embedding]) -> None:
+        """
+        Store embeddings by text hash.
+
+        Args:
+            model_name (str): The embedding model name.
+            items (Dict[bytes, Embedding]): The embeddings by text hash.
+        """
+        rows = [(model_name, key, np.asarray(vector, dtype="float32").tobytes()) for key, vector in items.items()]
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    An embedding model wrapper that dedupes, caches and parallelizes text embeddings.
+
+    Texts are deduplicated within each batch and looked up in an EmbeddingCache;
+    only the misses are embedded, in large batches, optionally spread over a pool
+    of worker processes. Query embeddings are passed straight to the wrapped model.
+    Set it as `Settings.embed_model` so the index embeds nodes through it batch by batch.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+    _processes: int = PrivateAttr()
+    _worker_factory: Optional[Callable[[], BaseEmbedding]] = PrivateAttr()
+    _miss_batch_size: int = PrivateAttr()
+    _pool: Optional[ProcessPoolExecutor] = PrivateAttr(default=None)
+
+    def __init__(self, embed_model: BaseEmbedding, cache_dir: str = "./cache", processes: int = 0,
+                 worker_factory: Optional[Callable[[], BaseEmbedding]] = None,
+                 embed_batch_size: int = 1024, miss_batch_size: int = 256, **kwargs: Any):
+        """
+        Initialize the CachedEmbedding.
+
+        Args:
+            embed_model (BaseEmbedding): The embedding model to wrap.
+            cache_dir (str): The directory holding the embedding cache.
+            processes (int): The number of worker processes for cache misses (0 embeds in-process).
+            worker_factory (Optional[Callable[[], BaseEmbedding]]): A picklable callable that builds
+                the model inside each worker; defaults to pickling `embed_model`.
+            embed_batch_size (int): The number of texts handed to the cache/pool at once.
+            miss_batch_size (int): The number of cache misses embedded per model call; it replaces
+                the wrapped model's own (usually small) `embed_batch_size`.
+        """
+        super().__init__(model_name=embed_model.model_name, embed_batch_size=embed_batch_size, **kwargs)
+        self._embed_model = embed_model
+        self._cache = EmbeddingCache(cache_dir)
+        self._processes = processes
+        self._worker_factory = worker_factory
+        self._miss_batch_size = max(1, miss_batch_size)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            factory = self._worker_factory or partial(_identity, self._embed_model)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self._processes,
+                initializer=_init_worker,
+                initargs=(factory,)
+            )
+        return self._pool
+
+    def _embed_misses(self, texts: List[str]) -> List[Embedding]:
+        """
+        Embed texts that were not found in the cache, `miss_batch_size` texts per model call.
+
+        The wrapped model's `_get_text_embeddings` is called directly: its public batch method
+        would split the batch again by the model's own `embed_batch_size`.
+        """
+        batches = [texts[i:i + self._miss_batch_size] for i in range(0, len(texts), self._miss_batch_size)]
+        if self._processes <= 1 or len(batches) == 1:
+            results = map(self._embed_model._get_text_embeddings, batches)
+        else:
+            results = self._get_pool().map(_embed_in_worker, batches)
+        embeddings = []
+        for batch in results:
+            embeddings.extend(batch)
+        return embeddings
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed_model.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._embed_model.aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        hashes = [text_hash(text) for text in texts]
+        unique: Dict[bytes, str] = dict(zip(hashes, texts))
+        found = self._cache.get_many(self.model_name, list(unique))
+
+        misses = [key for key in unique if key not in found]
+        if misses:
+            computed = dict(zip(misses, self._embed_misses([unique[key] for key in misses])))
+            self._cache.put_many(self.model_name, computed)
+            found.update(computed)
+        return [found[key] for key in hashes]
+
+    def close(self) -> None:
+        """
+        Shut down the worker pool, if one was started.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -0,0 +1,423 @@
+import os
+import json
+import random
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional, Tuple
+from llama_index.core.async_utils import asyncio_run
+from .tracing import count
+
+Judge = Literal['trulens', 'llama-index']
+
+JUDGE_CACHE_FILE = "judge_cache.sqlite"
+
+TRIAD = ('context_relevance', 'groundedness', 'answer_relevance')
+
+
+class RateLimiter:
+    """
+    An asyncio token bucket limiting calls per second.
+
+    Attributes:
+        rate (float): The sustained number of calls per second.
+        burst (int): The number of calls allowed at once after an idle period.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Initialize the RateLimiter.
+
+        Args:
+            rate (float): The sustained number of calls per second.
+            burst (int): The number of calls allowed at once after an idle period.
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """
+        Wait until a call is allowed.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class JudgeCache:
+    """
+    An on-disk cache of judge results keyed by (record hash, metric, judge model).
+
+    Attributes:
+        path (str): The path of the SQLite file.
+    """
+
+    def __init__(self, cache_dir: str):
+        """
+        Open (or create) the cache.
+
+        Args:
+            cache_dir (str): The directory holding the cache file.
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, JUDGE_CACHE_FILE)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS judgments ("
+            "record TEXT NOT NULL, metric TEXT NOT NULL, model TEXT NOT NULL, result TEXT NOT NULL, "
+            "PRIMARY KEY (record, metric, model)) WITHOUT ROWID"
+        )
+
+    def get(self, record: str, metric: str, model: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a judgment.
+
+        Args:
+            record (str): The record hash.
+            metric (str): The metric name.
+            model (str): The judge model name.
+
+        Returns:
+            Optional[Dict[str, Any]]: The judgment (score and feedback), or None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM judgments WHERE record = ? AND metric = ? AND model = ?", (record, metric, model)
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, record: str, metric: str, model: str, result: Dict[str, Any]) -> None:
+        """
+        Store a judgment.
+
+        Args:
+            record (str): The record hash.
+            metric (str): The metric name.
+            model (str): The judge model name.
+            result (Dict[str, Any]): The judgment.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO judgments VALUES (?, ?, ?, ?)", (record, metric, model, json.dumps(result))
+            )
+
+
+def _trulens_score(result: Any) -> Tuple[Optional[float], Any]:
+    """
+    Split a TruLens `*_with_cot_reasons` result into its score and reasons.
+
+    Older trulens_eval versions score groundedness per statement; those scores are averaged.
+    """
+    score, reasons = result if isinstance(result, tuple) else (result, None)
+    if isinstance(score, dict):
+        score = sum(score.values()) / len(score) if score else None
+    if isinstance(reasons, dict):
+        reasons = reasons.get("reason", reasons)
+    return score, reasons
+
+
+class TruLensTriad:
+    """
+    The RAG triad scored with TruLens feedback functions, as in the published benchmarks.
+
+    Context relevance is the mean over the retrieved contexts, groundedness checks the
+    answer against all contexts at once, and answer relevance compares the answer with
+    the question. The feedback functions are blocking, so they run in worker threads.
+
+    Attributes:
+        provider: The TruLens feedback provider (e.g. trulens_eval's OpenAI or LiteLLM).
+    """
+
+    def __init__(self, provider: Any):
+        """
+        Initialize the TruLensTriad.
+
+        Args:
+            provider: The TruLens feedback provider.
+        """
+        self.provider = provider
+        groundedness = getattr(provider, "groundedness_measure_with_cot_reasons", None)
+        if groundedness is None:
+            from trulens_eval.feedback import Groundedness
+            groundedness = Groundedness(groundedness_provider=provider).groundedness_measure_with_cot_reasons
+        self._groundedness = groundedness
+        self._context_relevance = getattr(provider, "context_relevance_with_cot_reasons", None) \
+            or provider.qs_relevance_with_cot_reasons
+
+    @property
+    def model_name(self) -> str:
+        return f"trulens:{getattr(self.provider, 'model_engine', type(self.provider).__name__)}"
+
+    async def aevaluate(self, metric: str, question: str, answer: str, contexts: List[str]) -> Dict[str, Any]:
+        """
+        Score one triad metric.
+
+        Args:
+            metric (str): One of TRIAD.
+            question (str): The question.
+            answer (str): The pipeline's answer.
+            contexts (List[str]): The retrieved contexts.
+
+        Returns:
+            Dict[str, Any]: The score (0 to 1) and the judge's reasons.
+        """
+        if metric == 'context_relevance':
+            results = await asyncio.gather(*(asyncio.to_thread(self._context_relevance, question, context)
+                                             for context in contexts))
+            scores = [score for score, _ in map(_trulens_score, results) if score is not None]
+            return {"score": sum(scores) / len(scores) if scores else None,
+                    "feedback": [reasons for _, reasons in map(_trulens_score, results)]}
+        if metric == 'groundedness':
+            result = await asyncio.to_thread(self._groundedness, "\n\n".join(contexts), answer)
+        else:
+            result = await asyncio.to_thread(self.provider.relevance_with_cot_reasons, question, answer)
+        score, reasons = _trulens_score(result)
+        return {"score": score, "feedback": reasons}
+
+
+class LlamaIndexTriad:
+    """
+    The RAG triad scored with llama-index's context relevancy, faithfulness and answer
+    relevancy evaluators. Their prompts and scales differ from TruLens, so these scores
+    are not comparable with the published TruLens benchmarks.
+
+    Attributes:
+        llm: The judge language model.
+    """
+
+    def __init__(self, llm: Any):
+        """
+        Initialize the LlamaIndexTriad.
+
+        Args:
+            llm: The judge language model.
+        """
+        from llama_index.core.evaluation import (
+            AnswerRelevancyEvaluator,
+            ContextRelevancyEvaluator,
+            FaithfulnessEvaluator
+        )
+        self.llm = llm
+        self._evaluators = {
+            'context_relevance': ContextRelevancyEvaluator(llm=llm),
+            'groundedness': FaithfulnessEvaluator(llm=llm),
+            'answer_relevance': AnswerRelevancyEvaluator(llm=llm)
+        }
+
+    @property
+    def model_name(self) -> str:
+        return f"llama-index:{self.llm.metadata.model_name}"
+
+    async def aevaluate(self, metric: str, question: str, answer: str, contexts: List[str]) -> Dict[str, Any]:
+        """
+        Score one triad metric; see TruLensTriad.aevaluate.
+        """
+        evaluator = self._evaluators[metric]
+        if metric == 'context_relevance':
+            result = await evaluator.aevaluate(query=question, contexts=contexts)
+        elif metric == 'groundedness':
+            result = await evaluator.aevaluate(query=question, response=answer, contexts=contexts)
+        else:
+            result = await evaluator.aevaluate(query=question, response=answer)
+        return {"score": result.score, "feedback": result.feedback}
+
+
+def record_hash(question: str, answer: str, contexts: List[str]) -> str:
+    """
+    Hash an evaluation record, so a judgment is reused only for the same answer and contexts.
+
+    Args:
+        question (str): The question.
+        answer (str): The pipeline's answer.
+        contexts (List[str]): The retrieved contexts.
+
+    Returns:
+        str: The hex digest.
+    """
+    return hashlib.sha256(json.dumps([question, answer, contexts]).encode("utf-8")).hexdigest()
+
+
+class EvaluationRunner:
+    """
+    Evaluate a QueryEngine on the RAG triad over many questions concurrently.
+
+    Each question is answered by the pipeline, then judged for context relevance,
+    groundedness and answer relevance; the three judgments run concurrently. By default
+    the judgments are TruLens feedback functions, as in the published benchmarks. All LLM
+    calls share a rate limiter and are retried with exponential backoff, judgments are
+    cached on disk by (record, metric, judge), and every finished record is appended to a
+    JSONL checkpoint so an interrupted run resumes where it stopped.
+
+    A question whose query or judgment still fails after its retries does not stop the
+    run: its record carries the error in `errors`, is left out of the checkpoint and is
+    retried by the next run.
+
+    Attributes:
+        query_engine: The QueryEngine under evaluation.
+        judge_llm: The TruLens feedback provider or the llama-index judge LLM.
+        judge (Judge): 'trulens' or 'llama-index'.
+        checkpoint_path (str): The JSONL file of finished records.
+        max_concurrency (int): The maximum number of questions in flight.
+        max_retries (int): The number of retries of a failed LLM call.
+    """
+
+    def __init__(self, query_engine: Any, judge_llm: Any, checkpoint_path: str = "./evaluation/records.jsonl",
+                 cache_dir: Optional[str] = "./cache", max_concurrency: int = 16,
+                 rate_limit: Optional[float] = None, max_retries: int = 3, judge: Judge = 'trulens'):
+        """
+        Initialize the EvaluationRunner.
+
+        Args:
+            query_engine: The QueryEngine under evaluation.
+            judge_llm: For 'trulens', a TruLens feedback provider (e.g.
+                `trulens_eval.feedback.provider.OpenAI()`); for 'llama-index', a llama-index LLM.
+            checkpoint_path (str): The JSONL file of finished records.
+            cache_dir (Optional[str]): The directory of the judge cache (None disables it).
+            max_concurrency (int): The maximum number of questions in flight.
+            rate_limit (Optional[float]): The maximum number of LLM calls per second (None is unlimited).
+            max_retries (int): The number of retries of a failed LLM call.
+            judge (Judge): Score the triad with TruLens feedback functions or llama-index evaluators.
+
+        Raises:
+            ValueError: If an invalid judge is provided.
+        """
+        if judge == 'trulens':
+            self._triad = TruLensTriad(judge_llm)
+        elif judge == 'llama-index':
+            self._triad = LlamaIndexTriad(judge_llm)
+        else:
+            raise ValueError(f"Invalid judge: {judge}")
+        self.query_engine = query_engine
+        self.judge_llm = judge_llm
+        self.judge = judge
+        self.checkpoint_path = checkpoint_path
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._rate_limit = rate_limit
+        self._cache = JudgeCache(cache_dir) if cache_dir is not None else None
+
+    def _load_checkpoint(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.checkpoint_path):
+            return {}
+        records = {}
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record["question"]] = record
+        return records
+
+    async def _call(self, limiter: Optional[RateLimiter], fn: Callable[[], Awaitable[Any]]) -> Any:
+        for attempt in range(self.max_retries + 1):
+            if limiter is not None:
+                await limiter.acquire()
+            try:
+                return await fn()
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(2 ** attempt + random.random())
+
+    async def _judge(self, limiter: Optional[RateLimiter], metric: str, key: str, question: str,
+                     answer: str, contexts: List[str]) -> Dict[str, Any]:
+        model = self._triad.model_name
+        if self._cache is not None:
+            cached = self._cache.get(key, metric, model)
+            if cached is not None:
+                return cached
+        judgment = await self._call(limiter, lambda: self._triad.aevaluate(metric, question, answer, contexts))
+        if self._cache is not None:
+            self._cache.put(key, metric, model, judgment)
+        return judgment
+
+    async def arun(self, questions: List[str]) -> List[Dict[str, Any]]:
+        """
+        Asynchronously evaluate the pipeline; see `run`.
+
+        Args:
+            questions (List[str]): The questions.
+
+        Returns:
+            List[Dict[str, Any]]: One record per question, in order.
+        """
+        done = self._load_checkpoint()
+        limiter = RateLimiter(self._rate_limit, burst=max(1, int(self._rate_limit))) if self._rate_limit else None
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        write_lock = asyncio.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.checkpoint_path)), exist_ok=True)
+
+        async def evaluate(question: str) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    response = await self._call(limiter, lambda: self.query_engine.aquery(question))
+                except Exception as e:
+                    count("evaluation_failures", stage="query")
+                    return {"question": question, "answer": None, "contexts": [], "scores": {}, "feedback": {},
+                            "errors": {"query": f"{type(e).__name__}: {e}"}}
+                answer = str(response)
+                contexts = [node.node.get_content() for node in response.source_nodes]
+                key = record_hash(question, answer, contexts)
+                judgments = await asyncio.gather(*(self._judge(limiter, metric, key, question, answer, contexts)
+                                                   for metric in TRIAD), return_exceptions=True)
+                record = {"question": question, "answer": answer, "contexts": contexts, "scores": {}, "feedback": {}}
+                for metric, judgment in zip(TRIAD, judgments):
+                    if isinstance(judgment, BaseException):
+                        count("evaluation_failures", stage=metric)
+                        record.setdefault("errors", {})[metric] = f"{type(judgment).__name__}: {judgment}"
+                        judgment = {"score": None, "feedback": None}
+                    record["scores"][metric] = judgment["score"]
+                    record["feedback"][metric] = judgment["feedback"]
+            if "errors" in record:
+                return record
+            async with write_lock:
+                with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            return record
+
+        pending = [question for question in dict.fromkeys(questions) if question not in done]
+        for record in await asyncio.gather(*(evaluate(question) for question in pending)):
+            done[record["question"]] = record
+        return [done[question] for question in questions]
+
+    def run(self, questions: List[str]) -> List[Dict[str, Any]]:
+        """
+        Evaluate the pipeline on a list of questions, resuming from the checkpoint.
+
+        Args:
+            questions (List[str]): The questions.
+
+        Returns:
+            List[Dict[str, Any]]: One record per question with the answer, contexts and triad
+            scores, plus `errors` (by stage) if it failed.
+        """
+        return asyncio_run(self.arun(questions))
+
+
+def summarize(records: List[Dict[str, Any]]) -> Dict[str, Optional[float]]:
+    """
+    Average the triad scores of evaluation records.
+
+    Args:
+        records (List[Dict[str, Any]]): The records returned by EvaluationRunner.run.
+
+    Returns:
+        Dict[str, Optional[float]]: The mean score of each metric (None if never scored).
+    """
+    summary = {}
+    for metric in TRIAD:
+        scores = [record["scores"][metric] for record in records if record["scores"].get(metric) is not None]
+        summary[metric] = sum(scores) / len(scores) if scores else None
+    return summary
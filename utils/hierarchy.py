@@ -0,0 +1,294 @@
+import os
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.node_parser import HierarchicalNodeParser
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
+from .tracing import span, count
+
+HIERARCHY_DIR = "hierarchy"
+DEFAULT_MERGE_RATIO = 0.5
+
+
+def is_leaf(node: BaseNode) -> bool:
+    """
+    Whether a node is a leaf, i.e. has no child nodes; only leaves are embedded.
+
+    Args:
+        node (BaseNode): The node.
+
+    Returns:
+        bool: True for leaves and for nodes of non-hierarchical parsers.
+    """
+    return not node.child_nodes
+
+
+def is_hierarchical(transformations: Optional[Sequence[Any]]) -> bool:
+    """
+    Whether a transformation pipeline produces hierarchical nodes.
+
+    Args:
+        transformations (Optional[Sequence[Any]]): The transformations, possibly wrapped in a ParallelChunker.
+
+    Returns:
+        bool: True if one of them is a HierarchicalNodeParser.
+    """
+    return any(isinstance(getattr(t, 'parser', t), HierarchicalNodeParser) for t in transformations or [])
+
+
+class HierarchyIndex:
+    """
+    A persisted, incrementally updatable parent/child table of hierarchical chunks.
+
+    Every node (leaf or parent) gets a slot; `parent` and `next` hold the slot of its
+    parent and next sibling (-1 if none) and `num_children` its number of children.
+    Links to nodes not added yet are resolved when they arrive, so a document's
+    nodes may be split across batches.
+
+    Attributes:
+        node_ids (List[str]): The node id of each slot.
+        parent (np.ndarray): The parent slot of each slot.
+        next (np.ndarray): The next sibling slot of each slot.
+        num_children (np.ndarray): The number of children of each slot.
+    """
+
+    def __init__(self):
+        """
+        Create an empty hierarchy index.
+        """
+        self.node_ids: List[str] = []
+        self.parent = np.zeros(0, dtype="int32")
+        self.next = np.zeros(0, dtype="int32")
+        self.num_children = np.zeros(0, dtype="int32")
+        self.alive = np.zeros(0, dtype=bool)
+        self._slots: Dict[str, int] = {}
+        self._pending: Dict[str, List[Tuple[str, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def add(self, nodes: Sequence[BaseNode]) -> None:
+        """
+        Add nodes and their parent, next sibling and child links, replacing any previous
+        version with the same node id.
+
+        Args:
+            nodes (Sequence[BaseNode]): The nodes to add.
+        """
+        self.remove([node.node_id for node in nodes if node.node_id in self._slots])
+        start = len(self.node_ids)
+        self.parent = np.concatenate([self.parent, np.full(len(nodes), -1, dtype="int32")])
+        self.next = np.concatenate([self.next, np.full(len(nodes), -1, dtype="int32")])
+        self.num_children = np.concatenate([self.num_children, np.array(
+            [len(node.child_nodes or []) for node in nodes], dtype="int32")])
+        self.alive = np.concatenate([self.alive, np.ones(len(nodes), dtype=bool)])
+        for slot, node in enumerate(nodes, start):
+            self.node_ids.append(node.node_id)
+            self._slots[node.node_id] = slot
+            for link, related in (("parent", node.parent_node), ("next", node.next_node)):
+                if related is None:
+                    continue
+                target = self._slots.get(related.node_id)
+                if target is None:
+                    self._pending.setdefault(related.node_id, []).append((link, slot))
+                else:
+                    getattr(self, link)[slot] = target
+            for link, source in self._pending.pop(node.node_id, []):
+                getattr(self, link)[source] = slot
+
+    def remove(self, node_ids: Sequence[str]) -> None:
+        """
+        Remove nodes from the index; unknown node ids are ignored.
+
+        Args:
+            node_ids (Sequence[str]): The node ids to remove.
+        """
+        for node_id in node_ids:
+            slot = self._slots.pop(node_id, None)
+            if slot is not None:
+                self.alive[slot] = False
+
+    def merge(self, node_ids: Sequence[str], scores: Sequence[float],
+              ratio: float = DEFAULT_MERGE_RATIO) -> List[Tuple[str, float]]:
+        """
+        Apply the auto-merging rules to retrieved nodes.
+
+        Like llama-index's AutoMergingRetriever, a node lying between two retrieved
+        siblings is filled in, and the retrieved children of a parent are replaced by the
+        parent when they are more than `ratio` of its children; both repeat until nothing
+        changes. Added nodes score the mean of the nodes they join or replace. Node ids
+        unknown to the index are passed through.
+
+        Args:
+            node_ids (Sequence[str]): The retrieved node ids.
+            scores (Sequence[float]): Their scores.
+            ratio (float): The fraction of a parent's children that triggers a merge.
+
+        Returns:
+            List[Tuple[str, float]]: The merged node ids and scores, best first.
+        """
+        selected: Dict[int, float] = {}
+        unknown: List[Tuple[str, float]] = []
+        for node_id, score in zip(node_ids, scores):
+            slot = self._slots.get(node_id)
+            if slot is None:
+                unknown.append((node_id, score))
+            else:
+                selected[slot] = score
+
+        changed = True
+        while changed and selected:
+            slots = np.fromiter(selected, dtype="int64", count=len(selected))
+            middle = self.next[slots]
+            linked = middle >= 0
+            after = np.full(len(slots), -1, dtype="int64")
+            after[linked] = self.next[middle[linked]]
+            fill = np.isin(after, slots) & ~np.isin(middle, slots) & linked
+            for first, gap, last in zip(slots[fill], middle[fill], after[fill]):
+                selected[int(gap)] = (selected[int(first)] + selected[int(last)]) / 2
+
+            slots = np.fromiter(selected, dtype="int64", count=len(selected))
+            parents = self.parent[slots]
+            has_parent = parents >= 0
+            candidates, hits = np.unique(parents[has_parent], return_counts=True)
+            merged = candidates[hits > ratio * self.num_children[candidates]]
+            for parent in merged:
+                children = slots[parents == parent]
+                selected[int(parent)] = float(np.mean([selected.pop(int(child)) for child in children]))
+            changed = bool(fill.any()) or len(merged) > 0
+        results = [(self.node_ids[slot], score) for slot, score in selected.items()] + unknown
+        return sorted(results, key=lambda item: item[1], reverse=True)
+
+    def compact(self) -> None:
+        """
+        Drop removed slots and renumber the links.
+        """
+        live_slots = np.flatnonzero(self.alive)
+        remap = np.full(len(self.node_ids) + 1, -1, dtype="int32")
+        remap[live_slots] = np.arange(len(live_slots))
+        # Index -1 (no link) maps to the trailing -1.
+        self.parent = remap[self.parent[live_slots]]
+        self.next = remap[self.next[live_slots]]
+        self.num_children = np.asarray(self.num_children[live_slots], dtype="int32")
+        self.node_ids = [self.node_ids[i] for i in live_slots]
+        self.alive = np.ones(len(live_slots), dtype=bool)
+        self._slots = {node_id: i for i, node_id in enumerate(self.node_ids)}
+
+    def persist(self, persist_dir: str) -> None:
+        """
+        Compact the index and save it to a directory.
+
+        Args:
+            persist_dir (str): The directory to save to.
+        """
+        self.compact()
+        os.makedirs(persist_dir, exist_ok=True)
+        for name in ("parent", "next", "num_children"):
+            tmp_path = os.path.join(persist_dir, f"{name}.tmp.npy")
+            np.save(tmp_path, getattr(self, name))
+            os.replace(tmp_path, os.path.join(persist_dir, f"{name}.npy"))
+        tmp_path = os.path.join(persist_dir, "meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"node_ids": self.node_ids}, f)
+        os.replace(tmp_path, os.path.join(persist_dir, "meta.json"))
+
+    @classmethod
+    def load(cls, persist_dir: str, mmap: bool = True) -> "HierarchyIndex":
+        """
+        Load an index saved with `persist`.
+
+        Args:
+            persist_dir (str): The directory to load from.
+            mmap (bool): Whether to memory-map the link arrays.
+
+        Returns:
+            HierarchyIndex: The loaded index.
+
+        Raises:
+            FileNotFoundError: If no index exists in persist_dir.
+        """
+        meta_path = os.path.join(persist_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"No hierarchy index found at {persist_dir}")
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        index = cls()
+        index.node_ids = meta["node_ids"]
+        index._slots = {node_id: i for i, node_id in enumerate(index.node_ids)}
+        mmap_mode = "r" if mmap else None
+        for name in ("parent", "next", "num_children"):
+            setattr(index, name, np.load(os.path.join(persist_dir, f"{name}.npy"), mmap_mode=mmap_mode))
+        index.alive = np.ones(len(index.node_ids), dtype=bool)
+        return index
+
+    @classmethod
+    def from_nodes(cls, nodes: Sequence[BaseNode], **kwargs: Any) -> "HierarchyIndex":
+        """
+        Build an index over nodes.
+
+        Args:
+            nodes (Sequence[BaseNode]): The nodes to index.
+            **kwargs: Arbitrary keyword arguments passed to the constructor.
+
+        Returns:
+            HierarchyIndex: The index.
+        """
+        index = cls(**kwargs)
+        index.add(nodes)
+        return index
+
+
+class HierarchyRetriever(BaseRetriever):
+    """
+    An auto-merging retriever deciding merges over a HierarchyIndex.
+
+    The leaf search is done by the base retriever; fills and merges are then computed
+    on the index arrays, and only the resulting parents and filled-in siblings are
+    fetched from the docstore, in a single call.
+
+    Attributes:
+        base_retriever (BaseRetriever): The retriever over the leaf nodes.
+        hierarchy (HierarchyIndex): The parent/child table.
+        docstore: The document store holding every node of the hierarchy.
+        ratio (float): The fraction of a parent's children that triggers a merge.
+    """
+
+    def __init__(self, base_retriever: BaseRetriever, hierarchy: HierarchyIndex, docstore: Any,
+                 ratio: float = DEFAULT_MERGE_RATIO, callback_manager: Optional[CallbackManager] = None):
+        """
+        Initialize the HierarchyRetriever.
+
+        Args:
+            base_retriever (BaseRetriever): The retriever over the leaf nodes.
+            hierarchy (HierarchyIndex): The parent/child table.
+            docstore: The document store holding every node of the hierarchy.
+            ratio (float): The fraction of a parent's children that triggers a merge.
+            callback_manager (Optional[CallbackManager]): The callback manager.
+        """
+        self.base_retriever = base_retriever
+        self.hierarchy = hierarchy
+        self.docstore = docstore
+        self.ratio = ratio
+        super().__init__(callback_manager=callback_manager)
+
+    def _merge(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        with span("auto_merge", nodes_in=len(nodes)) as s:
+            merged = self.hierarchy.merge([n.node.node_id for n in nodes], [n.score or 0.0 for n in nodes],
+                                          self.ratio)
+            retrieved = {n.node.node_id: n.node for n in nodes}
+            missing = [node_id for node_id, _ in merged if node_id not in retrieved]
+            if missing:
+                retrieved.update((node.node_id, node) for node in self.docstore.get_nodes(missing))
+            count("auto_merge_fetched", len(missing))
+            s.set(nodes_out=len(merged))
+        return [NodeWithScore(node=retrieved[node_id], score=score) for node_id, score in merged]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self._merge(self.base_retriever.retrieve(query_bundle))
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self._merge(await self.base_retriever.aretrieve(query_bundle))
+
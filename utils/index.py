@@ -1,18 +1,111 @@
 import os
-from typing import Literal, List, Tuple, Optional, Any
+import json
+import shutil
+import hashlib
+from itertools import chain, groupby
+from typing import Literal, List, Tuple, Optional, Any, Dict, Iterable, Iterator, Callable, Sequence
 from llama_index.core import (
     SimpleDirectoryReader,
-    load_index_from_storage,
     VectorStoreIndex,
     StorageContext,
     SimpleKeywordTableIndex,
-    Document
+    Document,
+    Settings
 )
-from llama_index.vector_stores.faiss import FaissVectorStore
-import faiss
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.indices.utils import embed_nodes
+from llama_index.core.data_structs.data_structs import IndexDict
+from llama_index.core.schema import BaseNode
+from llama_index.core.utils import iter_batch
+from llama_index.core.vector_stores.simple import DEFAULT_PERSIST_FNAME, DEFAULT_VECTOR_STORE, NAMESPACE_SEP
+from tqdm import tqdm
+import numpy as np
+from .vector_store import (
+    BINARY_RESCORE_FACTOR,
+    COMPACT_TYPES,
+    DEFAULT_RESCORE_FACTOR,
+    VECTORS_FILE,
+    ExactVectorFile,
+    FaissIDMapVectorStore,
+    IndexType,
+    Metric,
+    build_faiss_index,
+    is_id_mapped,
+    node_id_to_faiss_id
+)
+from .storage import SQLITE_FILE, FaissIdMap, sqlite_stores
+from .retriever import FaissIndexRetriever
+from .sharded import SHARD_DIR, ShardedFaissVectorStore, ShardExecutor
+from .sparse import BM25Index, BM25_DIR
+from .metadata import MetadataIndex, METADATA_DIR
+from .hierarchy import HierarchyIndex, HIERARCHY_DIR, is_leaf, is_hierarchical
 
 Strategy = Literal['sentence', 'semantic', 'window', 'hierarchical']
 
+MANIFEST_FILE = "manifest.json"
+DEFAULT_BATCH_SIZE = 2048
+DEFAULT_TRAIN_SIZE = 65536
+CHUNK_BATCH_SIZE = 64
+
+class FaissIndex(VectorStoreIndex):
+    """
+    A VectorStoreIndex that keeps its Faiss id -> node id mapping in a FaissIdMap.
+
+    The stock index keeps the mapping in the index struct, which is rewritten in full
+    on every insert and parsed in full on every load. Here the struct stays empty, each
+    insert writes only its new ids, and searches look up only the ids they return.
+    Structs persisted with a full mapping are migrated on load.
+
+    Attributes:
+        id_map (FaissIdMap): The Faiss id -> node id mapping.
+    """
+
+    def __init__(self, nodes: Optional[List[BaseNode]] = None, index_struct: Optional[IndexDict] = None,
+                 storage_context: Optional[StorageContext] = None, **kwargs: Any):
+        """
+        Initialize the FaissIndex.
+
+        Args:
+            nodes (Optional[List[BaseNode]]): The nodes to build the index from.
+            index_struct (Optional[IndexDict]): A loaded index struct.
+            storage_context (Optional[StorageContext]): The storage context.
+            **kwargs: Arbitrary keyword arguments for VectorStoreIndex.
+        """
+        storage_context = storage_context or StorageContext.from_defaults()
+        self.id_map = FaissIdMap(storage_context.docstore._kvstore)
+        super().__init__(nodes=nodes, index_struct=index_struct, storage_context=storage_context, **kwargs)
+        if self._index_struct.nodes_dict:
+            self.id_map.add(self._index_struct.nodes_dict.items())
+            self._index_struct.nodes_dict.clear()
+            self._storage_context.index_store.add_index_struct(self._index_struct)
+
+    def as_retriever(self, **kwargs: Any) -> FaissIndexRetriever:
+        # The stock index passes every node id to the retriever; Faiss stores ignore them.
+        return FaissIndexRetriever(self, callback_manager=self._callback_manager,
+                                   object_map=self._object_map, **kwargs)
+
+    def _store_nodes(self, nodes: Sequence[BaseNode], new_ids: List[str]) -> None:
+        stored = []
+        for node in nodes:
+            node_without_embedding = node.model_copy()
+            node_without_embedding.embedding = None
+            stored.append(node_without_embedding)
+        self._docstore.add_documents(stored, allow_update=True)
+        self.id_map.add(zip(new_ids, (node.node_id for node in nodes)))
+
+    def _add_nodes_to_index(self, index_struct: IndexDict, nodes: Sequence[BaseNode],
+                            show_progress: bool = False, **insert_kwargs: Any) -> None:
+        for nodes_batch in iter_batch(nodes, self._insert_batch_size):
+            nodes_batch = self._get_node_with_embedding(nodes_batch, show_progress)
+            self._store_nodes(nodes_batch, self._vector_store.add(nodes_batch, **insert_kwargs))
+
+    async def _async_add_nodes_to_index(self, index_struct: IndexDict, nodes: Sequence[BaseNode],
+                                        show_progress: bool = False, **insert_kwargs: Any) -> None:
+        for nodes_batch in iter_batch(nodes, self._insert_batch_size):
+            nodes_batch = await self._aget_node_with_embedding(nodes_batch, show_progress)
+            self._store_nodes(nodes_batch, await self._vector_store.async_add(nodes_batch, **insert_kwargs))
+
+
 def data_loader(file_path: str) -> List[Document]:
     """
     Load documents from a specified directory.
@@ -33,35 +126,431 @@ def data_loader(file_path: str) -> List[Document]:
     documents = reader.load_data()
     return documents
 
-def Faiss(documents: List[Document], dimension: int, transformation: Optional[List] = None) -> Tuple[VectorStoreIndex, Any]:
+def iter_data(file_path: str) -> Iterator[Document]:
     """
-    Create or load a Faiss vector database index.
+    Lazily load documents from a specified directory, one file at a time.
 
-    This function either loads an existing Faiss index from storage or creates a new one
-    if it doesn't exist.
+    Args:
+        file_path (str): The path to the directory containing the documents.
+
+    Yields:
+        Document: The loaded documents, contiguous per source file.
+
+    Raises:
+        FileNotFoundError: If the specified directory does not exist.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"No directory found at {file_path}")
+
+    reader = SimpleDirectoryReader(input_dir=file_path, filename_as_id=True)
+    for documents in reader.iter_data():
+        yield from documents
+
+def transformation_fingerprint(transformation: Optional[List]) -> str:
+    """
+    Hash the configuration of a list of transformations (e.g. chunkers).
 
     Args:
-        documents (List[Document]): The documents to be indexed.
-        dimension (int): The dimension of the vector space.
-        transformation (Optional[List]): A list of transformations to apply to the documents.
+        transformation (Optional[List]): The transformations applied before embedding.
+
+    Returns:
+        str: A hex digest that changes whenever the chunker configuration changes.
     """
-    faiss_index = faiss.IndexFlatL2(dimension)
-    
-    if os.path.exists("./storage"):
-        vector_store = FaissVectorStore.from_persist_dir("./storage")
-        storage_context = StorageContext.from_defaults(
+    config = []
+    for component in transformation or []:
+        try:
+            config.append(component.to_dict())
+        except Exception:
+            config.append(repr(component))
+    payload = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def file_key(document: Document) -> str:
+    """
+    Return the source file a document was read from.
+
+    Args:
+        document (Document): A document returned by data_loader or iter_data.
+
+    Returns:
+        str: The file path, or the document id if the path is unknown.
+    """
+    return document.metadata.get('file_path', document.doc_id)
+
+def file_fingerprint(key: str, documents: List[Document], config: str) -> Dict[str, Any]:
+    """
+    Fingerprint one source file.
+
+    A file's fingerprint covers its path, the content hash of every document
+    read from it and the chunker configuration.
+
+    Args:
+        key (str): The file path.
+        documents (List[Document]): The documents read from the file.
+        config (str): The transformation fingerprint.
+
+    Returns:
+        Dict[str, Any]: The file's hash and document ids.
+    """
+    digest = hashlib.sha256(f"{key}\0{config}".encode("utf-8"))
+    for document in sorted(documents, key=lambda d: d.doc_id):
+        digest.update(f"\0{document.doc_id}\0{document.hash}".encode("utf-8"))
+    return {"hash": digest.hexdigest(), "doc_ids": [d.doc_id for d in documents]}
+
+def load_manifest(persist_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Load the ingestion manifest stored next to the index.
+
+    Args:
+        persist_dir (str): The storage directory.
+
+    Returns:
+        Optional[Dict[str, Any]]: The manifest, or None if the store has none.
+    """
+    path = os.path.join(persist_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(persist_dir: str, manifest: Dict[str, Any]) -> None:
+    """
+    Atomically write the ingestion manifest next to the index.
+
+    Args:
+        persist_dir (str): The storage directory.
+        manifest (Dict[str, Any]): The manifest to write.
+    """
+    path = os.path.join(persist_dir, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def _is_built(persist_dir: str) -> bool:
+    """
+    Whether persist_dir holds a complete store.
+
+    The manifest is written last, so a build that failed part-way (leaving only the
+    SQLite store or the vector file behind) is not mistaken for a store to load.
+    Stores persisted before manifests existed are recognised by their vector store
+    file, which StorageContext.persist writes last.
+    """
+    vector_store_file = f"{DEFAULT_VECTOR_STORE}{NAMESPACE_SEP}{DEFAULT_PERSIST_FNAME}"
+    return (os.path.exists(os.path.join(persist_dir, MANIFEST_FILE))
+            or os.path.exists(os.path.join(persist_dir, vector_store_file)))
+
+def _remove_partial_build(persist_dir: str) -> None:
+    """
+    Remove what a failed build left in persist_dir, so a fresh build does not pick up
+    its nodes (the SQLite store), vectors or side indexes.
+    """
+    for name in (SQLITE_FILE, f"{SQLITE_FILE}-wal", f"{SQLITE_FILE}-shm", VECTORS_FILE, f"{VECTORS_FILE}.ids.npy"):
+        path = os.path.join(persist_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+    for name in (SHARD_DIR, BM25_DIR, METADATA_DIR, HIERARCHY_DIR):
+        shutil.rmtree(os.path.join(persist_dir, name), ignore_errors=True)
+
+def _delete_document(index: FaissIndex, doc_id: str, sidecars: Iterable[Any] = ()) -> None:
+    """
+    Delete every node of a document from the Faiss index, the id map, the docstore
+    and the side indexes (BM25, metadata, hierarchy).
+
+    VectorStoreIndex.delete_ref_doc assumes the vector store can resolve ref doc ids,
+    which Faiss cannot, so the node ids are looked up in the docstore instead.
+    """
+    ref_doc_info = index.docstore.get_ref_doc_info(doc_id)
+    if ref_doc_info is None:
+        return
+    index.vector_store.delete_nodes(ref_doc_info.node_ids)
+    for sidecar in sidecars:
+        sidecar.remove(ref_doc_info.node_ids)
+    index.id_map.remove(str(node_id_to_faiss_id(node_id)) for node_id in ref_doc_info.node_ids)
+    index.docstore.delete_ref_doc(doc_id, raise_error=False)
+
+def _node_batches(documents: Iterable[Document], transformation: Optional[List], config: str,
+                  old_files: Dict[str, Dict[str, Any]], files: Dict[str, Dict[str, Any]],
+                  on_stale: Callable[[str], None], batch_size: int,
+                  show_progress: bool) -> Iterator[List[BaseNode]]:
+    """
+    Lazily chunk new and changed files into batches of at most `batch_size` nodes.
+
+    Documents are consumed one file at a time (data_loader and iter_data yield a
+    file's documents contiguously) and only pulled once the previous batch has been
+    inserted, so memory stays bounded by the batch size. Fingerprints of every file
+    seen are recorded into `files`; `on_stale` is called for files whose previous
+    version must be removed first.
+    """
+    transformations = transformation or Settings.transformations
+    pending_docs: List[Document] = []
+    pending: List[BaseNode] = []
+    chunked = 0
+    progress = tqdm(desc="Ingesting", unit="file", disable=not show_progress)
+
+    def chunk() -> None:
+        nonlocal chunked
+        nodes = run_transformations(pending_docs, transformations)
+        pending_docs.clear()
+        chunked += len(nodes)
+        progress.set_postfix(nodes=chunked)
+        pending.extend(nodes)
+
+    for key, group in groupby(documents, key=file_key):
+        docs = list(group)
+        entry = file_fingerprint(key, docs, config)
+        files[key] = entry
+        progress.update(1)
+        old = old_files.get(key)
+        if old is not None and old["hash"] == entry["hash"]:
+            continue
+        if old is not None:
+            on_stale(key)
+        # Chunk several files at once so a ParallelChunker has documents to shard and
+        # the semantic parser embeds their sentences in one batch.
+        pending_docs.extend(docs)
+        if len(pending_docs) >= CHUNK_BATCH_SIZE:
+            chunk()
+        while len(pending) >= batch_size:
+            yield pending[:batch_size]
+            pending = pending[batch_size:]
+    if pending_docs:
+        chunk()
+    while pending:
+        yield pending[:batch_size]
+        pending = pending[batch_size:]
+    progress.close()
+
+def _ingest(index: FaissIndex, batches: Iterator[List[BaseNode]], sidecars: Iterable[Any] = (),
+            hierarchy: Optional[HierarchyIndex] = None) -> int:
+    """
+    Embed and insert node batches into the index and the side indexes (BM25, metadata).
+
+    Only leaf nodes are embedded and indexed; the parents of hierarchical chunks go to
+    the docstore only, and every node is linked into the hierarchy index.
+
+    Returns:
+        int: The number of nodes inserted.
+    """
+    inserted = 0
+    for nodes in batches:
+        leaves = [node for node in nodes if is_leaf(node)]
+        if len(leaves) < len(nodes):
+            index.docstore.add_documents([node for node in nodes if not is_leaf(node)], allow_update=True)
+        index.insert_nodes(leaves)
+        for sidecar in sidecars:
+            sidecar.add(leaves)
+        if hierarchy is not None:
+            hierarchy.add(nodes)
+        inserted += len(nodes)
+    return inserted
+
+def _train_index(batches: Iterator[List[BaseNode]], dimension: int, index_type: IndexType, metric: Metric,
+                 **kwargs: Any) -> Tuple[Any, List[BaseNode]]:
+    """
+    Train a Faiss index on the embeddings of the first `train_size` nodes of the stream.
+
+    Returns:
+        Tuple[faiss.Index, List[BaseNode]]: The trained index and the embedded nodes
+        consumed for training, still to be inserted.
+    """
+    train_size = kwargs.get('train_size') or DEFAULT_TRAIN_SIZE
+    nodes: List[BaseNode] = []
+    for batch in batches:
+        nodes.extend(batch)
+        if len(nodes) >= train_size:
+            break
+    leaves = [node for node in nodes if is_leaf(node)]
+    embeddings = embed_nodes(leaves, Settings.embed_model)
+    for node in leaves:
+        node.embedding = embeddings[node.node_id]
+    matrix = np.array([node.embedding for node in leaves], dtype="float32")
+    return build_faiss_index(dimension, index_type, metric, embeddings=matrix, **kwargs), nodes
+
+def _check_manifest(manifest: Dict[str, Any], persist_dir: str, index_type: IndexType, metric: Metric,
+                    mmap: bool, num_shards: int) -> None:
+    """
+    Raise if a stored index was built with a different index type, metric, layout or shard count.
+    """
+    stored = (manifest.get("index_type", 'flat'), manifest.get("metric", 'l2'))
+    if stored != (index_type, metric):
+        raise ValueError(f"Stored index at {persist_dir} is {stored[0]}/{stored[1]}, "
+                         f"expected {index_type}/{metric}; remove it to rebuild")
+    if manifest.get("mmap", False) != mmap:
+        raise ValueError(f"Stored index at {persist_dir} was built with mmap={not mmap}; remove it to rebuild")
+    if manifest.get("num_shards", 1) != num_shards:
+        raise ValueError(f"Stored index at {persist_dir} has {manifest.get('num_shards', 1)} shards, "
+                         f"expected {num_shards}; remove it to rebuild")
+
+def _storage_context(vector_store: Any, persist_dir: str, mmap: bool,
+                     load: bool) -> StorageContext:
+    """
+    Create the storage context for the JSON or the SQLite (mmap) layout.
+    """
+    if mmap:
+        docstore, index_store = sqlite_stores(persist_dir)
+        return StorageContext.from_defaults(
             vector_store=vector_store,
-            persist_dir="./storage"
+            docstore=docstore,
+            index_store=index_store
         )
-        index = load_index_from_storage(storage_context=storage_context)
-    else:
-        vector_store = FaissVectorStore(faiss_index=faiss_index)
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
-        index = VectorStoreIndex.from_documents(
-            documents, 
-            transformations=transformation,
-            storage_context=storage_context
+    if load:
+        return StorageContext.from_defaults(
+            vector_store=vector_store,
+            persist_dir=persist_dir
         )
-        index.storage_context.persist()
+    return StorageContext.from_defaults(vector_store=vector_store)
+
+def _manifest(dimension: int, config: str, index_type: IndexType, metric: Metric, mmap: bool,
+              num_shards: int, files: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    return {"dimension": dimension, "transformation": config, "index_type": index_type,
+            "metric": metric, "mmap": mmap, "num_shards": num_shards, "files": files}
+
+def Faiss(documents: Iterable[Document], dimension: int, transformation: Optional[List] = None,
+          persist_dir: str = "./storage", incremental: bool = False, index_type: IndexType = 'flat',
+          metric: Metric = 'l2', mmap: bool = False, bm25: bool = False, num_shards: int = 1,
+          metadata_index: bool = False, **kwargs: Any) -> Tuple[VectorStoreIndex, Any]:
+    """
+    Create or load a Faiss vector database index.
+
+    Args:
+        documents (Iterable[Document]): The documents to be indexed, e.g. from data_loader or iter_data.
+        dimension (int): The dimension of the vector space.
+        transformation (Optional[List]): A list of transformations to apply to the documents.
+        persist_dir (str): The directory the index is persisted to.
+        incremental (bool): Whether to sync an existing store with `documents` (new, changed and removed files).
+        index_type (IndexType): The Faiss index type.
+        metric (Metric): The distance metric; use 'ip' or 'cosine' for bge embeddings.
+        mmap (bool): Whether to keep nodes in SQLite and memory-map the index read-only.
+        bm25 (bool): Whether to maintain a persisted BM25 index alongside the vector index.
+        num_shards (int): The number of vector index shards.
+        metadata_index (bool): Whether to maintain a metadata index for filtered retrieval.
+        **kwargs: Arbitrary keyword arguments for the index.
+            nlist (int): The number of inverted lists (IVF types).
+            M (int): The number of HNSW neighbours per node.
+            pq_m (int): The number of PQ sub-quantizers.
+            train_size (int): The number of leading vectors used for training.
+            batch_size (int): The number of nodes chunked, embedded and inserted at a time.
+            show_progress (bool): Whether to report ingestion progress.
+            shard_executor (ShardExecutor): 'thread' (default) or 'process' shard search workers.
+            rescore_factor (int): The candidate multiplier for exact rescoring of compact
+                types (defaults to 4, or 32 for 'binary'; 0 disables rescoring).
+
+    Returns:
+        Tuple[VectorStoreIndex, Any]: The index and its docstore.
+
+    Raises:
+        ValueError: If an existing store does not match `dimension`, `transformation`,
+            `index_type`, `metric`, `mmap` or `num_shards` and cannot be updated in place.
+    """
+    config = transformation_fingerprint(transformation)
+    files: Dict[str, Dict[str, Any]] = {}
+    batch_size = kwargs.get('batch_size') or DEFAULT_BATCH_SIZE
+    show_progress = kwargs.get('show_progress', False)
+    shard_executor: ShardExecutor = kwargs.get('shard_executor', 'thread')
+    rescore_factor = kwargs.get('rescore_factor',
+                                BINARY_RESCORE_FACTOR if index_type == 'binary' else DEFAULT_RESCORE_FACTOR)
+    exact_path = os.path.join(persist_dir, VECTORS_FILE)
+    rescored = index_type in COMPACT_TYPES and num_shards == 1
+
+    if _is_built(persist_dir):
+        manifest = load_manifest(persist_dir)
+        if manifest is not None:
+            _check_manifest(manifest, persist_dir, index_type, metric, mmap, num_shards)
+        if num_shards > 1:
+            # Ingestion needs writable shards; worker processes take over once it is persisted.
+            vector_store = ShardedFaissVectorStore.from_persist_dir(
+                persist_dir, num_shards, mmap=mmap and not incremental,
+                executor=shard_executor if not incremental else 'thread')
+        else:
+            vector_store = FaissIDMapVectorStore.from_persist_dir(persist_dir, mmap=mmap and not incremental)
+            if rescored:
+                vector_store.enable_rescoring(ExactVectorFile(exact_path, dimension), rescore_factor)
+        vector_store.normalize = metric == 'cosine'
+        stored_dimension = vector_store.dimension if num_shards > 1 else vector_store.client.d
+        if stored_dimension != dimension:
+            raise ValueError(f"Stored index at {persist_dir} has dimension {stored_dimension}, "
+                             f"expected {dimension}")
+        storage_context = _storage_context(vector_store, persist_dir, mmap, load=True)
+        index = FaissIndex(index_struct=storage_context.index_store.get_index_struct(),
+                           storage_context=storage_context)
+        sidecars: Dict[str, Any] = {}
+        for enabled, name, cls in ((bm25, BM25_DIR, BM25Index), (metadata_index, METADATA_DIR, MetadataIndex)):
+            sidecar_dir = os.path.join(persist_dir, name)
+            if enabled and os.path.exists(sidecar_dir):
+                sidecars[name] = cls.load(sidecar_dir, mmap=not incremental)
+            elif enabled:
+                sidecars[name] = cls.from_nodes([node for node in index.docstore.docs.values() if is_leaf(node)])
+                sidecars[name].persist(sidecar_dir)
+        vector_store.enable_filtering(sidecars.get(METADATA_DIR))
+        hierarchy_dir = os.path.join(persist_dir, HIERARCHY_DIR)
+        hierarchy = None
+        if os.path.exists(hierarchy_dir):
+            hierarchy = HierarchyIndex.load(hierarchy_dir, mmap=not incremental)
+        elif is_hierarchical(transformation or Settings.transformations):
+            hierarchy = HierarchyIndex.from_nodes(list(index.docstore.docs.values()))
+            hierarchy.persist(hierarchy_dir)
+        removable = [*sidecars.values(), hierarchy] if hierarchy is not None else list(sidecars.values())
+
+        if incremental:
+            if manifest is None or not is_id_mapped(vector_store.client):
+                raise ValueError(f"Stored index at {persist_dir} predates incremental ingestion; "
+                                 "remove it to rebuild")
+            old_files = manifest["files"]
+
+            def remove_file(key: str) -> None:
+                for doc_id in old_files[key]["doc_ids"]:
+                    _delete_document(index, doc_id, removable)
+
+            inserted = _ingest(index, _node_batches(documents, transformation, config, old_files, files,
+                                                    remove_file, batch_size, show_progress),
+                               sidecars.values(), hierarchy)
+            removed = [key for key in old_files if key not in files]
+            for key in removed:
+                remove_file(key)
+            if removed or inserted:
+                index.storage_context.persist(persist_dir=persist_dir)
+                for name, sidecar in sidecars.items():
+                    sidecar.persist(os.path.join(persist_dir, name))
+                if hierarchy is not None:
+                    hierarchy.persist(hierarchy_dir)
+            save_manifest(persist_dir, _manifest(dimension, config, index_type, metric, mmap, num_shards, files))
+            if num_shards > 1:
+                vector_store.use_executor(shard_executor)
+        elif manifest is not None and manifest["transformation"] != config:
+            raise ValueError(f"Stored index at {persist_dir} was built with a different transformation; "
+                             "pass incremental=True to re-ingest")
+        return index, storage_context.docstore
+
+    if os.path.exists(persist_dir):
+        _remove_partial_build(persist_dir)
+    batches = _node_batches(documents, transformation, config, {}, files, lambda key: None,
+                            batch_size, show_progress)
+    if index_type in ('flat', 'hnsw', 'fp16'):
+        faiss_index, nodes = build_faiss_index(dimension, index_type, metric, **kwargs), []
+    else:
+        # IVF, SQ8 and binary types must be trained before the first add.
+        faiss_index, nodes = _train_index(batches, dimension, index_type, metric, **kwargs)
+    if num_shards > 1:
+        vector_store = ShardedFaissVectorStore.from_template(faiss_index, num_shards, normalize=metric == 'cosine')
+    else:
+        vector_store = FaissIDMapVectorStore(faiss_index=faiss_index, normalize=metric == 'cosine',
+                                             exact=ExactVectorFile(exact_path, dimension) if rescored else None,
+                                             rescore_factor=rescore_factor)
+    storage_context = _storage_context(vector_store, persist_dir, mmap, load=False)
+    index = FaissIndex([], storage_context=storage_context)
+    sidecars = {name: cls() for enabled, name, cls in
+                ((bm25, BM25_DIR, BM25Index), (metadata_index, METADATA_DIR, MetadataIndex)) if enabled}
+    hierarchy = HierarchyIndex() if is_hierarchical(transformation or Settings.transformations) else None
+    vector_store.enable_filtering(sidecars.get(METADATA_DIR))
+    _ingest(index, chain([nodes], batches) if nodes else batches, sidecars.values(), hierarchy)
+    index.storage_context.persist(persist_dir=persist_dir)
+    for name, sidecar in sidecars.items():
+        sidecar.persist(os.path.join(persist_dir, name))
+    if hierarchy is not None:
+        hierarchy.persist(os.path.join(persist_dir, HIERARCHY_DIR))
+    save_manifest(persist_dir, _manifest(dimension, config, index_type, metric, mmap, num_shards, files))
+    if num_shards > 1:
+        vector_store.use_executor(shard_executor)
     
-    return index, storage_context.docstore
\ No newline at end of file
+    return index, storage_context.docstore
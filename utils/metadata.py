@@ -0,0 +1,411 @@
+import os
+import json
+import operator
+import threading
+from itertools import count
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import FilterCondition, FilterOperator, MetadataFilter, MetadataFilters
+from .vector_store import Selection, document_key, node_id_to_faiss_id
+
+METADATA_DIR = "metadata"
+MAX_VALUE_LENGTH = 256
+MAX_SELECTIONS = 64
+
+_versions = count(1)
+
+
+def new_version() -> int:
+    """
+    Return a process-wide unique version number for the state of a mutable index.
+    """
+    return next(_versions)
+
+_RANGE_OPERATORS: Dict[FilterOperator, Callable[[Any, Any], bool]] = {
+    FilterOperator.GT: operator.gt,
+    FilterOperator.GTE: operator.ge,
+    FilterOperator.LT: operator.lt,
+    FilterOperator.LTE: operator.le,
+}
+
+
+def to_filters(filters: Union[MetadataFilters, MetadataFilter, Dict[str, Any], None]) -> Optional[MetadataFilters]:
+    """
+    Normalize a filter expression.
+
+    A dict is shorthand for an AND of equalities, with list values meaning "any of",
+    e.g. `{"file_name": ["a.pdf", "b.pdf"], "year": 2024}`.
+
+    Args:
+        filters (Union[MetadataFilters, MetadataFilter, Dict[str, Any], None]): The filters.
+
+    Returns:
+        Optional[MetadataFilters]: The filters, or None if none were given.
+    """
+    if filters is None or isinstance(filters, MetadataFilters):
+        return filters
+    if isinstance(filters, MetadataFilter):
+        return MetadataFilters(filters=[filters])
+    return MetadataFilters(filters=[
+        MetadataFilter(key=key, value=value,
+                       operator=FilterOperator.IN if isinstance(value, list) else FilterOperator.EQ)
+        for key, value in filters.items()
+    ])
+
+
+class MetadataIndex:
+    """
+    A persisted, incrementally updatable index of node metadata for pre-filtering.
+
+    Every scalar metadata value (and every element of a list value, e.g. tags) gets a
+    posting list of node slots, kept as CSR arrays like BM25Index. A filter expression
+    (llama-index MetadataFilters) is evaluated into a bitmap over the slots by combining
+    the bitmaps of its values, and turned into the Faiss ids or node ids the searches
+    are restricted to. Long string values (such as sentence windows) are not indexed.
+    Values are told apart by type as well, so True and 1 are different values.
+
+    The selections of recent filters are cached until the index changes; every change
+    takes a new `version`.
+
+    Attributes:
+        fields (Optional[List[str]]): The indexed fields (None indexes every field).
+        node_ids (List[str]): The node id of each slot.
+        faiss_ids (np.ndarray): The Faiss id of each slot.
+        doc_keys (Optional[np.ndarray]): The document key of each slot, which decides its shard.
+        version (int): A number that changes whenever the index does.
+    """
+
+    def __init__(self, fields: Optional[List[str]] = None, max_value_length: int = MAX_VALUE_LENGTH):
+        """
+        Create an empty metadata index.
+
+        Args:
+            fields (Optional[List[str]]): The fields to index (None indexes every field).
+            max_value_length (int): Longer string values are not indexed.
+        """
+        self.fields = fields
+        self.max_value_length = max_value_length
+        self.node_ids: List[str] = []
+        self.faiss_ids = np.zeros(0, dtype="int64")
+        self.doc_keys: Optional[np.ndarray] = np.zeros(0, dtype="int64")
+        self.alive = np.zeros(0, dtype=bool)
+        self.keys: List[Tuple[str, Any]] = []
+        self.indptr = np.zeros(1, dtype="int64")
+        self.slots = np.zeros(0, dtype="int32")
+        self.version = new_version()
+        self._values: Dict[str, Dict[Tuple[type, Any], int]] = {}
+        self._slots: Dict[str, int] = {}
+        self._delta: Dict[int, List[int]] = {}
+        self._alignment: Optional[Tuple[Tuple[int, int], np.ndarray]] = None
+        self._selections: Dict[Tuple[str, int], Selection] = {}
+        self._selections_version = self.version
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _key_id(self, field: str, value: Any) -> int:
+        values = self._values.setdefault(field, {})
+        key_id = values.get((type(value), value))
+        if key_id is None:
+            key_id = values[(type(value), value)] = len(self.keys)
+            self.keys.append((field, value))
+        return key_id
+
+    def _lookup(self, field: str, targets: Sequence[Any]) -> List[int]:
+        values = self._values.get(field, {})
+        key_ids = (values.get((type(target), target)) for target in targets)
+        return [key_id for key_id in key_ids if key_id is not None]
+
+    def add(self, nodes: Sequence[BaseNode]) -> None:
+        """
+        Index the metadata of nodes, replacing any previous version with the same node id.
+
+        Args:
+            nodes (Sequence[BaseNode]): The nodes to index.
+        """
+        self.remove([node.node_id for node in nodes if node.node_id in self._slots])
+        for node in nodes:
+            slot = len(self.node_ids)
+            for field, value in node.metadata.items():
+                if self.fields is not None and field not in self.fields:
+                    continue
+                for item in value if isinstance(value, (list, tuple, set)) else [value]:
+                    if not isinstance(item, (str, int, float, bool)):
+                        continue
+                    if isinstance(item, str) and len(item) > self.max_value_length:
+                        continue
+                    self._delta.setdefault(self._key_id(field, item), []).append(slot)
+            self.node_ids.append(node.node_id)
+            self._slots[node.node_id] = slot
+        self.faiss_ids = np.concatenate([self.faiss_ids, np.array(
+            [node_id_to_faiss_id(node.node_id) for node in nodes], dtype="int64")])
+        if self.doc_keys is not None:
+            self.doc_keys = np.concatenate([self.doc_keys, np.array(
+                [document_key(node) for node in nodes], dtype="int64")])
+        self.alive = np.concatenate([self.alive, np.ones(len(nodes), dtype=bool)])
+        self.version = new_version()
+
+    def remove(self, node_ids: Sequence[str]) -> None:
+        """
+        Remove nodes from the index; unknown node ids are ignored.
+
+        Args:
+            node_ids (Sequence[str]): The node ids to remove.
+        """
+        for node_id in node_ids:
+            slot = self._slots.pop(node_id, None)
+            if slot is not None:
+                self.alive[slot] = False
+                self.version = new_version()
+
+    def _postings(self, key_id: int) -> np.ndarray:
+        if key_id + 1 < len(self.indptr):
+            slots = self.slots[self.indptr[key_id]:self.indptr[key_id + 1]]
+        else:
+            slots = self.slots[:0]
+        delta = self._delta.get(key_id)
+        if delta:
+            slots = np.concatenate([slots, np.array(delta, dtype="int32")])
+        return slots
+
+    def _bitmap(self, key_ids: Sequence[int]) -> np.ndarray:
+        bitmap = np.zeros(len(self.node_ids), dtype=bool)
+        for key_id in key_ids:
+            bitmap[self._postings(key_id)] = True
+        return bitmap
+
+    def _match(self, filter_: MetadataFilter) -> np.ndarray:
+        values = self._values.get(filter_.key, {})
+        op, target = filter_.operator, filter_.value
+        if op in (FilterOperator.EQ, FilterOperator.CONTAINS):
+            return self._bitmap(self._lookup(filter_.key, [target]))
+        if op in (FilterOperator.IN, FilterOperator.ANY):
+            return self._bitmap(self._lookup(filter_.key, target))
+        if op == FilterOperator.ALL:
+            bitmap = np.ones(len(self.node_ids), dtype=bool)
+            for v in target:
+                bitmap &= self._bitmap(self._lookup(filter_.key, [v]))
+            return bitmap
+        if op == FilterOperator.NE:
+            return ~self._bitmap(self._lookup(filter_.key, [target]))
+        if op == FilterOperator.NIN:
+            return ~self._bitmap(self._lookup(filter_.key, target))
+        if op in _RANGE_OPERATORS:
+            compare = _RANGE_OPERATORS[op]
+            matching = []
+            for (_, value), key_id in values.items():
+                try:
+                    if compare(value, target):
+                        matching.append(key_id)
+                except TypeError:
+                    continue
+            return self._bitmap(matching)
+        if op in (FilterOperator.TEXT_MATCH, FilterOperator.TEXT_MATCH_INSENSITIVE):
+            fold = str.lower if op == FilterOperator.TEXT_MATCH_INSENSITIVE else str
+            return self._bitmap([key_id for (_, value), key_id in values.items()
+                                 if isinstance(value, str) and fold(target) in fold(value)])
+        if op == FilterOperator.IS_EMPTY:
+            return ~self._bitmap([key_id for (_, value), key_id in values.items() if value != ""])
+        raise ValueError(f"Unsupported metadata filter operator: {op}")
+
+    def mask(self, filters: Union[MetadataFilters, MetadataFilter]) -> np.ndarray:
+        """
+        Evaluate a filter expression into a bitmap over the slots.
+
+        Args:
+            filters (Union[MetadataFilters, MetadataFilter]): The filter expression; nested
+                MetadataFilters are supported.
+
+        Returns:
+            np.ndarray: True for the live slots matching the expression.
+
+        Raises:
+            ValueError: If an operator or condition is not supported.
+        """
+        if isinstance(filters, MetadataFilter):
+            return self._match(filters) & self.alive
+        masks = [self.mask(f) for f in filters.filters]
+        if not masks:
+            return self.alive.copy()
+        condition = filters.condition or FilterCondition.AND
+        if condition == FilterCondition.AND:
+            result = np.logical_and.reduce(masks)
+        elif condition == FilterCondition.OR:
+            result = np.logical_or.reduce(masks)
+        elif condition == FilterCondition.NOT:
+            result = ~np.logical_or.reduce(masks)
+        else:
+            raise ValueError(f"Unsupported metadata filter condition: {condition}")
+        return result & self.alive
+
+    def select(self, filters: Union[MetadataFilters, MetadataFilter]) -> np.ndarray:
+        """
+        Return the Faiss ids of the nodes matching a filter expression.
+
+        Args:
+            filters (Union[MetadataFilters, MetadataFilter]): The filter expression.
+
+        Returns:
+            np.ndarray: The matching Faiss ids.
+        """
+        return self.faiss_ids[self.mask(filters)]
+
+    def selection(self, filters: Union[MetadataFilters, MetadataFilter], num_shards: int = 1) -> Selection:
+        """
+        Return the Faiss ids matching a filter expression, split by shard.
+
+        The ids of a node go to the shard of its document, like `shard_of`. Selections are
+        cached per filter expression until the index changes, together with their selectors.
+
+        Args:
+            filters (Union[MetadataFilters, MetadataFilter]): The filter expression.
+            num_shards (int): The number of shards.
+
+        Returns:
+            Selection: The matching Faiss ids of each shard.
+        """
+        key = (filters.model_dump_json(), num_shards)
+        with self._lock:
+            if self._selections_version != self.version:
+                self._selections, self._selections_version = {}, self.version
+            cached = self._selections.get(key)
+        if cached is not None:
+            return cached
+        mask = self.mask(filters)
+        ids = self.faiss_ids[mask]
+        if num_shards == 1:
+            parts = [ids]
+        elif self.doc_keys is None:
+            # Indexes persisted without document keys cannot tell the shards apart.
+            parts = [ids] * num_shards
+        else:
+            shards = self.doc_keys[mask] % num_shards
+            parts = [ids[shards == i] for i in range(num_shards)]
+        selection = Selection(parts)
+        with self._lock:
+            if self._selections_version == self.version:
+                if len(self._selections) >= MAX_SELECTIONS:
+                    self._selections.pop(next(iter(self._selections)))
+                self._selections[key] = selection
+        return selection
+
+    def align(self, node_ids: List[str], version: int) -> np.ndarray:
+        """
+        Map another index's slots (e.g. BM25's) to slots of this index, caching the result.
+
+        Args:
+            node_ids (List[str]): The node id of each slot of the other index.
+            version (int): The version of the other index; the cached alignment is reused
+                while neither index changes.
+
+        Returns:
+            np.ndarray: The slot here of each entry (-1 for unknown node ids).
+        """
+        key = (version, self.version)
+        cached = self._alignment
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        alignment = np.array([self._slots.get(node_id, -1) for node_id in node_ids], dtype="int64")
+        self._alignment = (key, alignment)
+        return alignment
+
+    def compact(self) -> None:
+        """
+        Merge the in-memory delta into the posting arrays and drop removed slots.
+        """
+        live_slots = np.flatnonzero(self.alive)
+        remap = np.full(len(self.node_ids), -1, dtype="int64")
+        remap[live_slots] = np.arange(len(live_slots))
+
+        counts = np.zeros(len(self.keys), dtype="int64")
+        parts = []
+        for key_id in range(len(self.keys)):
+            slots = remap[self._postings(key_id)]
+            slots = np.unique(slots[slots >= 0]).astype("int32")
+            parts.append(slots)
+            counts[key_id] = len(slots)
+
+        self.indptr = np.concatenate([[0], np.cumsum(counts)]).astype("int64")
+        self.slots = np.concatenate(parts) if parts else np.zeros(0, dtype="int32")
+        self.node_ids = [self.node_ids[i] for i in live_slots]
+        self.faiss_ids = np.asarray(self.faiss_ids[live_slots], dtype="int64")
+        if self.doc_keys is not None:
+            self.doc_keys = np.asarray(self.doc_keys[live_slots], dtype="int64")
+        self.alive = np.ones(len(live_slots), dtype=bool)
+        self._slots = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self._delta = {}
+        self.version = new_version()
+
+    def persist(self, persist_dir: str) -> None:
+        """
+        Compact the index and save it to a directory.
+
+        Args:
+            persist_dir (str): The directory to save to.
+        """
+        self.compact()
+        os.makedirs(persist_dir, exist_ok=True)
+        for name in ("indptr", "slots", "faiss_ids", "doc_keys"):
+            if getattr(self, name) is None:
+                continue
+            tmp_path = os.path.join(persist_dir, f"{name}.tmp.npy")
+            np.save(tmp_path, getattr(self, name))
+            os.replace(tmp_path, os.path.join(persist_dir, f"{name}.npy"))
+        meta = {"fields": self.fields, "max_value_length": self.max_value_length,
+                "keys": self.keys, "node_ids": self.node_ids}
+        tmp_path = os.path.join(persist_dir, "meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(persist_dir, "meta.json"))
+
+    @classmethod
+    def load(cls, persist_dir: str, mmap: bool = True) -> "MetadataIndex":
+        """
+        Load an index saved with `persist`.
+
+        Args:
+            persist_dir (str): The directory to load from.
+            mmap (bool): Whether to memory-map the posting arrays.
+
+        Returns:
+            MetadataIndex: The loaded index.
+
+        Raises:
+            FileNotFoundError: If no index exists in persist_dir.
+        """
+        meta_path = os.path.join(persist_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"No metadata index found at {persist_dir}")
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        index = cls(fields=meta["fields"], max_value_length=meta["max_value_length"])
+        index.node_ids = meta["node_ids"]
+        index._slots = {node_id: i for i, node_id in enumerate(index.node_ids)}
+        for field, value in meta["keys"]:
+            index._key_id(field, value)
+        mmap_mode = "r" if mmap else None
+        for name in ("indptr", "slots", "faiss_ids"):
+            setattr(index, name, np.load(os.path.join(persist_dir, f"{name}.npy"), mmap_mode=mmap_mode))
+        doc_keys_path = os.path.join(persist_dir, "doc_keys.npy")
+        index.doc_keys = np.load(doc_keys_path, mmap_mode=mmap_mode) if os.path.exists(doc_keys_path) else None
+        index.alive = np.ones(len(index.node_ids), dtype=bool)
+        return index
+
+    @classmethod
+    def from_nodes(cls, nodes: Sequence[BaseNode], **kwargs: Any) -> "MetadataIndex":
+        """
+        Build an index over nodes.
+
+        Args:
+            nodes (Sequence[BaseNode]): The nodes to index.
+            **kwargs: Arbitrary keyword arguments passed to the constructor.
+
+        Returns:
+            MetadataIndex: The index.
+        """
+        index = cls(**kwargs)
+        index.add(nodes)
+        return index
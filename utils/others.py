@@ -1,25 +1,214 @@
 from llama_index.core.retrievers import (
     QueryFusionRetriever
 )
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import asyncio
+import contextvars
+import logging
+import time
+import numpy as np
+from .retriever import retrieve_batch
+from .tracing import span, count
 
-from typing import List, Any
+from typing import List, Any, Literal, Optional, Union, Dict
 
-def fusion_retriever(top_k: int, retrievers: List[Any], weights: List[float]) -> QueryFusionRetriever:
+FusionMode = Literal['relative_score', 'dist_based_score', 'reciprocal_rerank']
+
+logger = logging.getLogger(__name__)
+
+
+def fuse_results(results: List[Optional[List[NodeWithScore]]], weights: List[float], mode: FusionMode,
+                 top_k: int) -> List[NodeWithScore]:
+    """
+    Fuse the ranked lists of several retrievers into one.
+
+    Scores are laid out in a (retrievers x unique nodes) matrix and normalized,
+    weighted and summed with NumPy. A missing list (None) is a retriever that timed
+    out or failed and contributes nothing.
+
+    Args:
+        results (List[Optional[List[NodeWithScore]]]): The results of each retriever.
+        weights (List[float]): The weight of each retriever.
+        mode (FusionMode): 'relative_score' (min-max), 'dist_based_score' (mean +/- 3 std)
+            or 'reciprocal_rerank' (weighted reciprocal rank fusion, k=60).
+        top_k (int): The number of fused results to return.
+
+    Returns:
+        List[NodeWithScore]: The fused results, best first.
+
+    Raises:
+        ValueError: If an invalid fusion mode is provided.
+    """
+    positions: Dict[str, int] = {}
+    nodes: List[NodeWithScore] = []
+    for result in results:
+        for node in result or []:
+            if node.node.node_id not in positions:
+                positions[node.node.node_id] = len(nodes)
+                nodes.append(node)
+    if not nodes:
+        return []
+
+    scores = np.full((len(results), len(nodes)), np.nan, dtype="float64")
+    ranks = np.full((len(results), len(nodes)), np.nan, dtype="float64")
+    for row, result in enumerate(results):
+        for rank, node in enumerate(sorted(result or [], key=lambda n: n.score or 0.0, reverse=True)):
+            col = positions[node.node.node_id]
+            if np.isnan(scores[row, col]):
+                scores[row, col] = node.score or 0.0
+                ranks[row, col] = rank
+    present = ~np.isnan(scores)
+    weight = np.asarray(weights, dtype="float64")[:, np.newaxis]
+
+    if mode == 'reciprocal_rerank':
+        fused = np.where(present, weight / (60.0 + ranks), 0.0).sum(axis=0)
+    elif mode in ('relative_score', 'dist_based_score'):
+        present_count = np.maximum(present.sum(axis=1, keepdims=True), 1)
+        values = np.where(present, scores, 0.0)
+        if mode == 'relative_score':
+            low = np.where(present, scores, np.inf).min(axis=1, keepdims=True)
+            high = np.where(present, scores, -np.inf).max(axis=1, keepdims=True)
+        else:
+            mean = values.sum(axis=1, keepdims=True) / present_count
+            std = np.sqrt(np.where(present, (scores - mean) ** 2, 0.0).sum(axis=1, keepdims=True) / present_count)
+            low, high = mean - 3 * std, mean + 3 * std
+        score_range = high - low
+        with np.errstate(invalid="ignore", divide="ignore"):
+            normalized = np.where(score_range > 0, (values - low) / np.where(score_range > 0, score_range, 1.0),
+                                  np.where(high > 0, 1.0, 0.0))
+        fused = np.where(present, normalized * weight, 0.0).sum(axis=0)
+    else:
+        raise ValueError(f"Invalid fusion mode: {mode}")
+
+    order = np.argsort(-fused, kind="stable")[:top_k]
+    return [NodeWithScore(node=nodes[i].node, score=float(fused[i])) for i in order]
+
+
+class ConcurrentFusionRetriever(BaseRetriever):
+    """
+    A fusion retriever that queries its member retrievers concurrently.
+
+    Each retriever runs in a thread pool (Faiss and BM25 release the GIL in their
+    hot loops), so end-to-end latency is that of the slowest retriever rather than
+    their sum. A retriever that misses its deadline or raises is skipped with a
+    warning and the fusion is computed from the others.
+
+    Attributes:
+        retrievers (List[Any]): The retrievers to fuse.
+        weights (List[float]): The weight of each retriever.
+        similarity_top_k (int): The number of fused results to return.
+        mode (FusionMode): The fusion mode.
+        timeouts (List[Optional[float]]): The deadline in seconds of each retriever (None waits forever).
+    """
+
+    def __init__(self, retrievers: List[Any], weights: List[float], similarity_top_k: int,
+                 mode: FusionMode = 'relative_score',
+                 timeout: Optional[Union[float, List[Optional[float]]]] = None, **kwargs: Any):
+        """
+        Initialize the ConcurrentFusionRetriever.
+
+        Args:
+            retrievers (List[Any]): The retrievers to fuse.
+            weights (List[float]): The weight of each retriever.
+            similarity_top_k (int): The number of fused results to return.
+            mode (FusionMode): The fusion mode.
+            timeout (Optional[Union[float, List[Optional[float]]]]): One deadline for all
+                retrievers or one per retriever, in seconds.
+        """
+        if len(weights) != len(retrievers):
+            raise ValueError("weights must have one entry per retriever")
+        self.retrievers = retrievers
+        self.weights = weights
+        self.similarity_top_k = similarity_top_k
+        self.mode = mode
+        self.timeouts = timeout if isinstance(timeout, list) else [timeout] * len(retrievers)
+        # Spare workers so a retriever stuck past its deadline does not block the next query.
+        self._executor = ThreadPoolExecutor(max_workers=2 * len(retrievers), thread_name_prefix="fusion")
+        super().__init__(**kwargs)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self.retrieve_batch([query_bundle])[0]
+
+    def retrieve_batch(self, query_bundles: List[QueryBundle]) -> List[List[NodeWithScore]]:
+        """
+        Retrieve nodes for several queries, running each member retriever's batch concurrently.
+
+        The deadline of each retriever applies to its whole batch.
+
+        Args:
+            query_bundles (List[QueryBundle]): The queries.
+
+        Returns:
+            List[List[NodeWithScore]]: The fused results of each query.
+        """
+        start = time.monotonic()
+        futures = [self._executor.submit(contextvars.copy_context().run, retrieve_batch, retriever, query_bundles)
+                   for retriever in self.retrievers]
+        batches: List[List[Optional[List[NodeWithScore]]]] = []
+        for i, (future, timeout) in enumerate(zip(futures, self.timeouts)):
+            remaining = None if timeout is None else max(0.0, start + timeout - time.monotonic())
+            try:
+                batches.append(future.result(timeout=remaining))
+            except FutureTimeoutError:
+                future.cancel()
+                logger.warning("Retriever %d missed its %.3fs deadline; fusing without it", i, timeout)
+                count("retriever_skipped", retriever=str(i), reason="timeout")
+                batches.append([None] * len(query_bundles))
+            except Exception as e:
+                logger.warning("Retriever %d failed (%s); fusing without it", i, e)
+                count("retriever_skipped", retriever=str(i), reason="error")
+                batches.append([None] * len(query_bundles))
+        with span("fusion", mode=self.mode, queries=len(query_bundles)):
+            return [fuse_results([batch[q] for batch in batches], self.weights, self.mode, self.similarity_top_k)
+                    for q in range(len(query_bundles))]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        async def run(i: int, retriever: Any) -> Optional[List[NodeWithScore]]:
+            try:
+                return await asyncio.wait_for(retriever.aretrieve(query_bundle), timeout=self.timeouts[i])
+            except asyncio.TimeoutError:
+                logger.warning("Retriever %d missed its %.3fs deadline; fusing without it", i, self.timeouts[i])
+            except Exception as e:
+                logger.warning("Retriever %d failed (%s); fusing without it", i, e)
+            return None
+
+        results = await asyncio.gather(*(run(i, retriever) for i, retriever in enumerate(self.retrievers)))
+        return fuse_results(list(results), self.weights, self.mode, self.similarity_top_k)
+
+
+def fusion_retriever(top_k: int, retrievers: List[Any], weights: List[float], mode: FusionMode = 'relative_score',
+                     timeout: Optional[Union[float, List[Optional[float]]]] = None,
+                     concurrent: bool = True) -> Union[ConcurrentFusionRetriever, QueryFusionRetriever]:
         """
-        Create a QueryFusionRetriever with the provided parameters.
+        Create a fusion retriever with the provided parameters.
 
         Args:
             top_k (int): The number of top results to retrieve.
             retrievers (List[Any]): A list of retrievers to fuse.
             weights (List[float]): A list of weights for each retriever.
+            mode (FusionMode): The fusion mode.
+            timeout (Optional[Union[float, List[Optional[float]]]]): The deadline of each retriever
+                in seconds; a retriever that misses it is left out of the fusion.
+            concurrent (bool): Whether to query the retrievers concurrently; False returns the
+                sequential QueryFusionRetriever.
 
         Returns:
-            QueryFusionRetriever: A configured QueryFusionRetriever object.
+            Union[ConcurrentFusionRetriever, QueryFusionRetriever]: A configured fusion retriever.
         """
+        if concurrent:
+            return ConcurrentFusionRetriever(
+                retrievers=retrievers,
+                weights=weights,
+                similarity_top_k=top_k,
+                mode=mode,
+                timeout=timeout
+            )
         return QueryFusionRetriever(
             retrievers=retrievers,
             retriever_weights=weights,
             similarity_top_k=top_k,
             num_queries=1,
-            mode='relative_score'
-        )
\ No newline at end of file
+            mode=mode
+        )
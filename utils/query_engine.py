@@ -1,26 +1,87 @@
-from llama_index.core.query_engine import RetrieverQueryEngine, TransformQueryEngine, MultiStepQueryEngine
-from llama_index.core.indices.query.query_transform import HyDEQueryTransform, StepDecomposeQueryTransform
-from typing import Literal, Optional, Any
+from llama_index.core.query_engine import RetrieverQueryEngine, TransformQueryEngine
+from llama_index.core.async_utils import asyncio_run
+from llama_index.core.base.response.schema import RESPONSE_TYPE, StreamingResponse
+from llama_index.core.response_synthesizers import get_response_synthesizer
+from llama_index.core.schema import QueryBundle
+from llama_index.core.types import TokenGen
+from llama_index.core.utils import get_tokenizer
+from dataclasses import dataclass
+from typing import Literal, Optional, Any, List
+import asyncio
+import time
+from .retriever import retrieve_batch
+from .reranker import rerank_batch
+from .cache import ResponseCache, pipeline_config
+from .transforms import LLMMemo, ParallelHyDEQueryTransform, DecomposeQueryEngine
+from .tracing import span
 
 Mode = Literal['none', 'hyDE', 'multi']
 
+
+@dataclass
+class TimedStreamingResponse(StreamingResponse):
+    """
+    A streaming response that measures its own latency.
+
+    The source nodes are set before the first token is produced; the timings are
+    filled in while `response_gen` is consumed.
+
+    Attributes:
+        retrieval_seconds (Optional[float]): Seconds from the query to the reranked source nodes.
+        ttft (Optional[float]): Seconds from the query to the first token.
+        tokens (int): The number of tokens generated so far.
+        tokens_per_sec (Optional[float]): The generation rate after the first token.
+    """
+    retrieval_seconds: Optional[float] = None
+    ttft: Optional[float] = None
+    tokens: int = 0
+    tokens_per_sec: Optional[float] = None
+
+    def timed(self, response_gen: TokenGen, start: float) -> TokenGen:
+        """
+        Wrap a token generator to record time-to-first-token and tokens per second.
+
+        Args:
+            response_gen (TokenGen): The LLM token generator.
+            start (float): The `time.perf_counter()` value when the query started.
+
+        Yields:
+            str: The tokens of response_gen.
+        """
+        tokenizer = get_tokenizer()
+        first = None
+        for text in response_gen:
+            if first is None:
+                first = time.perf_counter()
+                self.ttft = first - start
+            self.tokens += len(tokenizer(text))
+            yield text
+        if first is not None:
+            elapsed = time.perf_counter() - first
+            self.tokens_per_sec = self.tokens / elapsed if elapsed > 0 else None
+
 class QueryEngine:
     """
     A class for handling different query engine modes.
 
     This class provides functionality for querying using different transformation modes:
-    'none' (default retriever), 'hyDE' (Hypothetical Document Embeddings), or 'multi' (multi-step querying).
+    'none' (default retriever), 'hyDE' (Hypothetical Document Embeddings), or 'multi' (sub-question querying).
 
     Attributes:
         retriever: The retriever object used for querying.
         transform_mode (Mode): The mode of transformation to be applied to the query.
         node_processor: The reranker if needed.
+        compressor: The context compressor applied after reranking, if any.
         query_engine (RetrieverQueryEngine): The base query engine.
         hyde_query (TransformQueryEngine): The HyDE query engine (if applicable).
-        multi_query (MultiStepQueryEngine): The multi-step query engine (if applicable).
+        multi_query (DecomposeQueryEngine): The sub-question query engine (if applicable).
+        max_concurrency (int): The maximum number of concurrent LLM calls in batched queries.
+        cache (Optional[ResponseCache]): The response cache (if applicable).
     """
 
-    def __init__(self, retriever: Any, transform_mode: Mode, llm: Any, node_processor:Optional[Any]):
+    def __init__(self, retriever: Any, transform_mode: Mode, llm: Any, node_processor:Optional[Any],
+                 max_concurrency: int = 8, cache: Optional[ResponseCache] = None,
+                 compressor: Optional[Any] = None, **kwargs: Any):
         """
         Initialize the QueryEngine.
 
@@ -28,23 +89,71 @@ class QueryEngine:
             retriever: The retriever object to be used for querying.
             transform_mode (Mode): The mode of transformation to be applied to the query.
             llm: The language model to be used for transformations (required for 'hyDE' and 'multi' modes).
+            node_processor: The reranker if needed.
+            max_concurrency (int): The maximum number of concurrent LLM calls in batched queries.
+            cache (Optional[ResponseCache]): A cache answering repeated and near-duplicate queries.
+            compressor: A postprocessor shrinking the reranked context before synthesis, e.g. ContextCompressor.
+            **kwargs: Arbitrary keyword arguments for the transforms.
+                num_hypotheses (int): The number of HyDE documents written concurrently per query (default 1).
+                embed_model: The embedding model used to embed the HyDE documents in one batch.
+                max_questions (int): The maximum number of sub-questions per step in 'multi' mode (default 3).
+                num_steps (int): The maximum number of decomposition steps in 'multi' mode (default 3).
+                memo_dir (str): A directory memoizing the transform LLM calls by (model, prompt).
+
+        Raises:
+            ValueError: If the mode is invalid or 'hyDE'/'multi' is requested without an llm.
         """
+        if transform_mode not in ('none', 'hyDE', 'multi'):
+            raise ValueError(f"Invalid transform mode: {transform_mode}")
+        if transform_mode != 'none' and llm is None:
+            raise ValueError(f"The '{transform_mode}' mode requires an llm")
         self.retriever = retriever
         self.transform_mode = transform_mode
-        self.query_engine = RetrieverQueryEngine(self.retriever, 
-                                                 node_postprocessors=[node_processor] 
-                                                 if node_processor is not None else None)
-        if self.transform_mode == 'hyDE' and llm is not None:
-            hyde = HyDEQueryTransform(llm=llm)
-            self.hyde_query = TransformQueryEngine(self.query_engine, hyde)
-        elif self.transform_mode == 'multi' and llm is not None:
-            step_decompose = StepDecomposeQueryTransform(llm=llm, verbose=True)
-            self.multi_query = MultiStepQueryEngine(
+        self.node_processor = node_processor
+        self.compressor = compressor
+        self.max_concurrency = max_concurrency
+        self.cache = cache
+        self.llm = llm
+        transform_config = {}
+        if transform_mode == 'hyDE':
+            transform_config['num_hypotheses'] = kwargs.get('num_hypotheses', 1)
+        elif transform_mode == 'multi':
+            transform_config['max_questions'] = kwargs.get('max_questions', 3)
+            transform_config['num_steps'] = kwargs.get('num_steps', 3)
+        # Engines sharing a cache only share answers when every configuration value matches.
+        self._config = pipeline_config(transform_mode, transform_config, retriever, node_processor, compressor, llm)
+        postprocessors = [processor for processor in (node_processor, compressor) if processor is not None]
+        self.query_engine = RetrieverQueryEngine(self.retriever, node_postprocessors=postprocessors or None)
+        memo_dir = kwargs.get('memo_dir')
+        memo = LLMMemo(memo_dir) if memo_dir is not None else None
+        if self.transform_mode == 'hyDE':
+            self.hyde = ParallelHyDEQueryTransform(
+                llm=llm,
+                num_hypotheses=kwargs.get('num_hypotheses', 1),
+                memo=memo,
+                embed_model=kwargs.get('embed_model')
+            )
+            self.hyde_query = TransformQueryEngine(self.query_engine, self.hyde)
+        elif self.transform_mode == 'multi':
+            self.multi_query = DecomposeQueryEngine(
                 query_engine=self.query_engine,
-                query_transform=step_decompose,
+                retriever=self.retriever,
+                node_processor=node_processor,
+                llm=llm,
+                max_questions=kwargs.get('max_questions', 3),
+                num_steps=kwargs.get('num_steps', 3),
+                memo=memo,
+                compressor=compressor
             )
 
-    def query(self, query: str) -> None:
+    def _engine(self) -> Any:
+        if self.transform_mode == 'hyDE':
+            return self.hyde_query
+        if self.transform_mode == 'multi':
+            return self.multi_query
+        return self.query_engine
+
+    def query(self, query: str) -> RESPONSE_TYPE:
         """
         Execute a query based on the selected transformation mode.
 
@@ -52,20 +161,137 @@ class QueryEngine:
             query (str): The query string to be processed.
 
         Returns:
-            None: This method prints the response or an error message.
+            RESPONSE_TYPE: The response.
         """
-        if self.transform_mode == 'none':
-            response = self.query_engine.query(query)
+        with span("query", mode=self.transform_mode) as s:
+            if self.cache is None:
+                return self._engine().query(query)
+            response, embedding = self.cache.get(query, self._config)
+            s.set(cache_hit=response is not None)
+            if response is None:
+                response = self._engine().query(query)
+                self.cache.put(query, response, self._config, embedding)
             return response
-        elif self.transform_mode == 'hyDE':
-            try:
-                response = self.hyde_query.query(query)
-                return response
-            except AttributeError:
-                print('You did not create the hyDE transform')
-        elif self.transform_mode == 'multi':
-            try:
-                response = self.multi_query.query(query)
-                return response
-            except AttributeError:
-                print('You did not create the multi-query transformation')
\ No newline at end of file
+
+    async def aquery(self, query: str) -> RESPONSE_TYPE:
+        """
+        Asynchronously execute a query based on the selected transformation mode.
+
+        Args:
+            query (str): The query string to be processed.
+
+        Returns:
+            RESPONSE_TYPE: The response.
+        """
+        with span("query", mode=self.transform_mode) as s:
+            if self.cache is None:
+                return await self._engine().aquery(query)
+            response, embedding = await asyncio.to_thread(self.cache.get, query, self._config)
+            s.set(cache_hit=response is not None)
+            if response is None:
+                response = await self._engine().aquery(query)
+                self.cache.put(query, response, self._config, embedding)
+            return response
+
+    def stream(self, query: str) -> TimedStreamingResponse:
+        """
+        Execute a query and stream the answer token by token.
+
+        Retrieval and reranking (and in 'multi' mode, the sub-question steps) run first.
+        Synthesis of the final answer starts as soon as they finish, and
+        the source nodes are available on the returned response before the first token.
+        Iterate over `response.response_gen` (or call `print_response_stream`) to consume
+        the answer; `ttft` and `tokens_per_sec` are filled in as it is consumed.
+
+        Args:
+            query (str): The query string to be processed.
+
+        Returns:
+            TimedStreamingResponse: The streaming response.
+        """
+        start = time.perf_counter()
+        with span("query", mode=self.transform_mode, streaming=True):
+            bundle = QueryBundle(query)
+            source_nodes = None
+            if self.transform_mode == 'multi':
+                nodes, source_nodes, _ = self.multi_query.run_steps(bundle)
+            else:
+                if self.transform_mode == 'hyDE':
+                    bundle = self.hyde.run(bundle)
+                nodes = rerank_batch(self.node_processor, retrieve_batch(self.retriever, [bundle]), [bundle])
+                nodes = rerank_batch(self.compressor, nodes, [bundle])[0]
+            retrieval_seconds = time.perf_counter() - start
+
+            synthesizer = get_response_synthesizer(llm=self.llm, streaming=True,
+                                                   callback_manager=self.query_engine.callback_manager)
+            streamed = synthesizer.synthesize(bundle, nodes, additional_source_nodes=source_nodes)
+        response = TimedStreamingResponse(response_gen=None, source_nodes=streamed.source_nodes,
+                                          metadata=streamed.metadata, retrieval_seconds=retrieval_seconds)
+        response.response_gen = response.timed(streamed.response_gen, start)
+        return response
+
+    def query_batch(self, queries: List[str]) -> List[RESPONSE_TYPE]:
+        """
+        Execute several queries at once.
+
+        Vector search runs as one batched Faiss search, HyDE hypotheses are embedded in
+        one call, reranking scores all (query, node) pairs together and the LLM calls run
+        concurrently, at most `max_concurrency` at a time. In 'multi' mode the steps of
+        all queries run in lockstep, so each step retrieves the sub-questions of every
+        query as one batch.
+
+        Args:
+            queries (List[str]): The query strings to be processed.
+
+        Returns:
+            List[RESPONSE_TYPE]: The response of each query, in order.
+        """
+        return asyncio_run(self.aquery_batch(queries))
+
+    async def aquery_batch(self, queries: List[str]) -> List[RESPONSE_TYPE]:
+        """
+        Asynchronously execute several queries at once; see `query_batch`.
+
+        Args:
+            queries (List[str]): The query strings to be processed.
+
+        Returns:
+            List[RESPONSE_TYPE]: The response of each query, in order.
+        """
+        with span("query_batch", mode=self.transform_mode, queries=len(queries)) as s:
+            if self.cache is None:
+                return await self._aquery_batch(queries)
+            cached = await asyncio.to_thread(lambda: [self.cache.get(query, self._config) for query in queries])
+            misses = [i for i, (response, _) in enumerate(cached) if response is None]
+            s.set(cache_hits=len(queries) - len(misses))
+            responses = [response for response, _ in cached]
+            if misses:
+                computed = await self._aquery_batch([queries[i] for i in misses])
+                for i, response in zip(misses, computed):
+                    self.cache.put(queries[i], response, self._config, cached[i][1])
+                    responses[i] = response
+            return responses
+
+    async def _aquery_batch(self, queries: List[str]) -> List[RESPONSE_TYPE]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def limited(coroutine: Any) -> Any:
+            async with semaphore:
+                return await coroutine
+
+        bundles = [QueryBundle(query) for query in queries]
+        if self.transform_mode == 'multi':
+            steps = await self.multi_query.arun_steps_batch(bundles, self.max_concurrency)
+            return list(await asyncio.gather(
+                *(limited(self.multi_query.afinish(bundle, result)) for bundle, result in zip(bundles, steps))
+            ))
+        if self.transform_mode == 'hyDE':
+            bundles = list(await asyncio.gather(
+                *(limited(self.hyde.arun(bundle)) for bundle in bundles)
+            ))
+        nodes_list = await asyncio.to_thread(retrieve_batch, self.retriever, bundles)
+        nodes_list = await asyncio.to_thread(rerank_batch, self.node_processor, nodes_list, bundles)
+        nodes_list = await asyncio.to_thread(rerank_batch, self.compressor, nodes_list, bundles)
+        return list(await asyncio.gather(
+            *(limited(self.query_engine.asynthesize(bundle, nodes)) for bundle, nodes in zip(bundles, nodes_list))
+        ))
@@ -0,0 +1,225 @@
+import gc
+import sys
+import json
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Literal, Optional, Sequence, Tuple
+from .tracing import span, count
+
+ModelKind = Literal['embedding', 'cross-encoder', 'llm']
+
+ModelSpec = Tuple[str, str, Dict[str, Any]]
+
+
+def _load_embedding(name: str, **kwargs: Any) -> Any:
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    return HuggingFaceEmbedding(model_name=name, **kwargs)
+
+
+def _load_cross_encoder(name: str, max_length: int = 512, device: str = "cpu", backend: str = 'torch',
+                        onnx_file_name: Optional[str] = None, **kwargs: Any) -> Any:
+    try:
+        from sentence_transformers import CrossEncoder
+    except ImportError:
+        raise ImportError("Cannot import sentence-transformers, please `pip install sentence-transformers`")
+    if backend == 'onnx':
+        model_kwargs = {"file_name": onnx_file_name} if onnx_file_name else {}
+        return CrossEncoder(name, max_length=max_length, device=device, backend="onnx",
+                            model_kwargs=model_kwargs, **kwargs)
+    model = CrossEncoder(name, max_length=max_length, device=device, **kwargs)
+    if backend == 'int8':
+        import torch
+        model.model = torch.quantization.quantize_dynamic(model.model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def _load_llm(name: str, provider: str = 'ollama', **kwargs: Any) -> Any:
+    if provider == 'gemini':
+        from llama_index.llms.gemini import Gemini
+        return Gemini(model=name, **kwargs)
+    if provider == 'openai':
+        from llama_index.llms.openai import OpenAI
+        return OpenAI(model=name, **kwargs)
+    if provider == 'huggingface':
+        from llama_index.llms.huggingface import HuggingFaceLLM
+        return HuggingFaceLLM(model_name=name, **kwargs)
+    if provider == 'ollama':
+        from llama_index.llms.ollama import Ollama
+        return Ollama(model=name, **kwargs)
+    raise ValueError(f"Invalid LLM provider: {provider}")
+
+
+LOADERS: Dict[str, Callable[..., Any]] = {
+    'embedding': _load_embedding,
+    'cross-encoder': _load_cross_encoder,
+    'llm': _load_llm,
+}
+
+
+def _run_worker(target: Callable[..., Any], rank: int, threads: int, args: Tuple[Any, ...]) -> None:
+    """
+    Cap the inherited thread pools of a forked worker, then run its target.
+    """
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+    faiss = sys.modules.get("faiss")
+    if faiss is not None:
+        faiss.omp_set_num_threads(threads)
+    target(rank, *args)
+
+
+class ModelRegistry:
+    """
+    A process-wide cache of loaded models, keyed by kind, name and loader options.
+
+    The heavy integration (HuggingFace, sentence-transformers, an LLM client) is only
+    imported by the loader of a model the first time it is requested. Every later request
+    for the same model, from the embedder, the semantic chunker or a reranker, gets the
+    same object. Concurrent first requests for a model wait for a single load.
+
+    Loaded models can be preloaded in a parent process and inherited by forked workers,
+    which then share the weights copy-on-write instead of loading their own.
+    """
+
+    def __init__(self):
+        """
+        Create an empty registry with the default loaders.
+        """
+        self._loaders: Dict[str, Callable[..., Any]] = dict(LOADERS)
+        self._models: Dict[Tuple[str, str, str], Any] = {}
+        self._load_seconds: Dict[Tuple[str, str, str], float] = {}
+        self._locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+    @staticmethod
+    def _key(kind: str, name: str, options: Dict[str, Any]) -> Tuple[str, str, str]:
+        return kind, name, json.dumps(options, sort_keys=True, default=str)
+
+    def register_loader(self, kind: str, loader: Callable[..., Any]) -> None:
+        """
+        Add or replace the loader of a model kind.
+
+        Args:
+            kind (str): The model kind.
+            loader (Callable[..., Any]): Called as `loader(name, **options)`; returns the model.
+        """
+        self._loaders[kind] = loader
+
+    def get(self, kind: str, name: str, **kwargs: Any) -> Any:
+        """
+        Return a model, loading it on first use.
+
+        Args:
+            kind (str): The model kind: 'embedding', 'cross-encoder', 'llm' or a registered kind.
+            name (str): The model name.
+            **kwargs: The loader options; a model is shared only between requests with the same options.
+
+        Returns:
+            Any: The model.
+
+        Raises:
+            ValueError: If no loader exists for the kind.
+        """
+        key = self._key(kind, name, kwargs)
+        model = self._models.get(key)
+        if model is not None:
+            count("model_registry_hits", kind=kind)
+            return model
+        if kind not in self._loaders:
+            raise ValueError(f"Invalid model kind: {kind}")
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            model = self._models.get(key)
+            if model is None:
+                start = time.perf_counter()
+                with span("load_model", kind=kind, model=name):
+                    model = self._loaders[kind](name, **kwargs)
+                self._load_seconds[key] = time.perf_counter() - start
+                self._models[key] = model
+                count("model_registry_loads", kind=kind)
+        return model
+
+    def preload(self, specs: Iterable[ModelSpec], max_workers: int = 4) -> None:
+        """
+        Load several models concurrently, e.g. before serving or forking workers.
+
+        Args:
+            specs (Iterable[ModelSpec]): (kind, name, options) triples.
+            max_workers (int): The number of models loaded at once.
+        """
+        specs = list(specs)
+        if not specs:
+            return
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(specs))) as executor:
+            list(executor.map(lambda spec: self.get(spec[0], spec[1], **spec[2]), specs))
+
+    def loaded(self) -> List[Dict[str, Any]]:
+        """
+        Describe the loaded models.
+
+        Returns:
+            List[Dict[str, Any]]: The kind, name, options and load seconds of each model.
+        """
+        return [{"kind": kind, "name": name, "options": json.loads(options), "load_seconds": seconds}
+                for (kind, name, options), seconds in self._load_seconds.items()]
+
+    def clear(self) -> None:
+        """
+        Drop every loaded model.
+        """
+        with self._lock:
+            self._models.clear()
+            self._load_seconds.clear()
+            self._locks.clear()
+
+    def fork_workers(self, target: Callable[..., Any], num_workers: int, args: Sequence[Any] = (),
+                     threads_per_worker: int = 1) -> List[Any]:
+        """
+        Fork worker processes that inherit the loaded models.
+
+        The garbage collector is frozen across the fork, so the workers do not touch (and
+        copy) the pages of the parent's objects; model weights stay shared until written.
+        Each worker runs `target(rank, *args)` with its torch and Faiss thread pools capped.
+
+        Args:
+            target (Callable[..., Any]): The worker function.
+            num_workers (int): The number of workers.
+            args (Sequence[Any]): Extra arguments of target.
+            threads_per_worker (int): The number of compute threads of each worker.
+
+        Returns:
+            List[multiprocessing.Process]: The started workers; join them when done.
+
+        Raises:
+            RuntimeError: If the platform cannot fork.
+        """
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("Forking workers requires the 'fork' start method")
+        context = multiprocessing.get_context("fork")
+        gc.collect()
+        gc.freeze()
+        try:
+            processes = [context.Process(target=_run_worker, args=(target, rank, threads_per_worker, tuple(args)))
+                         for rank in range(num_workers)]
+            for process in processes:
+                process.start()
+        finally:
+            gc.unfreeze()
+        return processes
+
+
+_registry = ModelRegistry()
+
+
+def get_registry() -> ModelRegistry:
+    """
+    Return the process-wide model registry.
+    """
+    return _registry
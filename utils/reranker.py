@@ -1,15 +1,63 @@
-from typing import Literal, Any
-from llama_index.core.postprocessor import SentenceTransformerRerank, LLMRerank, MetadataReplacementPostProcessor
-from llama_index.postprocessor.cohere_rerank import CohereRerank
+from typing import TYPE_CHECKING, Literal, Any, List, Optional, Union, Dict
+from dataclasses import dataclass
+import time
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor import (
+    SentenceTransformerRerank, LLMRerank, MetadataReplacementPostProcessor, SimilarityPostprocessor
+)
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from .cross_encoder import CrossEncoderRerank
+from .registry import get_registry
+from .tracing import span
+
+if TYPE_CHECKING:
+    from llama_index.postprocessor.cohere_rerank import CohereRerank
+
+RerankerStrategy = Literal['llm-reranker', 'cohere', 'metadata', 'custom', 'cascade']
+
+# SentenceTransformerRerank's default.
+DEFAULT_MAX_LENGTH = 512
+
+
+class SharedSentenceTransformerRerank(SentenceTransformerRerank):
+    """
+    A SentenceTransformerRerank whose cross-encoder comes from the ModelRegistry.
+
+    Every reranker of the same model (e.g. in several query engines, or in a cascade)
+    shares one loaded cross-encoder instead of loading its own.
+    """
+
+    def __init__(self, top_n: int = 2, model: str = "cross-encoder/stsb-distilroberta-base",
+                 device: Optional[str] = None, keep_retrieval_score: bool = False):
+        """
+        Initialize the SharedSentenceTransformerRerank.
+
+        Args:
+            top_n (int): The number of nodes to return.
+            model (str): The cross-encoder model name.
+            device (Optional[str]): The device to run on (inferred by default).
+            keep_retrieval_score (bool): Whether to keep the retrieval score in metadata.
+        """
+        if device is None:
+            from llama_index.core.utils import infer_torch_device
+            device = infer_torch_device()
+        # Skip SentenceTransformerRerank.__init__, which loads its own model.
+        BaseNodePostprocessor.__init__(self, top_n=top_n, model=model, device=device,
+                                       keep_retrieval_score=keep_retrieval_score)
+        self._model = get_registry().get('cross-encoder', model, max_length=DEFAULT_MAX_LENGTH, device=device)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SharedSentenceTransformerRerank"
 
-RerankerStrategy = Literal['llm-reranker', 'cohere', 'metadata', 'custom']
 
 class Reranker:
     """
     A class to select and apply different reranking strategies.
 
     This class provides methods to rerank search results using different strategies:
-    'custom', 'llm-reranker', 'metadata', or 'cohere'.
+    'custom', 'llm-reranker', 'metadata', 'cohere', or 'cascade'.
 
     Attributes:
         strategy (RerankerStrategy): The chosen reranking strategy.
@@ -45,24 +93,44 @@ class Reranker:
             return self.metadata_replacement(**kwargs)
         elif self.strategy == 'cohere':
             return self.cohere_reranker(**kwargs)
+        elif self.strategy == 'cascade':
+            return self.cascade_reranker(**kwargs)
         else:
             raise ValueError(f"Invalid reranking strategy: {self.strategy}")
 
-    def sentence_transformer(self, **kwargs: Any) -> SentenceTransformerRerank:
+    def sentence_transformer(self, **kwargs: Any) -> Union[SharedSentenceTransformerRerank, CrossEncoderRerank]:
         """
-        Create a SentenceTransformerRerank object.
+        Create a SentenceTransformerRerank object, or a CrossEncoderRerank object if a backend is given.
+
+        Both take their model from the ModelRegistry, so it is loaded once per process.
 
         Args:
             **kwargs: Arbitrary keyword arguments.
                 model_name (str): The name of the sentence transformer model.
                 top_n (int): The number of top results to return.
+                backend (Backend): 'torch', 'int8' or 'onnx'; selects the batched CrossEncoderRerank.
+                batch_size (int): The number of pairs per forward pass (CrossEncoderRerank only).
+                max_length (int): The maximum number of tokens per pair (CrossEncoderRerank only).
+                cache_size (int): The maximum number of cached scores (CrossEncoderRerank only).
+                onnx_file_name (str): The ONNX file inside the model repo (CrossEncoderRerank only).
 
         Returns:
-            SentenceTransformerRerank: A configured SentenceTransformerRerank object.
+            Union[SharedSentenceTransformerRerank, CrossEncoderRerank]: A configured reranker.
         """
         model_name = kwargs.get('model_name')
         top_n = kwargs.get('top_n')
-        return SentenceTransformerRerank(top_n=top_n, model=model_name)
+        backend = kwargs.get('backend')
+        if backend is not None:
+            return CrossEncoderRerank(
+                top_n=top_n,
+                model=model_name,
+                backend=backend,
+                batch_size=kwargs.get('batch_size', 64),
+                max_length=kwargs.get('max_length', 512),
+                cache_size=kwargs.get('cache_size', 100000),
+                onnx_file_name=kwargs.get('onnx_file_name')
+            )
+        return SharedSentenceTransformerRerank(top_n=top_n, model=model_name)
 
     def llm_ranker(self, **kwargs: Any) -> LLMRerank:
         """
@@ -90,7 +158,7 @@ class Reranker:
         """
         return MetadataReplacementPostProcessor(target_metadata_key="window")
 
-    def cohere_reranker(self, **kwargs: Any) -> CohereRerank:
+    def cohere_reranker(self, **kwargs: Any) -> "CohereRerank":
         """
         Create a CohereRerank object.
 
@@ -102,6 +170,195 @@ class Reranker:
         Returns:
             CohereRerank: A configured CohereRerank object.
         """
+        from llama_index.postprocessor.cohere_rerank import CohereRerank
         api_key = kwargs.get('api_key')
         top_n = kwargs.get('top_n')
-        return CohereRerank(api_key=api_key, top_n=top_n)
\ No newline at end of file
+        return CohereRerank(api_key=api_key, top_n=top_n)
+
+    def cascade_reranker(self, **kwargs: Any) -> "CascadeRerank":
+        """
+        Create a CascadeRerank object.
+
+        Without explicit `stages`, the cascade is: an optional retrieval score cutoff,
+        a cross-encoder on the top `cross_encoder_top_k` nodes, then LLMRerank on the
+        top `top_n`, exiting after the cross-encoder when its margin is decisive.
+
+        Args:
+            **kwargs: Arbitrary keyword arguments.
+                stages (List[CascadeStage]): The stages, cheapest first (overrides the default cascade).
+                top_n (int): The number of top results to return.
+                similarity_cutoff (float): The minimum retrieval score kept by the first stage.
+                model_name (str): The name of the cross-encoder model.
+                backend (Backend): The cross-encoder backend (see `sentence_transformer`).
+                cross_encoder_top_k (int): The number of nodes kept by the cross-encoder.
+                margin (float): The cross-encoder score margin that skips the LLM stage.
+                llm: The language model for the LLM stage.
+
+        Returns:
+            CascadeRerank: A configured CascadeRerank object.
+        """
+        top_n = kwargs.get('top_n', 5)
+        stages = kwargs.get('stages')
+        if stages is None:
+            stages = []
+            if kwargs.get('similarity_cutoff') is not None:
+                stages.append(CascadeStage(SimilarityPostprocessor(similarity_cutoff=kwargs['similarity_cutoff']),
+                                           top_k=None))
+            cross_encoder_top_k = kwargs.get('cross_encoder_top_k', 50)
+            stages.append(CascadeStage(
+                self.sentence_transformer(model_name=kwargs.get('model_name'), top_n=cross_encoder_top_k,
+                                          backend=kwargs.get('backend')),
+                top_k=cross_encoder_top_k,
+                margin=kwargs.get('margin')
+            ))
+            stages.append(CascadeStage(LLMRerank(llm=kwargs.get('llm'), top_n=top_n), top_k=top_n))
+        return CascadeRerank(stages=stages, top_n=top_n)
+
+
+def rerank_batch(processor: Optional[Any], nodes_list: List[List[NodeWithScore]],
+                 query_bundles: List[QueryBundle]) -> List[List[NodeWithScore]]:
+    """
+    Apply a node postprocessor to the results of several queries.
+
+    SentenceTransformerRerank scores the (query, node) pairs of all queries in one
+    cross-encoder call; postprocessors with their own `postprocess_nodes_batch` use it;
+    any other postprocessor is applied per query.
+
+    Args:
+        processor: The node postprocessor (None leaves the nodes unchanged).
+        nodes_list (List[List[NodeWithScore]]): The retrieved nodes of each query.
+        query_bundles (List[QueryBundle]): The queries.
+
+    Returns:
+        List[List[NodeWithScore]]: The postprocessed nodes of each query.
+    """
+    if processor is None:
+        return nodes_list
+    with span("rerank_batch", processor=type(processor).__name__,
+              nodes_in=sum(len(nodes) for nodes in nodes_list)) as s:
+        reranked = _rerank_batch(processor, nodes_list, query_bundles)
+        s.set(nodes_out=sum(len(nodes) for nodes in reranked))
+    return reranked
+
+
+def _rerank_batch(processor: Any, nodes_list: List[List[NodeWithScore]],
+                  query_bundles: List[QueryBundle]) -> List[List[NodeWithScore]]:
+    if hasattr(processor, 'postprocess_nodes_batch'):
+        return processor.postprocess_nodes_batch(nodes_list, query_bundles)
+    if not isinstance(processor, SentenceTransformerRerank):
+        return [processor.postprocess_nodes(nodes, query_bundle=bundle)
+                for nodes, bundle in zip(nodes_list, query_bundles)]
+
+    pairs = [(bundle.query_str, node.node.get_content(metadata_mode=MetadataMode.EMBED))
+             for nodes, bundle in zip(nodes_list, query_bundles) for node in nodes]
+    scores = processor._model.predict(pairs) if pairs else []
+    reranked = []
+    offset = 0
+    for nodes in nodes_list:
+        for node, score in zip(nodes, scores[offset:offset + len(nodes)]):
+            if processor.keep_retrieval_score:
+                node.node.metadata["retrieval_score"] = node.score
+            node.score = float(score)
+        offset += len(nodes)
+        reranked.append(sorted(nodes, key=lambda x: -x.score if x.score else 0)[:processor.top_n])
+    return reranked
+
+
+@dataclass
+class CascadeStage:
+    """
+    A stage of a CascadeRerank.
+
+    Attributes:
+        processor: The node postprocessor (None only re-sorts by the incoming score).
+        top_k (Optional[int]): The number of nodes passed to the next stage (None keeps all).
+        margin (Optional[float]): The score gap between the top_n-th and the next node at
+            which the cascade stops after this stage (None never stops early).
+    """
+    processor: Optional[Any]
+    top_k: Optional[int] = None
+    margin: Optional[float] = None
+
+
+class CascadeRerank(BaseNodePostprocessor):
+    """
+    A reranker that runs cheap-to-expensive stages, each on the survivors of the last.
+
+    Every stage reranks (in one batch across queries where the processor supports it)
+    and keeps its top_k nodes. A query leaves the cascade early when a stage's scores
+    already separate the top_n nodes from the rest by at least the stage's margin, so
+    expensive stages only see the queries and nodes that need them.
+    """
+
+    top_n: int = Field(description="Number of nodes to return sorted by score.")
+    _stages: List[CascadeStage] = PrivateAttr()
+    _stats: List[Dict[str, float]] = PrivateAttr()
+
+    def __init__(self, stages: List[CascadeStage], top_n: int = 5, **kwargs: Any):
+        """
+        Initialize the CascadeRerank.
+
+        Args:
+            stages (List[CascadeStage]): The stages, cheapest first.
+            top_n (int): The number of nodes to return.
+        """
+        super().__init__(top_n=top_n, **kwargs)
+        self._stages = stages
+        self._stats = [{"queries": 0, "seconds": 0.0, "nodes_in": 0, "survivors": 0, "early_exits": 0}
+                       for _ in stages]
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CascadeRerank"
+
+    @property
+    def stats(self) -> List[Dict[str, float]]:
+        """
+        Per-stage totals: queries, seconds, nodes in, survivors, early exits and mean latency.
+        """
+        return [dict(stats, mean_latency=stats["seconds"] / stats["queries"] if stats["queries"] else 0.0)
+                for stats in self._stats]
+
+    def postprocess_nodes_batch(self, nodes_list: List[List[NodeWithScore]],
+                                query_bundles: List[QueryBundle]) -> List[List[NodeWithScore]]:
+        """
+        Run the cascade on the nodes of several queries.
+
+        Args:
+            nodes_list (List[List[NodeWithScore]]): The retrieved nodes of each query.
+            query_bundles (List[QueryBundle]): The queries.
+
+        Returns:
+            List[List[NodeWithScore]]: The top_n nodes of each query, best first.
+        """
+        results = list(nodes_list)
+        active = [i for i, nodes in enumerate(results) if nodes]
+        for number, (stage, stats) in enumerate(zip(self._stages, self._stats)):
+            if not active:
+                break
+            start = time.perf_counter()
+            stats["nodes_in"] += sum(len(results[i]) for i in active)
+            with span("cascade_stage", stage=number, queries=len(active)):
+                ranked = rerank_batch(stage.processor, [results[i] for i in active],
+                                      [query_bundles[i] for i in active])
+            still_active = []
+            for i, nodes in zip(active, ranked):
+                nodes = sorted(nodes, key=lambda x: -x.score if x.score else 0)[:stage.top_k]
+                results[i] = nodes
+                stats["survivors"] += len(nodes)
+                decisive = (stage.margin is not None and len(nodes) > self.top_n
+                            and (nodes[self.top_n - 1].score or 0) - (nodes[self.top_n].score or 0) >= stage.margin)
+                if decisive or len(nodes) == 0:
+                    stats["early_exits"] += 1
+                else:
+                    still_active.append(i)
+            stats["queries"] += len(active)
+            stats["seconds"] += time.perf_counter() - start
+            active = still_active
+        return [nodes[:self.top_n] for nodes in results]
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore],
+                           query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        return self.postprocess_nodes_batch([nodes], [query_bundle])[0]
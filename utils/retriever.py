@@ -2,12 +2,128 @@ from llama_index.core.retrievers import (
     QueryFusionRetriever,
     AutoMergingRetriever
 )
-from llama_index.retrievers.bm25 import BM25Retriever
-from typing import Literal, Any, List
-import Stemmer
+from llama_index.core.indices.vector_store.retrievers import VectorIndexRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from typing import TYPE_CHECKING, Literal, Any, List, Sequence, Union
+import os
+import numpy as np
+from .sparse import BM25Index, BM25IndexRetriever, BM25_DIR
+from .metadata import MetadataIndex, METADATA_DIR, to_filters
+from .hierarchy import HierarchyIndex, HierarchyRetriever, HIERARCHY_DIR, DEFAULT_MERGE_RATIO
+from .tracing import span
+
+if TYPE_CHECKING:
+    from llama_index.retrievers.bm25 import BM25Retriever
 
 RetrievalMethod = Literal['vector', 'BM25', 'automerge']
 
+
+def embed_queries(embed_model: Any, query_bundles: List[QueryBundle]) -> None:
+    """
+    Fill in the embedding of every query bundle, averaging its embedding strings.
+
+    Query strings go through `get_query_embedding`, once per distinct query, so a batch
+    ranks exactly like single queries. Other embedding strings (e.g. HyDE hypotheses)
+    are passages: those of all bundles are encoded with one `get_text_embedding_batch` call.
+
+    Args:
+        embed_model: The embedding model.
+        query_bundles (List[QueryBundle]): The query bundles; those with an embedding are skipped.
+    """
+    pending = [bundle for bundle in query_bundles if bundle.embedding is None and bundle.embedding_strs]
+    if not pending:
+        return
+    queries = list(dict.fromkeys(text for bundle in pending for text in bundle.embedding_strs
+                                 if text == bundle.query_str))
+    passages = [text for bundle in pending for text in bundle.embedding_strs if text != bundle.query_str]
+    with span("embed_queries", queries=len(queries), passages=len(passages)):
+        query_embeddings = {query: embed_model.get_query_embedding(query) for query in queries}
+        passage_embeddings = iter(embed_model.get_text_embedding_batch(passages) if passages else [])
+    for bundle in pending:
+        embeddings = [query_embeddings[text] if text == bundle.query_str else next(passage_embeddings)
+                      for text in bundle.embedding_strs]
+        bundle.embedding = np.mean(np.array(embeddings, dtype="float32"), axis=0).tolist()
+
+
+class FaissIndexRetriever(VectorIndexRetriever):
+    """
+    A VectorIndexRetriever that resolves Faiss ids through the FaissIdMap of a FaissIndex
+    instead of the index struct's `nodes_dict`.
+    """
+
+    def _determine_nodes_to_fetch(self, query_result: Any) -> List[str]:
+        if query_result.nodes or not query_result.ids:
+            return super()._determine_nodes_to_fetch(query_result)
+        node_ids = (self._index.id_map.get(faiss_id) for faiss_id in query_result.ids)
+        return [node_id for node_id in node_ids if node_id is not None]
+
+    def _insert_fetched_nodes_into_query_result(self, query_result: Any,
+                                                fetched_nodes: List[BaseNode]) -> Sequence[BaseNode]:
+        if query_result.nodes or not query_result.ids:
+            return super()._insert_fetched_nodes_into_query_result(query_result, fetched_nodes)
+        fetched_nodes_by_id = {str(node.node_id): node for node in fetched_nodes}
+        nodes = []
+        for faiss_id in query_result.ids:
+            node_id = self._index.id_map.get(faiss_id)
+            if node_id is None:
+                raise KeyError(f"Node ID {faiss_id} not found in index. ")
+            if node_id not in fetched_nodes_by_id:
+                raise KeyError(f"Node ID {node_id} not found in fetched nodes. ")
+            nodes.append(fetched_nodes_by_id[node_id])
+        return nodes
+
+
+def _nodes_from_result(retriever: VectorIndexRetriever, query_result: Any) -> List[NodeWithScore]:
+    """
+    Resolve a vector store query result into scored nodes, as VectorIndexRetriever does.
+    """
+    nodes_to_fetch = retriever._determine_nodes_to_fetch(query_result)
+    if nodes_to_fetch:
+        fetched_nodes = retriever._docstore.get_nodes(node_ids=nodes_to_fetch, raise_error=False)
+        query_result.nodes = retriever._insert_fetched_nodes_into_query_result(query_result, fetched_nodes)
+    return retriever._convert_nodes_to_scored_nodes(query_result)
+
+
+def retrieve_batch(retriever: Any, query_bundles: List[QueryBundle], max_workers: int = 8) -> List[List[NodeWithScore]]:
+    """
+    Retrieve nodes for several queries at once.
+
+    Vector retrievers over a FaissIDMapVectorStore embed all queries in one encoder
+    call and run one Faiss search; retrievers with their own `retrieve_batch` (such as
+    the concurrent fusion retriever) use it; any other retriever is called per query
+    in a thread pool.
+
+    Args:
+        retriever: The retriever to query.
+        query_bundles (List[QueryBundle]): The queries.
+        max_workers (int): The number of threads for retrievers without a batch path.
+
+    Returns:
+        List[List[NodeWithScore]]: The retrieved nodes of each query.
+    """
+    with span("retrieve_batch", retriever=type(retriever).__name__, queries=len(query_bundles)) as s:
+        results = _retrieve_batch(retriever, query_bundles, max_workers)
+        s.set(nodes_out=sum(len(nodes) for nodes in results))
+    return results
+
+
+def _retrieve_batch(retriever: Any, query_bundles: List[QueryBundle], max_workers: int) -> List[List[NodeWithScore]]:
+    if hasattr(retriever, 'retrieve_batch'):
+        return retriever.retrieve_batch(query_bundles)
+    if isinstance(retriever, VectorIndexRetriever) and hasattr(retriever._vector_store, 'query_batch'):
+        embed_queries(retriever._embed_model, query_bundles)
+        queries = [retriever._build_vector_store_query(bundle) for bundle in query_bundles]
+        results = retriever._vector_store.query_batch(queries, **retriever._kwargs)
+        return [_nodes_from_result(retriever, result) for result in results]
+    if len(query_bundles) == 1:
+        return [retriever.retrieve(query_bundles[0])]
+    contexts = [contextvars.copy_context() for _ in query_bundles]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda context, bundle: context.run(retriever.retrieve, bundle),
+                                 contexts, query_bundles))
+
 class Retriever:
     """
     A class to select and apply different retrieval methods.
@@ -35,6 +151,10 @@ class Retriever:
         """
         Parse the chosen strategy to retrieve information.
 
+        Every method accepts `filters`: llama-index MetadataFilters, or a dict of
+        field values (see `to_filters`). They are applied inside the search by the
+        metadata index built with `Faiss(metadata_index=True)`.
+
         Args:
             **kwargs: Arbitrary keyword arguments for the specific retriever.
 
@@ -44,8 +164,10 @@ class Retriever:
         Raises:
             ValueError: If an invalid retrieval method is provided.
         """
+        if kwargs.get('filters') is not None:
+            kwargs['filters'] = to_filters(kwargs['filters'])
         if self.retrieval_method == 'vector':
-            return self.vectorIndex.as_retriever(**kwargs)
+            return self._vector_retriever(**kwargs)
         elif self.retrieval_method == 'BM25':
             return self._BM25_retriever(**kwargs)
         elif self.retrieval_method == 'automerge':
@@ -53,38 +175,95 @@ class Retriever:
         else:
             raise ValueError(f"Invalid retrieval method: {self.retrieval_method}")
 
-    def _BM25_retriever(self, **kwargs: Any) -> BM25Retriever:
+    def _vector_retriever(self, **kwargs: Any) -> Any:
         """
-        Create a BM25Retriever with the provided parameters.
+        Create a vector retriever over the Faiss index.
+
+        Args:
+            **kwargs: Arbitrary keyword arguments passed to `as_retriever`, plus
+                nprobe (int): The number of inverted lists to visit (IVF indexes).
+                ef_search (int): The size of the HNSW candidate list.
+                filters (MetadataFilters): The metadata filters.
+
+        Returns:
+            Any: A configured VectorIndexRetriever object.
+        """
+        vector_store_kwargs = dict(kwargs.pop('vector_store_kwargs', {}))
+        for knob in ('nprobe', 'ef_search'):
+            if kwargs.get(knob) is not None:
+                vector_store_kwargs[knob] = kwargs.pop(knob)
+        return self.vectorIndex.as_retriever(vector_store_kwargs=vector_store_kwargs, **kwargs)
+
+    def _BM25_retriever(self, **kwargs: Any) -> Union[BM25IndexRetriever, "BM25Retriever"]:
+        """
+        Create a BM25 retriever with the provided parameters.
+
+        If `persist_dir` holds a BM25 index built by `Faiss(bm25=True)`, it is loaded
+        (memory-mapped) instead of re-tokenizing every node in the docstore, and
+        filters mask its postings through the metadata index next to it. Without a
+        persisted BM25 index, filters are applied to BM25Retriever's results.
 
         Args:
             **kwargs: Arbitrary keyword arguments.
                 docstore: The document store to use.
+                similarity_top_k (int): The number of top results to retrieve (defaults to 2).
+                persist_dir (str): The storage directory passed to Faiss().
+                filters (MetadataFilters): The metadata filters.
 
         Returns:
-            BM25Retriever: A configured BM25Retriever object.
+            Union[BM25IndexRetriever, BM25Retriever]: A configured BM25 retriever.
         """
         docstore = kwargs.get('docstore')
+        similarity_top_k = kwargs.get('similarity_top_k', 2)
+        persist_dir = kwargs.get('persist_dir')
+        filters = kwargs.get('filters')
+        if persist_dir is not None and os.path.exists(os.path.join(persist_dir, BM25_DIR)):
+            metadata_dir = os.path.join(persist_dir, METADATA_DIR)
+            return BM25IndexRetriever(
+                BM25Index.load(os.path.join(persist_dir, BM25_DIR)),
+                docstore=docstore,
+                similarity_top_k=similarity_top_k,
+                metadata_index=MetadataIndex.load(metadata_dir) if os.path.exists(metadata_dir) else None,
+                filters=filters
+            )
+        import Stemmer
+        from llama_index.retrievers.bm25 import BM25Retriever
         return BM25Retriever.from_defaults(
             docstore=docstore,
-            similarity_top_k=2,
+            similarity_top_k=similarity_top_k,
             stemmer=Stemmer.Stemmer("english"),
-            language="english"
+            language="english",
+            filters=filters
         )
 
-    def _auto_merge_retriever(self, **kwargs: Any) -> AutoMergingRetriever:
+    def _auto_merge_retriever(self, **kwargs: Any) -> Union[HierarchyRetriever, AutoMergingRetriever]:
         """
-        Create an AutoMergingRetriever with the provided parameters.
+        Create an auto-merging retriever with the provided parameters.
+
+        If `persist_dir` holds a hierarchy index built from a hierarchical chunker, merges
+        are decided over it (HierarchyRetriever) instead of walking parents through the
+        docstore node by node.
 
         Args:
             **kwargs: Arbitrary keyword arguments.
                 top_k (int): The number of top results to retrieve.
                 storage_context: The storage context to use.
+                persist_dir (str): The storage directory passed to Faiss().
+                ratio (float): The fraction of a parent's children that triggers a merge (defaults to 0.5).
+                filters (MetadataFilters): The metadata filters of the leaf search.
+                verbose (bool): Whether AutoMergingRetriever prints its merges (defaults to False).
 
         Returns:
-            AutoMergingRetriever: A configured AutoMergingRetriever object.
+            Union[HierarchyRetriever, AutoMergingRetriever]: A configured auto-merging retriever.
         """
         top_k = kwargs.get('top_k')
         storage_context = kwargs.get('storage_context')
-        base_retriever = self.vectorIndex.as_retriever(similarity_top_k=top_k)
-        return AutoMergingRetriever(base_retriever, storage_context, verbose=True)
\ No newline at end of file
+        persist_dir = kwargs.get('persist_dir')
+        ratio = kwargs.get('ratio', DEFAULT_MERGE_RATIO)
+        base_retriever = self.vectorIndex.as_retriever(similarity_top_k=top_k, filters=kwargs.get('filters'))
+        if persist_dir is not None and os.path.exists(os.path.join(persist_dir, HIERARCHY_DIR)):
+            docstore = storage_context.docstore if storage_context is not None else self.vectorIndex.docstore
+            return HierarchyRetriever(base_retriever, HierarchyIndex.load(os.path.join(persist_dir, HIERARCHY_DIR)),
+                                      docstore, ratio=ratio)
+        return AutoMergingRetriever(base_retriever, storage_context, simple_ratio_thresh=ratio,
+                                    verbose=kwargs.get('verbose', False))
\ No newline at end of file
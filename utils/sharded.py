@@ -0,0 +1,477 @@
+import os
+import heapq
+import threading
+import multiprocessing
+from itertools import islice
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Literal, Optional, Tuple, cast
+import numpy as np
+import faiss
+from fsspec.implementations.local import LocalFileSystem
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult
+)
+from .vector_store import (
+    ascending,
+    document_key,
+    hamming_bits,
+    hamming_to_scores,
+    node_id_to_faiss_id,
+    read_index,
+    search_parameters,
+    select_ids
+)
+from .tracing import span
+
+ShardExecutor = Literal['thread', 'process']
+
+SHARD_DIR = "shards"
+
+_worker_index: Optional[Any] = None
+_worker_paths: List[str] = []
+
+
+def shard_paths(persist_dir: str, num_shards: int) -> List[str]:
+    """
+    Return the Faiss index file of every shard.
+
+    Args:
+        persist_dir (str): The storage directory.
+        num_shards (int): The number of shards.
+
+    Returns:
+        List[str]: The shard index paths, in shard order.
+    """
+    return [os.path.join(persist_dir, SHARD_DIR, f"shard-{i}.faiss") for i in range(num_shards)]
+
+
+def shard_of(node: BaseNode, num_shards: int) -> int:
+    """
+    Assign a node to a shard by the hash of its document, so a document lives in one shard.
+
+    Args:
+        node (BaseNode): The node.
+        num_shards (int): The number of shards.
+
+    Returns:
+        int: The shard number.
+    """
+    return document_key(node) % num_shards
+
+
+def _init_worker(path: str) -> None:
+    """
+    Memory-map the one shard a worker process serves.
+    """
+    global _worker_index
+    # One search per process at a time; parallelism comes from one process per shard.
+    faiss.omp_set_num_threads(1)
+    _worker_index = read_index(path, mmap=True)
+    _worker_paths.append(path)
+
+
+def _worker_info() -> Dict[str, Any]:
+    """
+    Describe the shard of a worker process: its pid, the files it opened, dimension, ordering
+    and binary code size.
+    """
+    return {"pid": os.getpid(), "paths": list(_worker_paths), "dimension": _worker_index.d,
+            "ascending": ascending(_worker_index), "hamming_bits": hamming_bits(_worker_index),
+            "l2": _worker_index.metric_type == faiss.METRIC_L2}
+
+
+def _search_worker(embeddings: np.ndarray, top_k: int, nprobe: Optional[int], ef_search: Optional[int],
+                   allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Search the shard of a worker process.
+    """
+    selector = faiss.IDSelectorBatch(allowed) if allowed is not None else None
+    params = search_parameters(_worker_index, nprobe, ef_search, selector)
+    return _worker_index.search(embeddings, top_k, params=params)
+
+
+class ShardedFaissVectorStore(BasePydanticVectorStore):
+    """
+    A Faiss vector store partitioned into independent shards.
+
+    Nodes are assigned to shards by the hash of their document and addressed by the
+    hash of their node id, like FaissIDMapVectorStore. Adds and persists run per shard
+    in parallel; a query searches every shard concurrently in a worker pool and the
+    per-shard top-k lists are merged with a heap.
+
+    With `executor='process'`, every shard is served by its own worker process, which
+    memory-maps that shard's persisted file and nothing else, so search scales past one
+    interpreter. The shards are then not loaded in the parent process, and the store is
+    read-only until it switches back to 'thread'.
+
+    With a MetadataIndex attached, metadata filters become a Faiss ID selector
+    applied inside every shard's search, built from that shard's allowed ids only.
+
+    Attributes:
+        normalize (bool): Whether to L2-normalize vectors on add and query (cosine metric).
+        executor (ShardExecutor): 'thread' or 'process' search workers.
+    """
+
+    stores_text: bool = False
+    normalize: bool = False
+    executor: ShardExecutor = 'thread'
+    _shards: Optional[List[Any]] = PrivateAttr(default=None)
+    _num_shards: int = PrivateAttr()
+    _paths: Optional[List[str]] = PrivateAttr(default=None)
+    _pool: Optional[Executor] = PrivateAttr(default=None)
+    _workers: Optional[List[Executor]] = PrivateAttr(default=None)
+    _info: Optional[Dict[str, Any]] = PrivateAttr(default=None)
+    _mmap: bool = PrivateAttr(default=False)
+    _lock: threading.Lock = PrivateAttr()
+    _metadata_index: Optional[Any] = PrivateAttr(default=None)
+
+    def __init__(self, shards: Optional[List[Any]] = None, normalize: bool = False,
+                 executor: ShardExecutor = 'thread', paths: Optional[List[str]] = None,
+                 mmap: bool = False) -> None:
+        """
+        Initialize the vector store.
+
+        Args:
+            shards (Optional[List[faiss.Index]]): One index accepting explicit ids per shard
+                (omit for 'process', whose workers load the shard files).
+            normalize (bool): Whether to L2-normalize vectors on add and query.
+            executor (ShardExecutor): 'thread' or 'process' search workers.
+            paths (Optional[List[str]]): The persisted file of each shard (required for 'process').
+            mmap (bool): Whether shards read from paths in this process are memory-mapped read-only.
+
+        Raises:
+            ValueError: If no shard or an invalid executor is provided, or 'process' lacks shard files.
+        """
+        if not shards and not paths:
+            raise ValueError("A sharded index needs at least one shard")
+        if executor not in ('thread', 'process'):
+            raise ValueError(f"Invalid shard executor: {executor}")
+        if executor == 'process' and paths is None:
+            raise ValueError("The 'process' executor searches persisted shards; persist the index first")
+        super().__init__(normalize=normalize, executor=executor)
+        self._paths = paths
+        self._mmap = mmap
+        self._num_shards = len(shards) if shards else len(paths)
+        self._lock = threading.Lock()
+        if executor == 'thread':
+            self._shards = shards or self._read_shards()
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str, num_shards: int, mmap: bool = False,
+                         executor: ShardExecutor = 'thread') -> "ShardedFaissVectorStore":
+        """
+        Load the shards persisted in persist_dir.
+
+        Args:
+            persist_dir (str): The storage directory.
+            num_shards (int): The number of shards.
+            mmap (bool): Whether to memory-map the shards read-only ('process' workers always do).
+            executor (ShardExecutor): 'thread' or 'process' search workers.
+
+        Returns:
+            ShardedFaissVectorStore: The loaded vector store.
+
+        Raises:
+            ValueError: If a shard file is missing.
+        """
+        paths = shard_paths(persist_dir, num_shards)
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            raise ValueError(f"No existing Faiss shard found at {missing[0]}.")
+        return cls(executor=executor, paths=paths, mmap=mmap)
+
+    @classmethod
+    def from_template(cls, faiss_index: Any, num_shards: int, normalize: bool = False) -> "ShardedFaissVectorStore":
+        """
+        Create empty shards as copies of one (trained) index.
+
+        Args:
+            faiss_index (faiss.Index): An empty index accepting explicit ids; IVF types must be trained.
+            num_shards (int): The number of shards.
+            normalize (bool): Whether to L2-normalize vectors on add and query.
+
+        Returns:
+            ShardedFaissVectorStore: The vector store.
+        """
+        shards = [faiss_index] + [faiss.clone_index(faiss_index) for _ in range(num_shards - 1)]
+        return cls(shards=shards, normalize=normalize)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ShardedFaissVectorStore"
+
+    @property
+    def client(self) -> Any:
+        """
+        The first shard; every shard shares its dimension, type and metric.
+
+        Raises:
+            ValueError: If the shards are served by worker processes and not loaded here.
+        """
+        if self._shards is None:
+            raise ValueError("The shards are served by worker processes and not loaded in this process")
+        return self._shards[0]
+
+    @property
+    def num_shards(self) -> int:
+        return self._num_shards
+
+    @property
+    def dimension(self) -> int:
+        """
+        The dimension of the vectors, asked from a worker process if the shards are not loaded here.
+        """
+        if self._shards is not None:
+            return self._shards[0].d
+        return self._worker_info()["dimension"]
+
+    def _ascending(self) -> bool:
+        if self._shards is not None:
+            return ascending(self._shards[0])
+        return self._worker_info()["ascending"]
+
+    def _hamming(self) -> Tuple[int, bool]:
+        if self._shards is not None:
+            return hamming_bits(self._shards[0]), self._shards[0].metric_type == faiss.METRIC_L2
+        return self._worker_info()["hamming_bits"], self._worker_info()["l2"]
+
+    def _worker_info(self) -> Dict[str, Any]:
+        if self._info is None:
+            self._info = self._get_workers()[0].submit(_worker_info).result()
+        return self._info
+
+    def _read_shards(self) -> List[Any]:
+        with ThreadPoolExecutor(max_workers=self.num_shards) as pool:
+            return list(pool.map(lambda path: read_index(path, mmap=self._mmap), self._paths))
+
+    def _get_pool(self) -> Executor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.num_shards, thread_name_prefix="faiss-shard")
+            return self._pool
+
+    def _get_workers(self) -> List[Executor]:
+        """
+        Start one single-process pool per shard, so shard i is only ever opened by worker i.
+        """
+        with self._lock:
+            if self._workers is None:
+                context = multiprocessing.get_context("spawn")
+                self._workers = [ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_worker,
+                                                     initargs=(path,)) for path in self._paths]
+            return self._workers
+
+    def close(self) -> None:
+        """
+        Shut down the search workers.
+        """
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+            if self._workers is not None:
+                for worker in self._workers:
+                    worker.shutdown()
+                self._workers = None
+                self._info = None
+
+    def enable_filtering(self, metadata_index: Optional[Any]) -> None:
+        """
+        Attach the metadata index used to resolve metadata filters (None detaches it).
+
+        Args:
+            metadata_index (Optional[MetadataIndex]): The metadata index.
+        """
+        self._metadata_index = metadata_index
+
+    def use_executor(self, executor: ShardExecutor) -> None:
+        """
+        Switch the search workers, e.g. to worker processes once the shards are persisted.
+
+        Args:
+            executor (ShardExecutor): 'thread' or 'process' search workers.
+
+        Raises:
+            ValueError: If an invalid executor is provided or 'process' lacks shard files.
+        """
+        if executor not in ('thread', 'process'):
+            raise ValueError(f"Invalid shard executor: {executor}")
+        if executor == 'process' and self._paths is None:
+            raise ValueError("The 'process' executor searches persisted shards; persist the index first")
+        if executor != self.executor:
+            self.close()
+            self.executor = executor
+            # Worker processes load their own shard; the parent only keeps shards for 'thread'.
+            self._shards = self._read_shards() if executor == 'thread' else None
+
+    def _check_writable(self) -> None:
+        if self.executor == 'process':
+            raise ValueError("A sharded index served by worker processes is read-only")
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        """
+        Add nodes to their shards, all shards in parallel.
+
+        Args:
+            nodes (List[BaseNode]): Nodes with embeddings.
+            **add_kwargs: Arbitrary keyword arguments (unused).
+
+        Returns:
+            List[str]: The Faiss ids of the added nodes.
+
+        Raises:
+            ValueError: If the store is served by worker processes.
+        """
+        self._check_writable()
+        if not nodes:
+            return []
+        embeddings = np.array([node.get_embedding() for node in nodes], dtype="float32")
+        if self.normalize:
+            faiss.normalize_L2(embeddings)
+        ids = np.array([node_id_to_faiss_id(node.node_id) for node in nodes], dtype="int64")
+        assignment = np.array([shard_of(node, self.num_shards) for node in nodes])
+
+        def add_shard(i: int) -> None:
+            mask = assignment == i
+            if mask.any():
+                self._shards[i].add_with_ids(embeddings[mask], ids[mask])
+
+        list(self._get_pool().map(add_shard, range(self.num_shards)))
+        return [str(i) for i in ids]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """
+        Delete the vector stored under the given node id; see FaissIDMapVectorStore.delete.
+
+        Args:
+            ref_doc_id (str): The node id to delete.
+            **delete_kwargs: Arbitrary keyword arguments (unused).
+        """
+        self.delete_nodes([ref_doc_id])
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters: Optional[Any] = None,
+                     **delete_kwargs: Any) -> None:
+        """
+        Delete the vectors of the given nodes from whichever shard holds them.
+
+        Args:
+            node_ids (Optional[List[str]]): The node ids to delete.
+            filters: Metadata filters (unsupported).
+            **delete_kwargs: Arbitrary keyword arguments (unused).
+
+        Raises:
+            ValueError: If metadata filters are provided or the store is read-only.
+        """
+        if filters is not None:
+            raise ValueError("Metadata filters not implemented for Faiss yet.")
+        self._check_writable()
+        if not node_ids:
+            return
+        ids = np.array([node_id_to_faiss_id(node_id) for node_id in node_ids], dtype="int64")
+        for shard in self._shards:
+            shard.remove_ids(ids)
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        """
+        Write every shard to `<dir of persist_path>/shards/`, in parallel.
+
+        Args:
+            persist_path (str): The vector store path chosen by the storage context.
+            fs: The filesystem (only local storage is supported).
+
+        Raises:
+            NotImplementedError: If a non-local filesystem is provided.
+            ValueError: If a store served by worker processes is persisted elsewhere.
+        """
+        if fs and not isinstance(fs, LocalFileSystem):
+            raise NotImplementedError("FAISS only supports local storage for now.")
+        paths = shard_paths(os.path.dirname(persist_path), self.num_shards)
+        if self._shards is None:
+            # Served by worker processes: the shard files are already the persisted state.
+            if paths != self._paths:
+                raise ValueError("A sharded index served by worker processes can only persist in place")
+            return
+        os.makedirs(os.path.dirname(paths[0]), exist_ok=True)
+
+        def write(i: int) -> None:
+            faiss.write_index(self._shards[i], f"{paths[i]}.tmp")
+            os.replace(f"{paths[i]}.tmp", paths[i])
+
+        with ThreadPoolExecutor(max_workers=self.num_shards) as pool:
+            list(pool.map(write, range(self.num_shards)))
+        self._paths = paths
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """
+        Query every shard for the top k most similar nodes and merge the results.
+
+        Args:
+            query (VectorStoreQuery): The query holding the embedding and similarity_top_k.
+            **kwargs: Arbitrary keyword arguments.
+                nprobe (int): The number of inverted lists to visit (IVF indexes).
+                ef_search (int): The size of the candidate list (HNSW indexes).
+
+        Returns:
+            VectorStoreQueryResult: The similarities and Faiss ids of the hits.
+
+        Raises:
+            ValueError: If metadata filters are provided.
+        """
+        return self.query_batch([query], **kwargs)[0]
+
+    def query_batch(self, queries: List[VectorStoreQuery], **kwargs: Any) -> List[VectorStoreQueryResult]:
+        """
+        Scatter several queries to every shard at once and gather the merged top k.
+
+        Args:
+            queries (List[VectorStoreQuery]): The queries holding the embeddings and similarity_top_k.
+            **kwargs: Arbitrary keyword arguments (see `query`).
+
+        Returns:
+            List[VectorStoreQueryResult]: One result per query.
+
+        Raises:
+            ValueError: If metadata filters are provided without a metadata index.
+        """
+        if not queries:
+            return []
+        if len(queries) > 1 and any(query.filters is not None for query in queries):
+            return [self.query_batch([query], **kwargs)[0] for query in queries]
+
+        embeddings = np.array([cast(List[float], query.query_embedding) for query in queries], dtype="float32")
+        if self.normalize:
+            faiss.normalize_L2(embeddings)
+        top_k = max(query.similarity_top_k for query in queries)
+        nprobe, ef_search = kwargs.get('nprobe'), kwargs.get('ef_search')
+        selection = select_ids(self._metadata_index, queries[0].filters, self.num_shards)
+        with span("faiss_search", queries=len(queries), k=top_k, shards=self.num_shards):
+            if self.executor == 'process':
+                # Each worker only receives the allowed ids of its own shard.
+                futures = [worker.submit(_search_worker, embeddings, top_k, nprobe, ef_search,
+                                         selection.ids[i] if selection is not None else None)
+                           for i, worker in enumerate(self._get_workers())]
+            else:
+                pool = self._get_pool()
+                futures = [pool.submit(shard.search, embeddings, top_k, params=search_parameters(
+                               shard, nprobe, ef_search, selection.selector(i) if selection is not None else None))
+                           for i, shard in enumerate(self._shards)]
+            parts = [future.result() for future in futures]
+
+        # Each shard returns its hits best first; distances ascend, inner products descend.
+        sign = 1.0 if self._ascending() else -1.0
+        bits, l2 = self._hamming()
+        results = []
+        for row, query in enumerate(queries):
+            hits = [[(sign * float(dist), int(idx)) for dist, idx in zip(dists[row], indices[row]) if idx >= 0]
+                    for dists, indices in parts]
+            merged = list(islice(heapq.merge(*hits), query.similarity_top_k))
+            similarities = [sign * dist for dist, _ in merged]
+            if bits:
+                similarities = hamming_to_scores(np.array(similarities), bits, l2).tolist()
+            results.append(VectorStoreQueryResult(similarities=similarities,
+                                                  ids=[str(idx) for _, idx in merged]))
+        return results
@@ -0,0 +1,445 @@
+import os
+import re
+import glob
+import json
+import math
+import sqlite3
+from collections import Counter
+from contextlib import closing
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.callbacks.base import CallbackManager
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore, QueryBundle
+from .metadata import new_version
+from .tracing import span
+
+BM25_DIR = "bm25"
+BM25_DB = "bm25.sqlite"
+ARRAYS = ("indptr", "doc_ids", "tfs")
+COMPACT_RATIO = 0.1
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+def _connect(persist_dir: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(os.path.join(persist_dir, BM25_DB), isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS vocab (term TEXT PRIMARY KEY, term_id INTEGER NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS nodes ("
+                 "slot INTEGER PRIMARY KEY, node_id TEXT NOT NULL, length REAL NOT NULL, alive INTEGER NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS delta (term_id INTEGER NOT NULL, slot INTEGER NOT NULL, tf REAL NOT NULL)")
+    return conn
+
+
+def _meta(conn: sqlite3.Connection) -> Dict[str, Any]:
+    return {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM meta")}
+
+
+def _remove_stale_files(persist_dir: str, generation: int) -> None:
+    """
+    Delete postings arrays older than the previous generation (kept for concurrent
+    readers) and the files of the JSON layout.
+    """
+    for name in ARRAYS:
+        for path in glob.glob(os.path.join(persist_dir, f"{name}.*.npy")):
+            stamp = os.path.basename(path)[len(name) + 1:-len(".npy")]
+            if stamp.isdigit() and int(stamp) < generation - 1:
+                os.remove(path)
+    for name in ("meta.json", *(f"{name}.npy" for name in (*ARRAYS, "doc_len"))):
+        path = os.path.join(persist_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class BM25Index:
+    """
+    A persisted, incrementally updatable BM25 index.
+
+    Raw term frequencies are kept as term-major postings (CSR arrays: `indptr`,
+    `doc_ids`, `tfs`) plus per-document lengths, and BM25 is scored at query time,
+    so adding or removing nodes never requires re-tokenizing the corpus. Added nodes
+    go to a delta and removed nodes are masked out; once either passes `compact_ratio`
+    of the index, `persist` compacts both into the arrays, which are saved as .npy
+    files and memory-mapped on load.
+
+    Attributes:
+        k1 (float): The BM25 term frequency saturation.
+        b (float): The BM25 length normalization.
+        language (str): The stemmer language.
+        compact_ratio (float): The share of delta postings or removed slots that triggers compaction.
+        node_ids (List[str]): The node id of each document slot.
+        version (int): A number that changes whenever the index does.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, language: str = "english",
+                 compact_ratio: float = COMPACT_RATIO):
+        """
+        Create an empty BM25 index.
+
+        Args:
+            k1 (float): The BM25 term frequency saturation.
+            b (float): The BM25 length normalization.
+            language (str): The stemmer language; English also removes stopwords.
+            compact_ratio (float): The share of delta postings or removed slots that triggers compaction.
+        """
+        self.k1 = k1
+        self.b = b
+        self.language = language
+        self.compact_ratio = compact_ratio
+        self.vocab: Dict[str, int] = {}
+        self.node_ids: List[str] = []
+        self.indptr = np.zeros(1, dtype="int64")
+        self.doc_ids = np.zeros(0, dtype="int32")
+        self.tfs = np.zeros(0, dtype="float32")
+        self.doc_len = np.zeros(0, dtype="float32")
+        self.alive = np.zeros(0, dtype=bool)
+        self.version = new_version()
+        self._slots: Dict[str, int] = {}
+        self._delta: Dict[int, List[Tuple[int, float]]] = {}
+        self._removed: List[int] = []
+        self._synced: Optional[Tuple[str, int, int]] = None
+        import Stemmer
+        from bm25s.stopwords import STOPWORDS_EN
+        self._stemmer = Stemmer.Stemmer(language)
+        self._stopwords = set(STOPWORDS_EN) if language == "english" else set()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def tokenize(self, text: str) -> List[str]:
+        """
+        Split a text into lower-cased, stopword-free, stemmed tokens.
+
+        Args:
+            text (str): The text to tokenize.
+
+        Returns:
+            List[str]: The tokens.
+        """
+        tokens = [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in self._stopwords]
+        return self._stemmer.stemWords(tokens)
+
+    def add(self, nodes: Sequence[BaseNode]) -> None:
+        """
+        Index nodes, replacing any previous version with the same node id.
+
+        Args:
+            nodes (Sequence[BaseNode]): The nodes to index.
+        """
+        self.remove([node.node_id for node in nodes if node.node_id in self._slots])
+        lengths = []
+        for node in nodes:
+            slot = len(self.node_ids)
+            tokens = self.tokenize(node.get_content(metadata_mode=MetadataMode.EMBED))
+            for term, count in Counter(tokens).items():
+                term_id = self.vocab.setdefault(term, len(self.vocab))
+                self._delta.setdefault(term_id, []).append((slot, float(count)))
+            self.node_ids.append(node.node_id)
+            self._slots[node.node_id] = slot
+            lengths.append(len(tokens))
+        self.doc_len = np.concatenate([self.doc_len, np.array(lengths, dtype="float32")])
+        self.alive = np.concatenate([self.alive, np.ones(len(lengths), dtype=bool)])
+        self.version = new_version()
+
+    def remove(self, node_ids: Sequence[str]) -> None:
+        """
+        Remove nodes from the index; unknown node ids are ignored.
+
+        Args:
+            node_ids (Sequence[str]): The node ids to remove.
+        """
+        for node_id in node_ids:
+            slot = self._slots.pop(node_id, None)
+            if slot is not None:
+                self.alive[slot] = False
+                self._removed.append(slot)
+                self.version = new_version()
+
+    def _postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        if term_id + 1 < len(self.indptr):
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs, tfs = self.doc_ids[start:end], self.tfs[start:end]
+        else:
+            docs, tfs = self.doc_ids[:0], self.tfs[:0]
+        delta = self._delta.get(term_id)
+        if delta:
+            delta_docs, delta_tfs = zip(*delta)
+            docs = np.concatenate([docs, np.array(delta_docs, dtype="int32")])
+            tfs = np.concatenate([tfs, np.array(delta_tfs, dtype="float32")])
+        return docs, tfs
+
+    def scores(self, query: str, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Score every document slot against a query.
+
+        Args:
+            query (str): The query string.
+            mask (Optional[np.ndarray]): The slots allowed by a metadata filter; postings of
+                other slots are skipped.
+
+        Returns:
+            np.ndarray: The BM25 score of each slot (0 for removed or masked slots).
+        """
+        scores = np.zeros(len(self.node_ids), dtype="float32")
+        num_docs = len(self._slots)
+        if num_docs == 0:
+            return scores
+        avgdl = max(float(self.doc_len[self.alive].mean()), 1e-9)
+        for term in set(self.tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            docs, tfs = self._postings(term_id)
+            live = self.alive[docs]
+            docs, tfs = docs[live], tfs[live]
+            # IDF counts the whole corpus, so filtering does not change the scores of allowed slots.
+            df = len(docs)
+            if mask is not None:
+                allowed = mask[docs]
+                docs, tfs = docs[allowed], tfs[allowed]
+            if len(docs) == 0:
+                continue
+            idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            norm = tfs + self.k1 * (1 - self.b + self.b * self.doc_len[docs] / avgdl)
+            scores[docs] += idf * tfs * (self.k1 + 1) / norm
+        return scores
+
+    def search(self, query: str, top_k: int, mask: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        Return the top k node ids for a query.
+
+        Args:
+            query (str): The query string.
+            top_k (int): The number of results to return.
+            mask (Optional[np.ndarray]): The slots allowed by a metadata filter.
+
+        Returns:
+            List[Tuple[str, float]]: The node ids and scores, best first.
+        """
+        scores = self.scores(query, mask)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.node_ids[i], float(scores[i])) for i in candidates]
+
+    def compact(self) -> None:
+        """
+        Merge the in-memory delta into the postings arrays and drop removed slots.
+        """
+        live_slots = np.flatnonzero(self.alive)
+        remap = np.full(len(self.node_ids), -1, dtype="int64")
+        remap[live_slots] = np.arange(len(live_slots))
+
+        counts = np.zeros(len(self.vocab), dtype="int64")
+        doc_parts, tf_parts = [], []
+        for term_id in range(len(self.vocab)):
+            docs, tfs = self._postings(term_id)
+            keep = remap[docs] >= 0
+            doc_parts.append(remap[docs[keep]].astype("int32"))
+            tf_parts.append(tfs[keep])
+            counts[term_id] = int(keep.sum())
+
+        self.indptr = np.concatenate([[0], np.cumsum(counts)]).astype("int64")
+        self.doc_ids = np.concatenate(doc_parts) if doc_parts else np.zeros(0, dtype="int32")
+        self.tfs = np.concatenate(tf_parts) if tf_parts else np.zeros(0, dtype="float32")
+        self.node_ids = [self.node_ids[i] for i in live_slots]
+        self.doc_len = np.asarray(self.doc_len[live_slots], dtype="float32")
+        self.alive = np.ones(len(live_slots), dtype=bool)
+        self._slots = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self._delta = {}
+        self._removed = []
+        self._synced = None
+        self.version = new_version()
+
+    def _needs_compaction(self) -> bool:
+        dead = len(self.node_ids) - len(self._slots)
+        delta = sum(len(postings) for postings in self._delta.values())
+        return (dead > self.compact_ratio * max(len(self.node_ids), 1)
+                or delta > self.compact_ratio * max(len(self.doc_ids), 1))
+
+    def persist(self, persist_dir: str) -> None:
+        """
+        Save the index to a directory.
+
+        The node ids, vocabulary, document lengths and delta postings live in a SQLite
+        file, and a persist into the directory the index was loaded from (or last saved
+        to) only writes what changed since. The postings arrays are compacted and
+        rewritten as a new generation of .npy files only once the delta postings or the
+        removed slots pass `compact_ratio` of the index.
+
+        Args:
+            persist_dir (str): The directory to save to.
+        """
+        os.makedirs(persist_dir, exist_ok=True)
+        persist_dir = os.path.abspath(persist_dir)
+        synced = self._synced if self._synced is not None and self._synced[0] == persist_dir else None
+        rewrite = synced is None or self._needs_compaction()
+        if rewrite:
+            self.compact()
+        with closing(_connect(persist_dir)) as conn:
+            old_generation = _meta(conn).get("generation", 0)
+            generation = old_generation + 1 if rewrite else old_generation
+            if rewrite:
+                for name in ARRAYS:
+                    np.save(os.path.join(persist_dir, f"{name}.{generation}.npy"), getattr(self, name))
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if rewrite:
+                    conn.execute("DELETE FROM nodes")
+                    conn.execute("DELETE FROM delta")
+                    conn.execute("DELETE FROM vocab")
+                first_slot, first_term = (synced[1], synced[2]) if not rewrite else (0, 0)
+                conn.executemany("INSERT INTO vocab VALUES (?, ?)",
+                                 ((term, term_id) for term, term_id in self.vocab.items() if term_id >= first_term))
+                conn.executemany("INSERT INTO nodes VALUES (?, ?, ?, ?)",
+                                 ((slot, self.node_ids[slot], float(self.doc_len[slot]), bool(self.alive[slot]))
+                                  for slot in range(first_slot, len(self.node_ids))))
+                conn.executemany("UPDATE nodes SET alive = 0 WHERE slot = ?",
+                                 ((slot,) for slot in self._removed if slot < first_slot))
+                conn.executemany("INSERT INTO delta VALUES (?, ?, ?)",
+                                 ((term_id, slot, tf) for term_id, postings in self._delta.items()
+                                  for slot, tf in postings if slot >= first_slot))
+                meta = {"k1": self.k1, "b": self.b, "language": self.language,
+                        "compact_ratio": self.compact_ratio, "generation": generation}
+                conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                 ((key, json.dumps(value)) for key, value in meta.items()))
+        if rewrite:
+            _remove_stale_files(persist_dir, generation)
+        self._synced = (persist_dir, len(self.node_ids), len(self.vocab))
+        self._removed = []
+
+    @classmethod
+    def load(cls, persist_dir: str, mmap: bool = True) -> "BM25Index":
+        """
+        Load an index saved with `persist`.
+
+        Args:
+            persist_dir (str): The directory to load from.
+            mmap (bool): Whether to memory-map the postings arrays.
+
+        Returns:
+            BM25Index: The loaded index.
+
+        Raises:
+            FileNotFoundError: If no index exists in persist_dir.
+        """
+        persist_dir = os.path.abspath(persist_dir)
+        if not os.path.exists(os.path.join(persist_dir, BM25_DB)):
+            if os.path.exists(os.path.join(persist_dir, "meta.json")):
+                return cls._load_json(persist_dir, mmap)
+            raise FileNotFoundError(f"No BM25 index found at {persist_dir}")
+        with closing(_connect(persist_dir)) as conn:
+            with conn:
+                conn.execute("BEGIN")
+                meta = _meta(conn)
+                vocab = dict(conn.execute("SELECT term, term_id FROM vocab"))
+                nodes = conn.execute("SELECT node_id, length, alive FROM nodes ORDER BY slot").fetchall()
+                delta = conn.execute("SELECT term_id, slot, tf FROM delta ORDER BY rowid").fetchall()
+
+        index = cls(k1=meta["k1"], b=meta["b"], language=meta["language"], compact_ratio=meta["compact_ratio"])
+        index.vocab = vocab
+        index.node_ids = [node_id for node_id, _, _ in nodes]
+        index.doc_len = np.array([length for _, length, _ in nodes], dtype="float32")
+        index.alive = np.array([bool(alive) for _, _, alive in nodes], dtype=bool)
+        index._slots = {node_id: i for i, (node_id, _, alive) in enumerate(nodes) if alive}
+        for term_id, slot, tf in delta:
+            index._delta.setdefault(term_id, []).append((slot, tf))
+        mmap_mode = "r" if mmap else None
+        for name in ARRAYS:
+            setattr(index, name, np.load(os.path.join(persist_dir, f"{name}.{meta['generation']}.npy"),
+                                         mmap_mode=mmap_mode))
+        index._synced = (persist_dir, len(index.node_ids), len(index.vocab))
+        return index
+
+    @classmethod
+    def _load_json(cls, persist_dir: str, mmap: bool) -> "BM25Index":
+        """
+        Load an index saved by earlier versions, with the vocabulary and node ids in meta.json.
+        """
+        with open(os.path.join(persist_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(k1=meta["k1"], b=meta["b"], language=meta["language"])
+        index.vocab = meta["vocab"]
+        index.node_ids = meta["node_ids"]
+        index._slots = {node_id: i for i, node_id in enumerate(index.node_ids)}
+        mmap_mode = "r" if mmap else None
+        for name in ("indptr", "doc_ids", "tfs", "doc_len"):
+            setattr(index, name, np.load(os.path.join(persist_dir, f"{name}.npy"), mmap_mode=mmap_mode))
+        index.alive = np.ones(len(index.node_ids), dtype=bool)
+        return index
+
+    @classmethod
+    def from_nodes(cls, nodes: Sequence[BaseNode], **kwargs: Any) -> "BM25Index":
+        """
+        Build an index over nodes.
+
+        Args:
+            nodes (Sequence[BaseNode]): The nodes to index.
+            **kwargs: Arbitrary keyword arguments passed to the constructor.
+
+        Returns:
+            BM25Index: The index.
+        """
+        index = cls(**kwargs)
+        index.add(nodes)
+        return index
+
+
+class BM25IndexRetriever(BaseRetriever):
+    """
+    A retriever over a persisted BM25Index that fetches only the top k nodes from the docstore.
+
+    With metadata filters, only the postings of nodes matching the filters are scored.
+
+    Attributes:
+        bm25_index (BM25Index): The sparse index.
+        docstore: The document store holding the nodes.
+        similarity_top_k (int): The number of results to return.
+        metadata_index (Optional[MetadataIndex]): The metadata index resolving the filters.
+        filters (Optional[MetadataFilters]): The metadata filters.
+    """
+
+    def __init__(self, bm25_index: BM25Index, docstore: Any, similarity_top_k: int = 2,
+                 callback_manager: Optional[CallbackManager] = None, metadata_index: Optional[Any] = None,
+                 filters: Optional[Any] = None):
+        """
+        Initialize the BM25IndexRetriever.
+
+        Args:
+            bm25_index (BM25Index): The sparse index.
+            docstore: The document store holding the nodes.
+            similarity_top_k (int): The number of results to return.
+            callback_manager (Optional[CallbackManager]): The callback manager.
+            metadata_index (Optional[MetadataIndex]): The metadata index resolving the filters.
+            filters (Optional[MetadataFilters]): The metadata filters.
+
+        Raises:
+            ValueError: If filters are provided without a metadata index.
+        """
+        if filters is not None and metadata_index is None:
+            raise ValueError("Metadata filters need a metadata index; build it with Faiss(metadata_index=True)")
+        self.bm25_index = bm25_index
+        self.docstore = docstore
+        self.similarity_top_k = similarity_top_k
+        self.metadata_index = metadata_index
+        self.filters = filters
+        super().__init__(callback_manager=callback_manager)
+
+    def _mask(self) -> Optional[np.ndarray]:
+        if self.filters is None:
+            return None
+        allowed = self.metadata_index.mask(self.filters)
+        alignment = self.metadata_index.align(self.bm25_index.node_ids, self.bm25_index.version)
+        mask = np.zeros(len(alignment), dtype=bool)
+        known = alignment >= 0
+        mask[known] = allowed[alignment[known]]
+        return mask
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        with span("bm25_search", k=self.similarity_top_k, filtered=self.filters is not None) as s:
+            hits = self.bm25_index.search(query_bundle.query_str, self.similarity_top_k, self._mask())
+            s.set(nodes_out=len(hits))
+        nodes = self.docstore.get_nodes([node_id for node_id, _ in hits])
+        return [NodeWithScore(node=node, score=score) for node, (_, score) in zip(nodes, hits)]
@@ -0,0 +1,165 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from llama_index.core.storage.kvstore.types import BaseKVStore, DEFAULT_COLLECTION, DEFAULT_BATCH_SIZE
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.index_store.keyval_index_store import KVIndexStore
+
+SQLITE_FILE = "store.sqlite"
+ID_MAP_COLLECTION = "faiss_ids"
+
+
+class SQLiteKVStore(BaseKVStore):
+    """
+    A key-value store backed by a single SQLite file.
+
+    Values are read on demand, so only the nodes returned by a search are ever
+    loaded into memory. The file is opened in WAL mode with memory-mapped I/O, so
+    several worker processes on one host read it through the shared page cache.
+
+    Attributes:
+        path (str): The path of the SQLite file.
+    """
+
+    def __init__(self, path: str, mmap_size: int = 1 << 30):
+        """
+        Open (or create) the SQLite file.
+
+        Args:
+            path (str): The path of the SQLite file.
+            mmap_size (int): The number of bytes SQLite may memory-map.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "collection TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (collection, key)) WITHOUT ROWID"
+        )
+
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put_all([(key, val)], collection=collection)
+
+    async def aput(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put(key, val, collection=collection)
+
+    def put_all(self, kv_pairs: List[Tuple[str, dict]], collection: str = DEFAULT_COLLECTION,
+                batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        rows = [(collection, key, json.dumps(val)) for key, val in kv_pairs]
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", rows)
+
+    async def aput_all(self, kv_pairs: List[Tuple[str, dict]], collection: str = DEFAULT_COLLECTION,
+                       batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        self.put_all(kv_pairs, collection=collection, batch_size=batch_size)
+
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE collection = ? AND key = ?", (collection, key)
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    async def aget(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        return self.get(key, collection=collection)
+
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM kv WHERE collection = ?", (collection,)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return self.get_all(collection=collection)
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute(
+                    "DELETE FROM kv WHERE collection = ? AND key = ?", (collection, key)
+                )
+        return cursor.rowcount > 0
+
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection=collection)
+
+
+def sqlite_stores(persist_dir: str) -> Tuple[KVDocumentStore, KVIndexStore]:
+    """
+    Open the docstore and index store kept in a SQLite file under persist_dir.
+
+    Args:
+        persist_dir (str): The storage directory.
+
+    Returns:
+        Tuple[KVDocumentStore, KVIndexStore]: The document store and the index store.
+    """
+    os.makedirs(persist_dir, exist_ok=True)
+    kvstore = SQLiteKVStore(os.path.join(persist_dir, SQLITE_FILE))
+    return KVDocumentStore(kvstore), KVIndexStore(kvstore)
+
+
+class FaissIdMap:
+    """
+    The Faiss id -> node id mapping, kept in the docstore's key-value store.
+
+    llama-index keeps this mapping in the index struct's `nodes_dict`, which is one
+    JSON value rewritten on every insert and parsed in full on every load. Here each
+    id is its own entry: inserts write only the new ids, and with the SQLite layout a
+    search reads only the ids it returns.
+
+    Attributes:
+        kvstore (BaseKVStore): The key-value store of the docstore.
+    """
+
+    def __init__(self, kvstore: BaseKVStore, collection: str = ID_MAP_COLLECTION):
+        """
+        Initialize the FaissIdMap.
+
+        Args:
+            kvstore (BaseKVStore): The key-value store of the docstore.
+            collection (str): The collection holding the mapping.
+        """
+        self.kvstore = kvstore
+        self._collection = collection
+
+    def get(self, faiss_id: str) -> Optional[str]:
+        """
+        Look up the node id of a Faiss id.
+
+        Args:
+            faiss_id (str): The Faiss id, as returned in a query result.
+
+        Returns:
+            Optional[str]: The node id, or None if the id is unknown.
+        """
+        value = self.kvstore.get(str(faiss_id), collection=self._collection)
+        return None if value is None else value["node_id"]
+
+    def add(self, pairs: Iterable[Tuple[str, str]]) -> None:
+        """
+        Record (Faiss id, node id) pairs.
+
+        Args:
+            pairs (Iterable[Tuple[str, str]]): The pairs to record.
+        """
+        self.kvstore.put_all([(str(faiss_id), {"node_id": node_id}) for faiss_id, node_id in pairs],
+                             collection=self._collection)
+
+    def remove(self, faiss_ids: Iterable[str]) -> None:
+        """
+        Forget Faiss ids; unknown ids are ignored.
+
+        Args:
+            faiss_ids (Iterable[str]): The Faiss ids.
+        """
+        for faiss_id in faiss_ids:
+            self.kvstore.delete(str(faiss_id), collection=self._collection)
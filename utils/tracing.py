@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from llama_index.core import Settings
+from llama_index.core.callbacks import CallbackManager, CBEventType, EventPayload
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.token_counting import get_llm_token_counts
+from llama_index.core.utilities.token_counting import TokenCounter
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("rag_span", default=None)
+_tracer: Optional["Tracer"] = None
+
+
+class Span:
+    """
+    A timed stage of a query.
+
+    Attributes:
+        name (str): The stage name.
+        trace_id (str): The id of the trace (one per top-level query).
+        span_id (str): The id of the span.
+        parent_id (Optional[str]): The id of the enclosing span.
+        start (float): The wall-clock start time.
+        duration (Optional[float]): The duration in seconds, once ended.
+        attributes (Dict[str, Any]): Stage details such as node counts.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "duration", "attributes",
+                 "_spans", "_perf", "_token")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.attributes = attributes
+        self._spans: List["Span"] = parent._spans if parent is not None else []
+        self._perf = time.perf_counter()
+        self._token = None
+
+    def set(self, **attributes: Any) -> None:
+        """
+        Add attributes to the span.
+        """
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "trace_id": self.trace_id, "span_id": self.span_id,
+                "parent_id": self.parent_id, "start": self.start, "duration": self.duration,
+                "attributes": self.attributes}
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        _current.reset(self._token)
+        self.end(error=exc_type.__name__ if exc_type is not None else None)
+
+    def end(self, error: Optional[str] = None) -> None:
+        """
+        End the span and hand it to the tracer; ending a root span exports its trace.
+        """
+        self.duration = time.perf_counter() - self._perf
+        if error is not None:
+            self.attributes["error"] = error
+        self._spans.append(self)
+        tracer = _tracer
+        if tracer is not None:
+            tracer.record(self)
+
+
+class _NoopSpan:
+    """
+    The span returned while tracing is disabled.
+    """
+
+    __slots__ = ()
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class JSONLExporter:
+    """
+    Append every finished trace to a JSONL file, one trace (with all its spans) per line.
+
+    Attributes:
+        path (str): The JSONL file.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the JSONLExporter.
+
+        Args:
+            path (str): The JSONL file.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        line = json.dumps({"trace_id": spans[-1].trace_id, "spans": [span.to_dict() for span in spans]}, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class Tracer:
+    """
+    Collects spans and counters and aggregates them into metrics.
+
+    Span durations are kept as per-stage histograms and counters by name and labels,
+    both exportable in the Prometheus text format; finished traces go to the exporters.
+
+    Attributes:
+        exporters (List[Any]): Objects with an `export(spans)` method, called per finished trace.
+        handler (Optional[TracingCallbackHandler]): The LlamaIndex callback handler feeding the tracer.
+        callback_manager (Optional[CallbackManager]): The callback manager the handler is attached to.
+    """
+
+    def __init__(self, exporters: Optional[List[Any]] = None):
+        """
+        Initialize the Tracer.
+
+        Args:
+            exporters (Optional[List[Any]]): The trace exporters.
+        """
+        self.exporters = exporters or []
+        self.handler: Optional[TracingCallbackHandler] = None
+        self.callback_manager: Optional[CallbackManager] = None
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, List[float]] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = defaultdict(float)
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            histogram = self._histograms.setdefault(span.name, [0.0] * (len(DURATION_BUCKETS) + 3))
+            histogram[bisect.bisect_left(DURATION_BUCKETS, span.duration)] += 1
+            histogram[-2] += span.duration
+            histogram[-1] += 1
+        if span.parent_id is None:
+            for exporter in self.exporters:
+                exporter.export(span._spans)
+
+    def count(self, name: str, value: float = 1, **labels: str) -> None:
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Return the aggregated metrics.
+
+        Returns:
+            Dict[str, Any]: Per-stage count, total and mean seconds, and the counters.
+        """
+        with self._lock:
+            stages = {name: {"count": h[-1], "seconds": h[-2], "mean": h[-2] / h[-1] if h[-1] else 0.0}
+                      for name, h in self._histograms.items()}
+            counters = {name + "".join(f"[{k}={v}]" for k, v in labels): value
+                        for (name, labels), value in self._counters.items()}
+        return {"stages": stages, "counters": counters}
+
+    def prometheus_text(self) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics text.
+        """
+        lines = ["# TYPE rag_stage_duration_seconds histogram"]
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                cumulative = 0.0
+                for bound, count in zip(DURATION_BUCKETS + (float("inf"),), histogram):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'rag_stage_duration_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative:g}')
+                lines.append(f'rag_stage_duration_seconds_sum{{stage="{name}"}} {histogram[-2]:.6f}')
+                lines.append(f'rag_stage_duration_seconds_count{{stage="{name}"}} {histogram[-1]:g}')
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE rag_{name}_total counter")
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                        lines.append(f"rag_{name}_total{{{label_text}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Atomically write the Prometheus text to a file (e.g. for the node_exporter textfile collector).
+
+        Args:
+            path (str): The output file.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Turn LlamaIndex callback events (embedding, retrieval, reranking, synthesis, LLM)
+    into spans of the current trace, counting nodes and LLM tokens.
+    """
+
+    _EVENTS = {
+        CBEventType.EMBEDDING: "embed",
+        CBEventType.RETRIEVE: "retrieve",
+        CBEventType.RERANKING: "rerank",
+        CBEventType.SYNTHESIZE: "synthesize",
+        CBEventType.LLM: "llm",
+    }
+
+    def __init__(self, tracer: Tracer):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self.tracer = tracer
+        self._token_counter = TokenCounter()
+        self._spans: Dict[str, Span] = {}
+        self._lock = threading.Lock()
+
+    def on_event_start(self, event_type: CBEventType, payload: Optional[Dict[str, Any]] = None,
+                       event_id: str = "", parent_id: str = "", **kwargs: Any) -> str:
+        name = self._EVENTS.get(event_type)
+        if name is not None:
+            with self._lock:
+                parent = self._spans.get(parent_id) or _current.get()
+                span = Span(name, parent, {})
+                self._spans[event_id] = span
+            if payload and EventPayload.NODES in payload:
+                span.set(nodes_in=len(payload[EventPayload.NODES]))
+        return event_id
+
+    def on_event_end(self, event_type: CBEventType, payload: Optional[Dict[str, Any]] = None,
+                     event_id: str = "", **kwargs: Any) -> None:
+        with self._lock:
+            span = self._spans.pop(event_id, None)
+        if span is None:
+            return
+        payload = payload or {}
+        if EventPayload.NODES in payload:
+            span.set(nodes_out=len(payload[EventPayload.NODES]))
+            self.tracer.count("nodes", len(payload[EventPayload.NODES]), stage=span.name)
+        if event_type == CBEventType.LLM:
+            try:
+                counts = get_llm_token_counts(self._token_counter, payload)
+                span.set(prompt_tokens=counts.prompt_token_count, completion_tokens=counts.completion_token_count)
+                self.tracer.count("tokens", counts.prompt_token_count, kind="prompt")
+                self.tracer.count("tokens", counts.completion_token_count, kind="completion")
+            except ValueError:
+                pass
+        if event_type == CBEventType.EMBEDDING and EventPayload.CHUNKS in payload:
+            self.tracer.count("embedded_texts", len(payload[EventPayload.CHUNKS]))
+        span.end()
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        pass
+
+    def end_trace(self, trace_id: Optional[str] = None, trace_map: Optional[Dict[str, List[str]]] = None) -> None:
+        pass
+
+
+def enable_tracing(jsonl_path: Optional[str] = None, callback_manager: Optional[CallbackManager] = None) -> Tracer:
+    """
+    Start tracing queries.
+
+    Args:
+        jsonl_path (Optional[str]): A JSONL file receiving every finished trace.
+        callback_manager (Optional[CallbackManager]): The callback manager to hook into for
+            LlamaIndex events; defaults to `Settings.callback_manager`.
+
+    Returns:
+        Tracer: The active tracer.
+    """
+    global _tracer
+    disable_tracing()
+    tracer = Tracer([JSONLExporter(jsonl_path)] if jsonl_path else [])
+    tracer.handler = TracingCallbackHandler(tracer)
+    tracer.callback_manager = callback_manager or Settings.callback_manager
+    tracer.callback_manager.add_handler(tracer.handler)
+    _tracer = tracer
+    return tracer
+
+
+def disable_tracing() -> None:
+    """
+    Stop tracing; `span` becomes a no-op.
+    """
+    global _tracer
+    if _tracer is not None:
+        _tracer.callback_manager.remove_handler(_tracer.handler)
+        _tracer = None
+
+
+def get_tracer() -> Optional[Tracer]:
+    """
+    Return the active tracer, or None if tracing is disabled.
+    """
+    return _tracer
+
+
+def span(name: str, **attributes: Any) -> Any:
+    """
+    Time a stage as a child of the current span.
+
+    Use as `with span("faiss_search", k=10) as s: ...; s.set(nodes_out=n)`. While
+    tracing is disabled this returns a shared no-op object.
+
+    Args:
+        name (str): The stage name.
+        **attributes: Initial span attributes.
+
+    Returns:
+        Any: A Span, or a no-op span when tracing is disabled.
+    """
+    if _tracer is None:
+        return _NOOP
+    return Span(name, _current.get(), attributes)
+
+
+def count(name: str, value: float = 1, **labels: str) -> None:
+    """
+    Increment a counter; a no-op while tracing is disabled.
+
+    Args:
+        name (str): The counter name.
+        value (float): The increment.
+        **labels: The counter labels.
+    """
+    tracer = _tracer
+    if tracer is not None:
+        tracer.count(name, value, **labels)
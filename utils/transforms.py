@@ -0,0 +1,469 @@
+import os
+import re
+import asyncio
+import contextvars
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+from llama_index.core.base.response.schema import RESPONSE_TYPE
+from llama_index.core.indices.query.query_transform.base import BaseQueryTransform
+from llama_index.core.prompts import BasePromptTemplate, PromptTemplate
+from llama_index.core.prompts.default_prompts import DEFAULT_HYDE_PROMPT
+from llama_index.core.prompts.mixin import PromptMixinType
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from .retriever import embed_queries, retrieve_batch
+from .reranker import rerank_batch
+from .tracing import span
+
+MEMO_FILE = "llm_memo.sqlite"
+
+DECOMPOSE_PROMPT = PromptTemplate(
+    "The original question is: {query_str}\n"
+    "Previous reasoning:\n{prev_reasoning}\n\n"
+    "Given the previous reasoning, write at most {max_questions} new questions that a knowledge "
+    "source can answer and that help answer the original question. The questions must be "
+    "answerable independently of each other; a question that needs the answer of another one "
+    "belongs to a later step. Write one question per line and nothing else. If the previous "
+    "reasoning already answers the original question, write None.\n"
+    "Questions:\n"
+)
+
+
+class LLMMemo:
+    """
+    An on-disk memo of LLM completions keyed by (model name, prompt, sample).
+
+    Query transforms (HyDE passages, decomposed questions) only depend on the prompt,
+    so repeated and re-run queries skip the LLM entirely.
+
+    Attributes:
+        path (str): The path of the SQLite file.
+    """
+
+    def __init__(self, cache_dir: str):
+        """
+        Open (or create) the memo.
+
+        Args:
+            cache_dir (str): The directory holding the memo file.
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, MEMO_FILE)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS memo ("
+            "model TEXT NOT NULL, hash BLOB NOT NULL, output TEXT NOT NULL, "
+            "PRIMARY KEY (model, hash)) WITHOUT ROWID"
+        )
+
+    @staticmethod
+    def _hash(prompt: str, sample: int) -> bytes:
+        return hashlib.sha256(f"{sample}\0{prompt}".encode("utf-8")).digest()
+
+    def get(self, model_name: str, prompt: str, sample: int = 0) -> Optional[str]:
+        """
+        Look up a memoized completion.
+
+        Args:
+            model_name (str): The LLM name.
+            prompt (str): The prompt.
+            sample (int): The sample index, for prompts completed several times.
+
+        Returns:
+            Optional[str]: The completion, or None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output FROM memo WHERE model = ? AND hash = ?", (model_name, self._hash(prompt, sample))
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def put(self, model_name: str, prompt: str, output: str, sample: int = 0) -> None:
+        """
+        Memoize a completion.
+
+        Args:
+            model_name (str): The LLM name.
+            prompt (str): The prompt.
+            output (str): The completion.
+            sample (int): The sample index, for prompts completed several times.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO memo VALUES (?, ?, ?)", (model_name, self._hash(prompt, sample), output)
+            )
+
+
+def complete(llm: Any, prompt: str, memo: Optional[LLMMemo] = None, sample: int = 0) -> str:
+    """
+    Complete a prompt, going through the memo if one is given.
+
+    Args:
+        llm: The language model.
+        prompt (str): The prompt.
+        memo (Optional[LLMMemo]): The completion memo.
+        sample (int): The sample index, for prompts completed several times.
+
+    Returns:
+        str: The completion.
+    """
+    model_name = llm.metadata.model_name
+    output = memo.get(model_name, prompt, sample) if memo is not None else None
+    if output is None:
+        output = llm.complete(prompt).text
+        if memo is not None:
+            memo.put(model_name, prompt, output, sample)
+    return output
+
+
+async def acomplete(llm: Any, prompt: str, memo: Optional[LLMMemo] = None, sample: int = 0) -> str:
+    """
+    Asynchronously complete a prompt, going through the memo if one is given.
+
+    Args:
+        llm: The language model.
+        prompt (str): The prompt.
+        memo (Optional[LLMMemo]): The completion memo.
+        sample (int): The sample index, for prompts completed several times.
+
+    Returns:
+        str: The completion.
+    """
+    model_name = llm.metadata.model_name
+    output = memo.get(model_name, prompt, sample) if memo is not None else None
+    if output is None:
+        output = (await llm.acomplete(prompt)).text
+        if memo is not None:
+            memo.put(model_name, prompt, output, sample)
+    return output
+
+
+class ParallelHyDEQueryTransform(BaseQueryTransform):
+    """
+    A HyDE transform that writes several hypothetical documents concurrently.
+
+    The hypotheses (and optionally the original query) become the bundle's embedding
+    strings; the hypotheses are embedded in one batch and averaged with the query.
+
+    Attributes:
+        llm: The language model writing the hypotheses.
+        num_hypotheses (int): The number of hypothetical documents per query.
+        include_original (bool): Whether the original query is averaged in as well.
+        memo (Optional[LLMMemo]): The completion memo.
+        embed_model: The embedding model (None leaves embedding to the retriever).
+    """
+
+    def __init__(self, llm: Any, num_hypotheses: int = 1, include_original: bool = True,
+                 memo: Optional[LLMMemo] = None, embed_model: Optional[Any] = None,
+                 hyde_prompt: Optional[BasePromptTemplate] = None):
+        """
+        Initialize the ParallelHyDEQueryTransform.
+
+        Args:
+            llm: The language model writing the hypotheses.
+            num_hypotheses (int): The number of hypothetical documents per query.
+            include_original (bool): Whether the original query is averaged in as well.
+            memo (Optional[LLMMemo]): The completion memo.
+            embed_model: The embedding model used to embed the hypotheses in one batch.
+            hyde_prompt (Optional[BasePromptTemplate]): The prompt writing a hypothesis from `context_str`.
+        """
+        super().__init__()
+        self.llm = llm
+        self._hyde_prompt = hyde_prompt or DEFAULT_HYDE_PROMPT
+        self.num_hypotheses = num_hypotheses
+        self.include_original = include_original
+        self.memo = memo
+        self.embed_model = embed_model
+
+    def _get_prompts(self) -> Dict[str, Any]:
+        return {"hyde_prompt": self._hyde_prompt}
+
+    def _update_prompts(self, prompts: Dict[str, Any]) -> None:
+        if "hyde_prompt" in prompts:
+            self._hyde_prompt = prompts["hyde_prompt"]
+
+    def _bundle(self, query_bundle: QueryBundle, hypotheses: List[str]) -> QueryBundle:
+        embedding_strs = hypotheses + (query_bundle.embedding_strs if self.include_original else [])
+        bundle = QueryBundle(query_str=query_bundle.query_str, custom_embedding_strs=embedding_strs)
+        if self.embed_model is not None:
+            embed_queries(self.embed_model, [bundle])
+        return bundle
+
+    def _run(self, query_bundle: QueryBundle, metadata: Dict) -> QueryBundle:
+        prompt = self._hyde_prompt.format(context_str=query_bundle.query_str)
+        with span("hyde", hypotheses=self.num_hypotheses):
+            if self.num_hypotheses == 1:
+                hypotheses = [complete(self.llm, prompt, self.memo)]
+            else:
+                contexts = [contextvars.copy_context() for _ in range(self.num_hypotheses)]
+                with ThreadPoolExecutor(max_workers=self.num_hypotheses) as executor:
+                    hypotheses = list(executor.map(
+                        lambda context, i: context.run(complete, self.llm, prompt, self.memo, i),
+                        contexts, range(self.num_hypotheses)
+                    ))
+            return self._bundle(query_bundle, hypotheses)
+
+    async def arun(self, query_bundle: QueryBundle) -> QueryBundle:
+        """
+        Asynchronously write the hypotheses of a query.
+
+        The returned bundle is not embedded, so that `retrieve_batch` can embed the
+        hypotheses of many queries in one call.
+
+        Args:
+            query_bundle (QueryBundle): The query.
+
+        Returns:
+            QueryBundle: The query with the hypotheses as embedding strings.
+        """
+        prompt = self._hyde_prompt.format(context_str=query_bundle.query_str)
+        with span("hyde", hypotheses=self.num_hypotheses):
+            hypotheses = await asyncio.gather(*(acomplete(self.llm, prompt, self.memo, i)
+                                                for i in range(self.num_hypotheses)))
+        embedding_strs = list(hypotheses) + (query_bundle.embedding_strs if self.include_original else [])
+        return QueryBundle(query_str=query_bundle.query_str, custom_embedding_strs=embedding_strs)
+
+
+def merge_nodes(nodes_list: List[List[NodeWithScore]], top_n: Optional[int] = None) -> List[NodeWithScore]:
+    """
+    Merge the nodes retrieved for several questions, keeping each node's best score.
+
+    Args:
+        nodes_list (List[List[NodeWithScore]]): The nodes of each question.
+        top_n (Optional[int]): The number of nodes to keep (None keeps them all).
+
+    Returns:
+        List[NodeWithScore]: The unique nodes, best first.
+    """
+    best: Dict[str, NodeWithScore] = {}
+    for nodes in nodes_list:
+        for node in nodes:
+            current = best.get(node.node.node_id)
+            if current is None or (node.score or 0.0) > (current.score or 0.0):
+                best[node.node.node_id] = node
+    merged = sorted(best.values(), key=lambda n: n.score or 0.0, reverse=True)
+    return merged if top_n is None else merged[:top_n]
+
+
+class DecomposeQueryEngine(BaseQueryEngine):
+    """
+    A multi-step query engine that answers the sub-questions of each step in parallel.
+
+    Like MultiStepQueryEngine, each step asks the LLM for the next questions given the
+    reasoning so far, so later steps can build on earlier answers. A step may return
+    several independent questions: they are retrieved and reranked as one batch and
+    answered concurrently. A final synthesis answers the original query over the
+    question/answer pairs, with the merged nodes as sources.
+
+    Attributes:
+        query_engine: The RetrieverQueryEngine whose synthesizer answers the questions.
+        retriever: The retriever.
+        node_processor: The reranker if needed.
+        llm: The language model decomposing the query.
+        max_questions (int): The maximum number of sub-questions per step.
+        num_steps (int): The maximum number of steps.
+        memo (Optional[LLMMemo]): The completion memo.
+        compressor: The context compressor applied to the nodes of each sub-question, if any.
+    """
+
+    def __init__(self, query_engine: Any, retriever: Any, node_processor: Optional[Any], llm: Any,
+                 max_questions: int = 3, num_steps: int = 3, memo: Optional[LLMMemo] = None,
+                 compressor: Optional[Any] = None, decompose_prompt: Optional[BasePromptTemplate] = None):
+        """
+        Initialize the DecomposeQueryEngine.
+
+        Args:
+            query_engine: The RetrieverQueryEngine whose synthesizer answers the questions.
+            retriever: The retriever.
+            node_processor: The reranker if needed.
+            llm: The language model decomposing the query.
+            max_questions (int): The maximum number of sub-questions per step.
+            num_steps (int): The maximum number of steps.
+            memo (Optional[LLMMemo]): The completion memo.
+            compressor: The context compressor applied to the nodes of each sub-question.
+            decompose_prompt (Optional[BasePromptTemplate]): The prompt writing the questions of a step.
+        """
+        self.query_engine = query_engine
+        self.retriever = retriever
+        self.node_processor = node_processor
+        self.llm = llm
+        self.max_questions = max_questions
+        self.num_steps = num_steps
+        self.memo = memo
+        self.compressor = compressor
+        self._decompose_prompt = decompose_prompt or DECOMPOSE_PROMPT
+        super().__init__(callback_manager=query_engine.callback_manager)
+
+    def _get_prompts(self) -> Dict[str, Any]:
+        return {"decompose_prompt": self._decompose_prompt}
+
+    def _update_prompts(self, prompts: Dict[str, Any]) -> None:
+        if "decompose_prompt" in prompts:
+            self._decompose_prompt = prompts["decompose_prompt"]
+
+    def _get_prompt_modules(self) -> PromptMixinType:
+        return {"query_engine": self.query_engine}
+
+    @property
+    def top_n(self) -> Optional[int]:
+        """The number of source nodes kept: the reranker's `top_n`, else the retriever's `similarity_top_k`."""
+        return getattr(self.node_processor, "top_n", None) or getattr(self.retriever, "similarity_top_k", None)
+
+    def _prompt(self, query_str: str, prev_reasoning: str) -> str:
+        return self._decompose_prompt.format(max_questions=self.max_questions, query_str=query_str,
+                                             prev_reasoning=prev_reasoning or "None")
+
+    def _questions(self, output: str, asked: List[str]) -> List[str]:
+        questions: List[str] = []
+        for line in output.splitlines():
+            question = re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line).strip()
+            if question.rstrip(".").lower() == "none":
+                break
+            if question and question not in questions and question not in asked:
+                questions.append(question)
+        return questions[:self.max_questions]
+
+    def _nodes(self, bundles: List[QueryBundle]) -> List[List[NodeWithScore]]:
+        nodes_list = rerank_batch(self.node_processor, retrieve_batch(self.retriever, bundles), bundles)
+        return rerank_batch(self.compressor, nodes_list, bundles)
+
+    def _answer(self, bundle: QueryBundle, nodes: List[NodeWithScore]) -> str:
+        return str(self.query_engine.synthesize(bundle, nodes))
+
+    def _record(self, questions: List[str], answers: List[str], text_chunks: List[str]) -> str:
+        reasoning = ""
+        for question, answer in zip(questions, answers):
+            text_chunks.append(f"\nQuestion: {question}\nAnswer: {answer}")
+            reasoning += f"- {question}\n- {answer}\n"
+        return reasoning
+
+    def _result(self, text_chunks: List[str], nodes_list: List[List[NodeWithScore]],
+                asked: List[str]) -> Tuple[List[NodeWithScore], List[NodeWithScore], Dict[str, Any]]:
+        nodes = [NodeWithScore(node=TextNode(text="\n".join(text_chunks)))] if text_chunks else []
+        return nodes, merge_nodes(nodes_list, self.top_n), {"sub_questions": asked}
+
+    def run_steps(self, query_bundle: QueryBundle) -> Tuple[List[NodeWithScore], List[NodeWithScore], Dict[str, Any]]:
+        """
+        Answer the sub-questions of a query step by step.
+
+        Args:
+            query_bundle (QueryBundle): The query.
+
+        Returns:
+            Tuple[List[NodeWithScore], List[NodeWithScore], Dict[str, Any]]: A node holding the
+            question/answer pairs, the merged source nodes (at most `top_n`) and the metadata.
+        """
+        prev_reasoning, asked, text_chunks, nodes_list = "", [], [], []
+        for step in range(self.num_steps):
+            with span("decompose", step=step) as s:
+                questions = self._questions(complete(self.llm, self._prompt(query_bundle.query_str, prev_reasoning),
+                                                     self.memo), asked)
+                s.set(questions=len(questions))
+            if not questions:
+                break
+            bundles = [QueryBundle(question) for question in questions]
+            step_nodes = self._nodes(bundles)
+            contexts = [contextvars.copy_context() for _ in bundles]
+            with ThreadPoolExecutor(max_workers=len(bundles)) as executor:
+                answers = list(executor.map(lambda context, bundle, nodes: context.run(self._answer, bundle, nodes),
+                                            contexts, bundles, step_nodes))
+            prev_reasoning += self._record(questions, answers, text_chunks)
+            asked += questions
+            nodes_list += step_nodes
+        return self._result(text_chunks, nodes_list, asked)
+
+    async def arun_steps(self, query_bundle: QueryBundle
+                         ) -> Tuple[List[NodeWithScore], List[NodeWithScore], Dict[str, Any]]:
+        """
+        Asynchronously answer the sub-questions of a query step by step; see `run_steps`.
+
+        Args:
+            query_bundle (QueryBundle): The query.
+
+        Returns:
+            Tuple[List[NodeWithScore], List[NodeWithScore], Dict[str, Any]]: A node holding the
+            question/answer pairs, the merged source nodes (at most `top_n`) and the metadata.
+        """
+        return (await self.arun_steps_batch([query_bundle]))[0]
+
+    async def arun_steps_batch(self, query_bundles: List[QueryBundle], max_concurrency: int = 8
+                               ) -> List[Tuple[List[NodeWithScore], List[NodeWithScore], Dict[str, Any]]]:
+        """
+        Answer the sub-questions of several queries, running their steps in lockstep.
+
+        At each step the decompositions of all queries still going run concurrently, the
+        questions they return are retrieved and reranked as one batch, and the answers
+        are synthesized concurrently, at most `max_concurrency` LLM calls at a time.
+
+        Args:
+            query_bundles (List[QueryBundle]): The queries.
+            max_concurrency (int): The maximum number of concurrent LLM calls.
+
+        Returns:
+            List[Tuple[List[NodeWithScore], List[NodeWithScore], Dict[str, Any]]]: The result of
+            `run_steps` for each query, in order.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def limited(coroutine: Any) -> Any:
+            async with semaphore:
+                return await coroutine
+
+        reasoning = [""] * len(query_bundles)
+        asked: List[List[str]] = [[] for _ in query_bundles]
+        text_chunks: List[List[str]] = [[] for _ in query_bundles]
+        nodes_lists: List[List[List[NodeWithScore]]] = [[] for _ in query_bundles]
+        active = list(range(len(query_bundles)))
+        for step in range(self.num_steps):
+            with span("decompose", step=step, queries=len(active)) as s:
+                outputs = await asyncio.gather(*(
+                    limited(acomplete(self.llm, self._prompt(query_bundles[i].query_str, reasoning[i]), self.memo))
+                    for i in active
+                ))
+                questions = {i: self._questions(output, asked[i]) for i, output in zip(active, outputs)}
+                active = [i for i in active if questions[i]]
+                s.set(questions=sum(len(questions[i]) for i in active))
+            if not active:
+                break
+            owners = [i for i in active for _ in questions[i]]
+            bundles = [QueryBundle(question) for i in active for question in questions[i]]
+            step_nodes = await asyncio.to_thread(self._nodes, bundles)
+            responses = await asyncio.gather(*(limited(self.query_engine.asynthesize(bundle, nodes))
+                                               for bundle, nodes in zip(bundles, step_nodes)))
+            for i in active:
+                mine = [j for j, owner in enumerate(owners) if owner == i]
+                reasoning[i] += self._record(questions[i], [str(responses[j]) for j in mine], text_chunks[i])
+                asked[i] += questions[i]
+                nodes_lists[i] += [step_nodes[j] for j in mine]
+        return [self._result(*state) for state in zip(text_chunks, nodes_lists, asked)]
+
+    async def afinish(self, query_bundle: QueryBundle,
+                      steps: Tuple[List[NodeWithScore], List[NodeWithScore], Dict[str, Any]]) -> RESPONSE_TYPE:
+        """
+        Synthesize the answer of a query from the result of its steps.
+
+        Args:
+            query_bundle (QueryBundle): The query.
+            steps: The result of `run_steps` or `arun_steps` for the query.
+
+        Returns:
+            RESPONSE_TYPE: The response, with the sub-questions in its metadata.
+        """
+        nodes, source_nodes, metadata = steps
+        response = await self.query_engine.asynthesize(query_bundle, nodes, additional_source_nodes=source_nodes)
+        response.metadata = {**(response.metadata or {}), **metadata}
+        return response
+
+    def _query(self, query_bundle: QueryBundle) -> RESPONSE_TYPE:
+        nodes, source_nodes, metadata = self.run_steps(query_bundle)
+        response = self.query_engine.synthesize(query_bundle, nodes, additional_source_nodes=source_nodes)
+        response.metadata = {**(response.metadata or {}), **metadata}
+        return response
+
+    async def _aquery(self, query_bundle: QueryBundle) -> RESPONSE_TYPE:
+        return await self.afinish(query_bundle, await self.arun_steps(query_bundle))
@@ -0,0 +1,756 @@
+import os
+import hashlib
+import math
+import threading
+from typing import Any, Dict, List, Optional, Literal, Tuple, cast
+import numpy as np
+import faiss
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.simple import DEFAULT_VECTOR_STORE, NAMESPACE_SEP
+from llama_index.core.vector_stores.types import (
+    DEFAULT_PERSIST_DIR,
+    DEFAULT_PERSIST_FNAME,
+    VectorStoreQuery,
+    VectorStoreQueryResult
+)
+from llama_index.vector_stores.faiss import FaissVectorStore
+from .tracing import span
+
+IndexType = Literal['flat', 'ivf', 'hnsw', 'ivfpq', 'opq', 'fp16', 'sq8', 'binary']
+Metric = Literal['l2', 'ip', 'cosine']
+
+COMPACT_TYPES = ('fp16', 'sq8', 'binary')
+VECTORS_FILE = "vectors.f32"
+DEFAULT_RESCORE_FACTOR = 4
+BINARY_RESCORE_FACTOR = 32
+BRUTE_FORCE_LIMIT = 16384
+
+
+def node_id_to_faiss_id(node_id: str) -> int:
+    """
+    Map a llama-index node id to a stable, non-negative 63-bit Faiss id.
+
+    Args:
+        node_id (str): The node id (or ref doc id) to map.
+
+    Returns:
+        int: The Faiss id used for the node inside an ID-mapped index.
+    """
+    digest = hashlib.sha1(node_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little") & ((1 << 63) - 1)
+
+
+def document_key(node: BaseNode) -> int:
+    """
+    Map a node to the 63-bit hash of its document (of the node itself if it has none).
+
+    Args:
+        node (BaseNode): The node.
+
+    Returns:
+        int: The document key, which decides the shard of the node.
+    """
+    return node_id_to_faiss_id(node.ref_doc_id or node.node_id)
+
+
+class Selection:
+    """
+    The Faiss ids allowed by a metadata filter, split by shard, with their ID selectors.
+
+    Selectors are built on first use and kept with the selection, so repeated queries
+    with the same filter do not rebuild them.
+
+    Attributes:
+        ids (List[np.ndarray]): The allowed Faiss ids of each shard.
+    """
+
+    def __init__(self, ids: List[np.ndarray]):
+        """
+        Wrap the allowed ids.
+
+        Args:
+            ids (List[np.ndarray]): The allowed Faiss ids of each shard.
+        """
+        self.ids = [np.ascontiguousarray(part, dtype="int64") for part in ids]
+        self._selectors: List[Optional[Any]] = [None] * len(ids)
+
+    def selector(self, shard: int = 0) -> Any:
+        """
+        Return the Faiss ID selector of a shard.
+
+        Args:
+            shard (int): The shard number.
+
+        Returns:
+            faiss.IDSelectorBatch: The selector of the shard's allowed ids.
+        """
+        if self._selectors[shard] is None:
+            self._selectors[shard] = faiss.IDSelectorBatch(self.ids[shard])
+        return self._selectors[shard]
+
+
+def read_index(path: str, mmap: bool = False) -> Any:
+    """
+    Read a Faiss index file, optionally memory-mapped read-only.
+
+    `IO_FLAG_MMAP_IFC` maps the codes of flat, IDMap2, HNSW and scalar-quantized indexes
+    as well as inverted lists straight from the file, so nothing but the small index
+    structures is copied into private memory. `IO_FLAG_MMAP` only maps inverted lists;
+    it is the fallback for index types the former cannot load.
+
+    Args:
+        path (str): The index file.
+        mmap (bool): Whether to memory-map the index read-only.
+
+    Returns:
+        faiss.Index: The index.
+    """
+    if not mmap:
+        return faiss.read_index(path)
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+
+class ExactVectorFile:
+    """
+    Full-precision vectors kept in a flat float32 file and read back memory-mapped.
+
+    Compact indexes search quantized codes; this file holds the original vectors so
+    the best candidates can be rescored exactly without keeping them in RAM. Rows are
+    appended as nodes are added, and a row table (`<path>.ids.npy`) maps Faiss ids to
+    rows, with removed rows marked -1. Rows written after the last `persist` are ignored
+    on load and overwritten by the next `add`, so opening the file never modifies it
+    while other processes read it.
+
+    Attributes:
+        path (str): The vector file.
+        dimension (int): The dimension of the vectors.
+    """
+
+    def __init__(self, path: str, dimension: int):
+        """
+        Open (or create) the vector file.
+
+        Args:
+            path (str): The vector file.
+            dimension (int): The dimension of the vectors.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.dimension = dimension
+        self._lock = threading.Lock()
+        ids_path = f"{path}.ids.npy"
+        self._ids: List[int] = np.load(ids_path).tolist() if os.path.exists(ids_path) else []
+        open(path, "ab").close()
+        self._rows: Dict[int, int] = {faiss_id: row for row, faiss_id in enumerate(self._ids) if faiss_id >= 0}
+        self._memmap: Optional[np.ndarray] = None
+
+    def add(self, ids: np.ndarray, embeddings: np.ndarray) -> None:
+        """
+        Append vectors.
+
+        Args:
+            ids (np.ndarray): The Faiss ids.
+            embeddings (np.ndarray): The vectors, one row per id.
+        """
+        with self._lock:
+            # Write after the known rows rather than at the end of the file, replacing any
+            # rows an interrupted writer left behind the persisted row table.
+            with open(self.path, "r+b") as f:
+                f.seek(len(self._ids) * self.dimension * 4)
+                f.write(np.ascontiguousarray(embeddings, dtype="float32").tobytes())
+            for faiss_id in ids.tolist():
+                old = self._rows.get(faiss_id)
+                if old is not None:
+                    self._ids[old] = -1
+                self._rows[faiss_id] = len(self._ids)
+                self._ids.append(faiss_id)
+            self._memmap = None
+
+    def remove(self, ids: np.ndarray) -> None:
+        """
+        Forget the vectors of the given ids.
+
+        Args:
+            ids (np.ndarray): The Faiss ids.
+        """
+        with self._lock:
+            for faiss_id in ids.tolist():
+                row = self._rows.pop(faiss_id, None)
+                if row is not None:
+                    self._ids[row] = -1
+
+    def get(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Read the vectors of the given ids.
+
+        Args:
+            ids (np.ndarray): The Faiss ids (-1 for none).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The vectors (zeros where unknown) and a mask of known ids.
+        """
+        with self._lock:
+            rows = np.array([self._rows.get(faiss_id, -1) for faiss_id in ids.tolist()], dtype="int64")
+            if not self._ids:
+                return np.zeros((len(ids), self.dimension), dtype="float32"), rows >= 0
+            if self._memmap is None:
+                self._memmap = np.memmap(self.path, dtype="float32", mode="r", shape=(len(self._ids), self.dimension))
+            memmap = self._memmap
+        found = rows >= 0
+        return np.asarray(memmap[np.where(found, rows, 0)]), found
+
+    def persist(self) -> None:
+        """
+        Atomically write the row table.
+        """
+        tmp_path = f"{self.path}.ids.tmp"
+        with self._lock:
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.array(self._ids, dtype="int64"))
+        os.replace(tmp_path, f"{self.path}.ids.npy")
+
+
+class FaissIDMapVectorStore(FaissVectorStore):
+    """
+    A FaissVectorStore that addresses vectors by a hash of their node id.
+
+    The stock FaissVectorStore uses the insertion position as id and cannot delete.
+    Here vectors are added with `add_with_ids` on an ID-mapped index, so a node's
+    Faiss id can be recomputed from its node id alone and removed later on.
+
+    With an ExactVectorFile attached, a query fetches `rescore_factor` times more
+    candidates from a compact (quantized) index and reranks them by their exact
+    distance to the full-precision vectors.
+
+    With a MetadataIndex attached, metadata filters are resolved to the allowed Faiss
+    ids before searching. Up to BRUTE_FORCE_LIMIT allowed vectors are scored directly,
+    and larger sets are searched with a Faiss ID selector, so the search never visits
+    nodes that the filter excludes.
+
+    Attributes:
+        normalize (bool): Whether to L2-normalize vectors on add and query (cosine metric).
+        rescore_factor (int): The candidate multiplier for exact rescoring (0 disables it).
+    """
+
+    normalize: bool = False
+    rescore_factor: int = 0
+    _exact: Optional[ExactVectorFile] = PrivateAttr(default=None)
+    _metadata_index: Optional[Any] = PrivateAttr(default=None)
+
+    def __init__(self, faiss_index: Any, normalize: bool = False, exact: Optional[ExactVectorFile] = None,
+                 rescore_factor: int = DEFAULT_RESCORE_FACTOR) -> None:
+        """
+        Initialize the vector store.
+
+        Args:
+            faiss_index (faiss.Index): An index that accepts explicit ids.
+            normalize (bool): Whether to L2-normalize vectors on add and query.
+            exact (Optional[ExactVectorFile]): The full-precision vectors used for rescoring.
+            rescore_factor (int): The candidate multiplier for exact rescoring.
+        """
+        super().__init__(faiss_index=faiss_index)
+        self.normalize = normalize
+        self.enable_rescoring(exact, rescore_factor)
+
+    def enable_rescoring(self, exact: Optional[ExactVectorFile], rescore_factor: int = DEFAULT_RESCORE_FACTOR) -> None:
+        """
+        Attach the full-precision vectors used to rescore candidates (None detaches them).
+
+        Args:
+            exact (Optional[ExactVectorFile]): The full-precision vectors.
+            rescore_factor (int): The candidate multiplier (0 keeps the file updated but skips rescoring).
+        """
+        self._exact = exact
+        self.rescore_factor = rescore_factor if exact is not None else 0
+
+    def enable_filtering(self, metadata_index: Optional[Any]) -> None:
+        """
+        Attach the metadata index used to resolve metadata filters (None detaches it).
+
+        Args:
+            metadata_index (Optional[MetadataIndex]): The metadata index.
+        """
+        self._metadata_index = metadata_index
+
+    @classmethod
+    def from_persist_path(cls, persist_path: str, fs: Optional[Any] = None,
+                          mmap: bool = False) -> "FaissIDMapVectorStore":
+        """
+        Load the vector store from a Faiss index file.
+
+        Args:
+            persist_path (str): The path of the Faiss index file.
+            fs: The filesystem (only local storage is supported).
+            mmap (bool): Whether to memory-map the index read-only instead of reading it
+                into RAM, so worker processes share the page cache.
+
+        Returns:
+            FaissIDMapVectorStore: The loaded vector store.
+
+        Raises:
+            ValueError: If no index exists at persist_path.
+        """
+        if not os.path.exists(persist_path):
+            raise ValueError(f"No existing Faiss index found at {persist_path}.")
+        return cls(faiss_index=read_index(persist_path, mmap=mmap))
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str = DEFAULT_PERSIST_DIR, fs: Optional[Any] = None,
+                         mmap: bool = False) -> "FaissIDMapVectorStore":
+        """
+        Load the vector store from the default Faiss index file in persist_dir.
+
+        Args:
+            persist_dir (str): The storage directory.
+            fs: The filesystem (only local storage is supported).
+            mmap (bool): Whether to memory-map the index read-only.
+
+        Returns:
+            FaissIDMapVectorStore: The loaded vector store.
+        """
+        persist_path = os.path.join(persist_dir, f"{DEFAULT_VECTOR_STORE}{NAMESPACE_SEP}{DEFAULT_PERSIST_FNAME}")
+        return cls.from_persist_path(persist_path, mmap=mmap)
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        """
+        Add nodes to the index, keyed by the hash of their node id.
+
+        Args:
+            nodes (List[BaseNode]): Nodes with embeddings.
+            **add_kwargs: Arbitrary keyword arguments (unused).
+
+        Returns:
+            List[str]: The Faiss ids of the added nodes.
+        """
+        if not nodes:
+            return []
+        embeddings = np.array([node.get_embedding() for node in nodes], dtype="float32")
+        if self.normalize:
+            faiss.normalize_L2(embeddings)
+        ids = np.array([node_id_to_faiss_id(node.node_id) for node in nodes], dtype="int64")
+        self._faiss_index.add_with_ids(embeddings, ids)
+        if self._exact is not None:
+            self._exact.add(ids, embeddings)
+        return [str(i) for i in ids]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """
+        Delete the vector stored under the given id.
+
+        Faiss holds no document ids, so only node ids resolve to a vector; unknown
+        ids (such as a ref doc id) are a no-op. Use `delete_nodes` to drop a document.
+
+        Args:
+            ref_doc_id (str): The node id to delete.
+            **delete_kwargs: Arbitrary keyword arguments (unused).
+        """
+        self.delete_nodes([ref_doc_id])
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters: Optional[Any] = None,
+                     **delete_kwargs: Any) -> None:
+        """
+        Delete the vectors of the given nodes.
+
+        Args:
+            node_ids (Optional[List[str]]): The node ids to delete.
+            filters: Metadata filters (unsupported).
+            **delete_kwargs: Arbitrary keyword arguments (unused).
+
+        Raises:
+            ValueError: If metadata filters are provided.
+        """
+        if filters is not None:
+            raise ValueError("Metadata filters not implemented for Faiss yet.")
+        if not node_ids:
+            return
+        ids = np.array([node_id_to_faiss_id(node_id) for node_id in node_ids], dtype="int64")
+        self._faiss_index.remove_ids(ids)
+        if self._exact is not None:
+            self._exact.remove(ids)
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        """
+        Write the Faiss index and, if attached, the row table of the full-precision vectors.
+
+        The index is written to a temporary file and renamed into place, so processes
+        that memory-map the previous file keep reading a complete index.
+
+        Args:
+            persist_path (str): The path of the Faiss index file.
+            fs: The filesystem (only local storage is supported).
+        """
+        super().persist(f"{persist_path}.tmp", fs=fs)
+        os.replace(f"{persist_path}.tmp", persist_path)
+        if self._exact is not None:
+            self._exact.persist()
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """
+        Query the index for the top k most similar nodes.
+
+        Args:
+            query (VectorStoreQuery): The query holding the embedding and similarity_top_k.
+            **kwargs: Arbitrary keyword arguments.
+                nprobe (int): The number of inverted lists to visit (IVF indexes).
+                ef_search (int): The size of the candidate list (HNSW indexes).
+                rescore_factor (int): Overrides the candidate multiplier for exact rescoring.
+
+        Returns:
+            VectorStoreQueryResult: The similarities and Faiss ids of the hits.
+
+        Raises:
+            ValueError: If metadata filters are provided.
+        """
+        return self.query_batch([query], **kwargs)[0]
+
+    def query_batch(self, queries: List[VectorStoreQuery], **kwargs: Any) -> List[VectorStoreQueryResult]:
+        """
+        Query the index for several embeddings with a single Faiss search.
+
+        Args:
+            queries (List[VectorStoreQuery]): The queries holding the embeddings and similarity_top_k.
+            **kwargs: Arbitrary keyword arguments (see `query`).
+
+        Returns:
+            List[VectorStoreQueryResult]: One result per query.
+
+        Raises:
+            ValueError: If metadata filters are provided without a metadata index.
+        """
+        if not queries:
+            return []
+        if len(queries) > 1 and any(query.filters is not None for query in queries):
+            return [self.query_batch([query], **kwargs)[0] for query in queries]
+
+        embeddings = np.array([cast(List[float], query.query_embedding) for query in queries], dtype="float32")
+        if self.normalize:
+            faiss.normalize_L2(embeddings)
+        top_k = max(query.similarity_top_k for query in queries)
+        selection = select_ids(self._metadata_index, queries[0].filters)
+        allowed = selection.ids[0] if selection is not None else None
+        factor = kwargs.get('rescore_factor', self.rescore_factor) if self._exact is not None else 0
+        if allowed is not None and self._exact is not None and (
+                len(allowed) <= BRUTE_FORCE_LIMIT or not supports_selector(self._faiss_index)):
+            with span("faiss_search", queries=len(queries), k=top_k, allowed=len(allowed), brute_force=True):
+                vectors, found = self._exact.get(allowed)
+                dists, indices = exact_search(embeddings, vectors[found], allowed[found], top_k, self._l2)
+        elif allowed is not None and len(allowed) <= BRUTE_FORCE_LIMIT and reconstructs(self._faiss_index):
+            with span("faiss_search", queries=len(queries), k=top_k, allowed=len(allowed), brute_force=True):
+                vectors = self._faiss_index.reconstruct_batch(allowed)
+                dists, indices = exact_search(embeddings, vectors, allowed, top_k, self._l2)
+        else:
+            selector = selection.selector() if selection is not None else None
+            params = search_parameters(self._faiss_index, kwargs.get('nprobe'), kwargs.get('ef_search'), selector)
+            with span("faiss_search", queries=len(queries), k=top_k, rescore_factor=factor):
+                dists, indices = self._faiss_index.search(embeddings, top_k * max(factor, 1), params=params)
+            if factor > 0:
+                with span("rescore", queries=len(queries), candidates=indices.shape[1]):
+                    dists, indices = self._rescore(embeddings, indices, top_k)
+            elif hamming_bits(self._faiss_index):
+                dists = hamming_to_scores(dists, hamming_bits(self._faiss_index), self._l2)
+
+        results = []
+        for query, row_dists, row_indices in zip(queries, dists, indices):
+            similarities = []
+            ids = []
+            for dist, idx in zip(row_dists[:query.similarity_top_k], row_indices[:query.similarity_top_k]):
+                if idx < 0:
+                    continue
+                similarities.append(float(dist))
+                ids.append(str(idx))
+            results.append(VectorStoreQueryResult(similarities=similarities, ids=ids))
+        return results
+
+    @property
+    def _l2(self) -> bool:
+        return self._faiss_index.metric_type == faiss.METRIC_L2
+
+    def _rescore(self, embeddings: np.ndarray, indices: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rerank candidate ids by their exact distance to the queries, keeping the best top_k.
+        """
+        vectors, found = self._exact.get(indices.reshape(-1))
+        vectors = vectors.reshape(indices.shape[0], indices.shape[1], -1)
+        found = found.reshape(indices.shape) & (indices >= 0)
+        l2 = self._l2
+        if l2:
+            exact = ((vectors - embeddings[:, None, :]) ** 2).sum(axis=-1)
+        else:
+            exact = -np.einsum("qkd,qd->qk", vectors, embeddings)
+        exact[~found] = np.inf
+        order = np.argsort(exact, axis=1, kind="stable")[:, :top_k]
+        dists = np.take_along_axis(exact, order, axis=1)
+        indices = np.where(np.isinf(dists), -1, np.take_along_axis(indices, order, axis=1))
+        return (dists if l2 else -dists), indices
+
+
+def search_parameters(faiss_index: Any, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                      selector: Optional[Any] = None) -> Optional[Any]:
+    """
+    Build per-query Faiss search parameters.
+
+    IVF indexes only accept IVF parameters, so a selector alone is passed to them
+    together with the index's own nprobe.
+
+    Args:
+        faiss_index (faiss.Index): The index the parameters are for.
+        nprobe (Optional[int]): The number of inverted lists to visit (IVF indexes).
+        ef_search (Optional[int]): The size of the candidate list (HNSW indexes).
+        selector (Optional[faiss.IDSelector]): Restricts the search to the selected ids.
+
+    Returns:
+        Optional[faiss.SearchParameters]: The parameters, or None to use the index defaults.
+
+    Raises:
+        ValueError: If both knobs are provided.
+    """
+    if nprobe is not None and ef_search is not None:
+        raise ValueError("nprobe and ef_search cannot be combined")
+    if nprobe is not None:
+        return faiss.SearchParametersIVF(nprobe=nprobe, sel=selector)
+    if ef_search is not None:
+        return faiss.SearchParametersHNSW(efSearch=ef_search, sel=selector)
+    if selector is None:
+        return None
+    ivf = _ivf(faiss_index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def select_ids(metadata_index: Optional[Any], filters: Optional[Any], num_shards: int = 1) -> Optional[Selection]:
+    """
+    Resolve metadata filters to the Faiss ids a search may return.
+
+    Args:
+        metadata_index (Optional[MetadataIndex]): The metadata index.
+        filters (Optional[MetadataFilters]): The filters of the query.
+        num_shards (int): The number of shards to split the ids into.
+
+    Returns:
+        Optional[Selection]: The allowed Faiss ids, or None if the query is unfiltered.
+
+    Raises:
+        ValueError: If filters are provided without a metadata index.
+    """
+    if filters is None:
+        return None
+    if metadata_index is None:
+        raise ValueError("Metadata filters need a metadata index; build it with Faiss(metadata_index=True)")
+    return metadata_index.selection(filters, num_shards)
+
+
+def exact_search(embeddings: np.ndarray, vectors: np.ndarray, ids: np.ndarray, top_k: int,
+                 l2: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score every query against a set of vectors and keep the best top_k.
+
+    Args:
+        embeddings (np.ndarray): The query vectors.
+        vectors (np.ndarray): The candidate vectors.
+        ids (np.ndarray): The Faiss id of each candidate.
+        top_k (int): The number of hits per query.
+        l2 (bool): Whether to rank by squared L2 distance (else by inner product).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The scores and ids of the hits, best first, as Faiss returns them.
+    """
+    k = min(top_k, len(ids))
+    if k == 0:
+        return np.zeros((len(embeddings), 0), dtype="float32"), np.zeros((len(embeddings), 0), dtype="int64")
+    vectors = np.asarray(vectors, dtype="float32")
+    scores = embeddings @ vectors.T
+    if l2:
+        scores = (embeddings ** 2).sum(axis=1)[:, None] - 2 * scores + (vectors ** 2).sum(axis=1)[None, :]
+    else:
+        scores = -scores
+    order = np.argpartition(scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(order, np.argsort(np.take_along_axis(scores, order, axis=1), axis=1), axis=1)
+    dists = np.take_along_axis(scores, order, axis=1)
+    return (dists if l2 else -dists), ids[order]
+
+
+def _inner(faiss_index: Any) -> Any:
+    inner = faiss_index.index if isinstance(faiss_index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else faiss_index
+    return faiss.downcast_index(inner)
+
+
+def _ivf(faiss_index: Any) -> Optional[Any]:
+    try:
+        return faiss.extract_index_ivf(faiss_index)
+    except RuntimeError:
+        return None
+
+
+def supports_selector(faiss_index: Any) -> bool:
+    """
+    Check whether a Faiss index can restrict a search with an ID selector (LSH cannot).
+    """
+    return not isinstance(_inner(faiss_index), faiss.IndexLSH)
+
+
+def reconstructs(faiss_index: Any) -> bool:
+    """
+    Check whether a Faiss index can return stored vectors by id (IDMap2 over a non-binary index).
+    """
+    return isinstance(faiss_index, faiss.IndexIDMap2) and supports_selector(faiss_index)
+
+
+def index_factory_string(index_type: IndexType, num_vectors: int, **kwargs: Any) -> str:
+    """
+    Translate an index type into a Faiss index factory string.
+
+    Flat, HNSW and the compact types are wrapped in IDMap2 so they accept explicit ids;
+    IVF indexes store ids natively. HNSW indexes cannot delete vectors. The compact
+    types store float16 ('fp16'), 8-bit scalar-quantized ('sq8') or 1-bit ('binary',
+    sign of each dimension against its trained median, searched by Hamming distance)
+    codes instead of float32.
+
+    Args:
+        index_type (IndexType): The index type.
+        num_vectors (int): The number of vectors the index is trained on.
+        **kwargs: Arbitrary keyword arguments.
+            nlist (int): The number of inverted lists (defaults to 4 * sqrt(num_vectors)).
+            M (int): The number of HNSW neighbours per node (defaults to 32).
+            pq_m (int): The number of PQ sub-quantizers (defaults to 16).
+
+    Returns:
+        str: The factory string.
+
+    Raises:
+        ValueError: If an invalid index type is provided.
+    """
+    nlist = kwargs.get('nlist') or max(1, int(4 * math.sqrt(max(num_vectors, 1))))
+    nlist = min(nlist, max(num_vectors, 1))
+    M = kwargs.get('M') or 32
+    pq_m = kwargs.get('pq_m') or 16
+
+    if index_type == 'flat':
+        return "IDMap2,Flat"
+    elif index_type == 'hnsw':
+        return f"IDMap2,HNSW{M},Flat"
+    elif index_type == 'ivf':
+        return f"IVF{nlist},Flat"
+    elif index_type == 'ivfpq':
+        return f"IVF{nlist},PQ{pq_m}"
+    elif index_type == 'opq':
+        return f"OPQ{pq_m},IVF{nlist},PQ{pq_m}"
+    elif index_type == 'fp16':
+        return "IDMap2,SQfp16"
+    elif index_type == 'sq8':
+        return "IDMap2,SQ8"
+    elif index_type == 'binary':
+        return "IDMap2,LSHt"
+    else:
+        raise ValueError(f"Invalid index type: {index_type}")
+
+
+def build_faiss_index(dimension: int, index_type: IndexType = 'flat', metric: Metric = 'l2',
+                      embeddings: Optional[np.ndarray] = None, **kwargs: Any) -> Any:
+    """
+    Create a Faiss index and train it on a sample of embeddings if it needs training.
+
+    Args:
+        dimension (int): The dimension of the vector space.
+        index_type (IndexType): The index type.
+        metric (Metric): The distance metric; 'cosine' is inner product on normalized vectors.
+        embeddings (Optional[np.ndarray]): The vectors to train on (required for IVF types).
+        **kwargs: Arbitrary keyword arguments passed to index_factory_string, plus
+            train_size (int): The maximum number of vectors sampled for training.
+            seed (int): The seed for the training sample.
+
+    Returns:
+        faiss.Index: An index ready to accept vectors.
+
+    Raises:
+        ValueError: If the index needs training and too few embeddings are provided.
+    """
+    num_vectors = 0 if embeddings is None else len(embeddings)
+    faiss_metric = faiss.METRIC_L2 if metric == 'l2' else faiss.METRIC_INNER_PRODUCT
+    if index_type == 'binary':
+        # LSH always ranks by Hamming distance; the metric only tells rescoring how to compare vectors.
+        faiss_index = faiss.index_factory(dimension, index_factory_string(index_type, num_vectors, **kwargs))
+        faiss_index.metric_type = faiss_metric
+        faiss.downcast_index(faiss_index.index).metric_type = faiss_metric
+    else:
+        faiss_index = faiss.index_factory(dimension, index_factory_string(index_type, num_vectors, **kwargs),
+                                          faiss_metric)
+    if faiss_index.is_trained:
+        return faiss_index
+
+    if index_type in ('ivfpq', 'opq') and num_vectors < 256:
+        raise ValueError(f"Index type '{index_type}' needs at least 256 vectors to train, got {num_vectors}")
+    if num_vectors == 0:
+        raise ValueError(f"Index type '{index_type}' needs embeddings to train on")
+
+    train_size = kwargs.get('train_size') or num_vectors
+    sample = embeddings
+    if train_size < num_vectors:
+        rng = np.random.default_rng(kwargs.get('seed', 0))
+        sample = embeddings[rng.choice(num_vectors, size=train_size, replace=False)]
+    sample = np.ascontiguousarray(sample, dtype="float32")
+    if index_type in ('ivfpq', 'opq'):
+        # Polysemous codes only serve searches with polysemous_ht set, and training them dominates the build.
+        faiss.downcast_index(faiss.extract_index_ivf(faiss_index)).do_polysemous_training = False
+    if metric == 'cosine':
+        sample = sample.copy()
+        faiss.normalize_L2(sample)
+    faiss_index.train(sample)
+    return faiss_index
+
+
+def hamming_bits(faiss_index: Any) -> int:
+    """
+    Return the code size in bits of a binary (LSH) index, or 0 for any other index.
+    """
+    inner = _inner(faiss_index)
+    return inner.nbits if isinstance(inner, faiss.IndexLSH) else 0
+
+
+def hamming_to_scores(dists: np.ndarray, bits: int, l2: bool) -> np.ndarray:
+    """
+    Convert the Hamming distances of a binary index to the scale of its metric.
+
+    Each differing bit is a sign flip, so for unit vectors h/bits estimates the angle
+    over pi: inner products become 1 - 2h/bits and squared L2 distances 4h/bits.
+
+    Args:
+        dists (np.ndarray): The Hamming distances.
+        bits (int): The number of bits per code.
+        l2 (bool): Whether the index ranks by L2 distance (else by inner product).
+
+    Returns:
+        np.ndarray: The estimated distances (L2) or similarities (inner product).
+    """
+    fraction = np.asarray(dists, dtype="float32") / bits
+    return 4.0 * fraction if l2 else 1.0 - 2.0 * fraction
+
+
+def ascending(faiss_index: Any) -> bool:
+    """
+    Check whether smaller search scores are better (L2 and Hamming distances).
+
+    Args:
+        faiss_index: The Faiss index to check.
+
+    Returns:
+        bool: True if the index returns distances rather than similarities.
+    """
+    return faiss_index.metric_type == faiss.METRIC_L2 or not supports_selector(faiss_index)
+
+
+def is_id_mapped(faiss_index: Any) -> bool:
+    """
+    Check whether a Faiss index can store vectors under explicit ids.
+
+    Args:
+        faiss_index: The Faiss index to check.
+
+    Returns:
+        bool: True if the index accepts `add_with_ids`.
+    """
+    return isinstance(faiss_index, (faiss.IndexIDMap, faiss.IndexIDMap2)) or _ivf(faiss_index) is not None